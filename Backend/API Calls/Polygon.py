@@ -178,4 +178,31 @@ def get_market_status() -> Dict[str, Any]:
         raise PolygonException(f"API request failed with status {response.status_code}: {response.text}")
     
     data = response.json()
-    return data
\ No newline at end of file
+    return data
+
+
+def get_all_tickers(market: str = "stocks", active: bool = True, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Every reference ticker for a market, following Polygon's next_url pagination"""
+    url = f"{REFERENCE_URL}/tickers"
+    params = {"market": market, "active": str(active).lower(), "limit": limit, "apiKey": POLYGON_API_KEY}
+    tickers = []
+    
+    while url:
+        logger.info(f"Getting {market} tickers ({len(tickers)} so far)")
+        response = requests.get(url, params=params)
+        
+        if response.status_code == 429:
+            # Free tier allows 5 requests per minute
+            time.sleep(12)
+            continue
+        if response.status_code != 200:
+            logger.error(f"Error fetching tickers: {response.text}")
+            raise PolygonException(f"API request failed with status {response.status_code}: {response.text}")
+        
+        data = response.json()
+        tickers.extend(data.get("results", []))
+        # next_url already carries the cursor and filters, only the key is missing
+        url = data.get("next_url")
+        params = {"apiKey": POLYGON_API_KEY}
+    
+    return tickers
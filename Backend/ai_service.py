@@ -1,9 +1,7 @@
 import os
-import json
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Tuple
-import google.generativeai as genai
 from dotenv import load_dotenv
 import requests
 from textblob import TextBlob
@@ -12,19 +10,42 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import StandardScaler
 import pickle
+from llm_scheduler import PRIORITY_INTERACTIVE
+from gemini_models import model_registry
+from llm_json import parse_llm_json, REQUIRED
+from llm_metrics import llm_metrics
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+SENTIMENT_SCHEMA = {
+    "sentiment": (str, REQUIRED),
+    "confidence": (float, 0.5),
+    "magnitude": (float, 0.0),
+    "key_topics": (list, []),
+    "emotion": (str, "neutral"),
+    "summary": (str, ""),
+}
+
+SUMMARY_SCHEMA = {
+    "market_overview": (str, REQUIRED),
+    "sentiment_analysis": (str, ""),
+    "technical_analysis": (str, ""),
+    "risk_assessment": (str, ""),
+    "recommendation": (str, "hold"),
+    "confidence_level": (str, "medium"),
+    "key_factors": (list, []),
+}
+
 class AIService:
     def __init__(self):
         # Initialize Gemini AI
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
         if self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
-            self.gemini_model = genai.GenerativeModel("gemini-1.5-flash")
+            # Shared registry: one model per process, with fallback on failures
+            self.gemini_model = model_registry
         else:
             logger.warning("GEMINI_API_KEY not found, AI features will be limited")
             self.gemini_model = None
@@ -90,8 +111,9 @@ class AIService:
             Focus on financial context and market implications.
             """
             
-            response = self.gemini_model.generate_content(prompt)
-            result = json.loads(response.text)
+            response = self.gemini_model.generate(prompt, priority=PRIORITY_INTERACTIVE,
+                                                  stage="ai_service.sentiment")
+            result = parse_llm_json(response.text, SENTIMENT_SCHEMA)
             
             return {
                 "score": self._sentiment_to_score(result["sentiment"]),
@@ -105,6 +127,7 @@ class AIService:
             
         except Exception as e:
             logger.error(f"Gemini sentiment analysis failed: {e}")
+            llm_metrics.record_fallback("ai_service.sentiment", type(e).__name__)
             return self.analyze_sentiment_basic(text)
     
     def analyze_sentiment_basic(self, text: str) -> Dict[str, Any]:
@@ -337,8 +360,9 @@ class AIService:
             }}
             """
             
-            response = self.gemini_model.generate_content(prompt)
-            result = json.loads(response.text)
+            response = self.gemini_model.generate(prompt, priority=PRIORITY_INTERACTIVE,
+                                                  stage="ai_service.summary")
+            result = parse_llm_json(response.text, SUMMARY_SCHEMA)
             
             return {
                 "symbol": symbol,
@@ -348,6 +372,7 @@ class AIService:
             
         except Exception as e:
             logger.error(f"AI summary generation failed: {e}")
+            llm_metrics.record_fallback("ai_service.summary", type(e).__name__)
             return self._generate_basic_summary(symbol, stock_data, sentiment_data, prediction_data)
     
     def _generate_basic_summary(self, symbol: str, stock_data: Dict, 
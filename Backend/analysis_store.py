@@ -0,0 +1,240 @@
+import os
+import json
+import hashlib
+import argparse
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pytz
+from dotenv import load_dotenv
+from pymongo import UpdateMany
+
+from message_writer import BufferedMessageWriter
+from mongo import get_db
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+ANALYSES_COLLECTION = "analyses"
+
+# analysis_status values, denormalized onto each message for cheap filtering
+STATUS_PROPER = "proper"      # Gemini answered with a usable analysis
+STATUS_PARTIAL = "partial"    # Gemini answered but without a confidence score
+STATUS_FALLBACK = "fallback"  # Gemini failed, fallback dict stored
+STATUS_SKIPPED = "skipped"    # Pre-filter decided the group wasn't worth a call
+
+
+def analysis_status(analysis: Dict[str, Any]) -> str:
+    if analysis.get("analysis_skipped"):
+        return STATUS_SKIPPED
+    if "has_trade_info" not in analysis:
+        return STATUS_FALLBACK
+    if "sentiment" in analysis and (analysis.get("confidence") or 0) > 0:
+        return STATUS_PROPER
+    return STATUS_PARTIAL
+
+
+def make_analysis_id(message_ids: Iterable[str]) -> str:
+    """Deterministic id for a group, so re-analyzing the same messages updates one document"""
+    return hashlib.sha1("|".join(sorted(str(m) for m in message_ids)).encode()).hexdigest()[:24]
+
+
+def build_analysis_doc(group: List[Dict[str, Any]], analysis: Dict[str, Any],
+                       author: Optional[str] = None) -> Dict[str, Any]:
+    message_ids = [str(m["id"]) for m in group]
+    return {
+        "_id": make_analysis_id(message_ids),
+        "analysis": analysis,
+        "status": analysis_status(analysis),
+        "author_username": author,
+        "channel_id": group[0].get("channel_id") if group else None,
+        "message_ids": message_ids,
+        "message_count": len(message_ids),
+        "created_at": datetime.now(pytz.utc),
+    }
+
+
+def lookup_stages(as_field: str = "ai_analysis") -> List[Dict[str, Any]]:
+    """Aggregation stages that join each message to its analysis as `as_field`"""
+    return [
+        {"$lookup": {"from": ANALYSES_COLLECTION, "localField": "analysis_id",
+                     "foreignField": "_id", "as": "_analysis"}},
+        {"$addFields": {as_field: {"$ifNull": [{"$arrayElemAt": ["$_analysis.analysis", 0]}, {}]}}},
+        {"$project": {"_analysis": 0}},
+    ]
+
+
+class AnalysisStore:
+    """
+    Group analyses stored once in `analyses` and referenced by id from messages.
+
+    Every message of a group used to carry its own copy of the ai_analysis
+    dict. Messages now keep `analysis_id` plus the few scalar fields queries
+    filter on (sentiment, confidence_score, analysis_status...), and the full
+    analysis is joined back with lookup_stages() ($lookup) or attach()
+    (one batched $in query per chunk of messages).
+
+    Writes are buffered like messages; message_writer() returns a writer that
+    flushes pending analyses first so a stored message never points at a
+    missing analysis.
+    """
+
+    def __init__(self, db, buffered: bool = True):
+        self.collection = db[ANALYSES_COLLECTION]
+        self.writer = BufferedMessageWriter(self.collection, key_field="_id",
+                                            batch_size=100 if buffered else 1,
+                                            flush_interval=0)
+
+    def ensure_indexes(self):
+        self.collection.create_index("status")
+        self.collection.create_index("created_at")
+
+    def message_writer(self, collection, **kwargs) -> BufferedMessageWriter:
+        return BufferedMessageWriter(collection, before_flush=self.flush, **kwargs)
+
+    def add(self, group: List[Dict[str, Any]], analysis: Dict[str, Any], author: Optional[str] = None) -> str:
+        """Queue a group's analysis; returns the id its messages should reference"""
+        doc = build_analysis_doc(group, analysis, author)
+        self.writer.add(doc)
+        return doc["_id"]
+
+    def flush(self):
+        self.writer.flush()
+
+    def get_many(self, analysis_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        ids = list({i for i in analysis_ids if i})
+        if not ids:
+            return {}
+        return {doc["_id"]: doc["analysis"]
+                for doc in self.collection.find({"_id": {"$in": ids}}, {"analysis": 1})}
+
+    def attach(self, messages: Iterable[Dict[str, Any]], batch_size: int = 500,
+               as_field: str = "ai_analysis") -> Iterator[Dict[str, Any]]:
+        """Yield messages with their analysis filled in, one analyses query per batch"""
+        batch: List[Dict[str, Any]] = []
+        for msg in messages:
+            batch.append(msg)
+            if len(batch) >= batch_size:
+                yield from self._attach_batch(batch, as_field)
+                batch = []
+        if batch:
+            yield from self._attach_batch(batch, as_field)
+
+    def _attach_batch(self, batch: List[Dict[str, Any]], as_field: str) -> List[Dict[str, Any]]:
+        analyses = self.get_many(msg.get("analysis_id") for msg in batch)
+        for msg in batch:
+            if as_field not in msg:
+                msg[as_field] = analyses.get(msg.get("analysis_id"), {})
+        return batch
+
+
+def ensure_message_analysis_indexes(stock_messages):
+    """Indexes on stock_messages for the analysis reference and status filters"""
+    stock_messages.create_index("analysis_id")
+    # Lets the coverage report count by status from the index alone
+    stock_messages.create_index([("analysis_status", 1), ("created_at", 1)])
+    # Partial indexes stay small: they only hold the messages each query is about
+    stock_messages.create_index(
+        [("updated_at", 1)], name="proper_by_updated_at",
+        partialFilterExpression={"analysis_status": STATUS_PROPER},
+    )  # incremental analyzed_messages sync
+    stock_messages.create_index(
+        [("created_at", -1)], name="fallback_by_created_at",
+        partialFilterExpression={"analysis_status": STATUS_FALLBACK},
+    )  # newest fallbacks, e.g. to re-analyze them
+
+
+def _collection_size(db, name: str) -> int:
+    try:
+        return db.command("collStats", name).get("size", 0)
+    except Exception:
+        return 0
+
+
+MIGRATION_INDEX_NAME = "migrate_ai_analysis_by_author"
+
+
+def migrate_embedded_analyses(db, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Move embedded ai_analysis dicts from stock_messages into `analyses`.
+
+    Messages are read ordered by (author, timestamp), so a group's messages,
+    which share the same author and an identical analysis, are adjacent.
+    Each run of identical analyses becomes one analyses document, and its
+    messages get analysis_id/analysis_status with ai_analysis unset. Only
+    messages that still embed an analysis are touched, so the migration can
+    be re-run after an interruption.
+    """
+    stock_messages = db["stock_messages"]
+    store = AnalysisStore(db)
+    store.ensure_indexes()
+    ensure_message_analysis_indexes(stock_messages)
+
+    # Serves the sort below; partial, so it only holds messages still to migrate
+    stock_messages.create_index([("author_username", 1), ("timestamp", 1)], name=MIGRATION_INDEX_NAME,
+                                partialFilterExpression={"ai_analysis": {"$exists": True}})
+
+    size_before = _collection_size(db, "stock_messages")
+    cursor = stock_messages.find(
+        {"ai_analysis": {"$exists": True}, "analysis_id": {"$exists": False}},
+        {"discord_id": 1, "author_username": 1, "channel_id": 1, "ai_analysis": 1},
+    ).sort([("author_username", 1), ("timestamp", 1)]).hint(MIGRATION_INDEX_NAME).batch_size(batch_size)
+
+    totals = {"messages": 0, "analyses": 0}
+    # Stamped on migrated messages so the incremental analyzed_messages sync picks them up
+    now = datetime.now(pytz.utc)
+    ops: List[UpdateMany] = []
+    run: List[Dict[str, Any]] = []
+    run_key = None
+
+    def finish_run():
+        if not run:
+            return
+        analysis = run[0]["ai_analysis"] or {}
+        group = [{"id": m["discord_id"], "channel_id": m.get("channel_id")} for m in run]
+        analysis_id = store.add(group, analysis, run[0].get("author_username"))
+        ops.append(UpdateMany(
+            {"_id": {"$in": [m["_id"] for m in run]}},
+            {"$set": {"analysis_id": analysis_id, "analysis_status": analysis_status(analysis), "updated_at": now},
+             "$unset": {"ai_analysis": ""}},
+        ))
+        totals["analyses"] += 1
+        totals["messages"] += len(run)
+
+    for msg in cursor:
+        key = (msg.get("author_username"), json.dumps(msg.get("ai_analysis"), sort_keys=True, default=str))
+        if key != run_key:
+            finish_run()
+            run = []
+            run_key = key
+        run.append(msg)
+        if len(ops) >= batch_size:
+            store.flush()
+            stock_messages.bulk_write(ops, ordered=False)
+            ops = []
+    finish_run()
+    store.flush()
+    if ops:
+        stock_messages.bulk_write(ops, ordered=False)
+    # Nothing embeds an analysis any more, so the index is empty
+    stock_messages.drop_index(MIGRATION_INDEX_NAME)
+
+    totals["bytes_before"] = size_before
+    totals["bytes_after"] = _collection_size(db, "stock_messages") + _collection_size(db, ANALYSES_COLLECTION)
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded ai_analysis into the analyses collection")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    MONGO_URI = os.getenv("MONGO_URI")
+    if not MONGO_URI:
+        print("❌ MONGO_URI not found in .env")
+        exit(1)
+    totals = migrate_embedded_analyses(get_db(), batch_size=args.batch_size)
+    print(f"✅ Migrated {totals['messages']} messages into {totals['analyses']} analyses")
+    if totals["bytes_before"]:
+        print(f"💾 stock_messages {totals['bytes_before'] / 1e6:.1f}MB -> "
+              f"{totals['bytes_after'] / 1e6:.1f}MB including analyses")
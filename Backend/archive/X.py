@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import requests
 from typing import List, Dict, Any
@@ -7,6 +8,10 @@ from dotenv import load_dotenv
 import google.generativeai as genai
 from serpapi import GoogleSearch
 
+# Shared helpers live in Backend/
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from llm_json import salvage_array
+
 # Load environment variables
 load_dotenv(dotenv_path="env/.env")
 
@@ -62,14 +67,11 @@ def fetch_tweets_for_ticker(ticker: str, count: int = 5) -> List[Dict[str, Any]]
         return search_with_serpapi(ticker, count)
     
     # Extract and format the tweet data
+    users = {u["id"]: u for u in raw_tweets.get("includes", {}).get("users", [])}
     tweets_data = []
     for tweet in raw_tweets.get("data", []):
         # Get user info from includes
-        user = next(
-            (u for u in raw_tweets.get("includes", {}).get("users", []) 
-             if u["id"] == tweet["author_id"]), 
-            {"username": "unknown", "name": "Unknown User", "verified": False}
-        )
+        user = users.get(tweet["author_id"], {"username": "unknown", "name": "Unknown User", "verified": False})
         
         tweets_data.append({
             "id": f"twitter-{tweet['id']}",
@@ -162,14 +164,20 @@ def analyze_tweets_with_gemini(tweets: List[Dict[str, Any]]) -> List[Dict[str, A
     
     try:
         response = model.generate_content(prompt)
-        analysis = json.loads(response.text)
+        # Keep whatever complete items came back rather than dropping the batch
+        analysis = {
+            item.get("tweet_number", i + 1): item
+            for i, item in enumerate(salvage_array(response.text))
+            if isinstance(item, dict)
+        }
         
         # Merge analysis with tweet data
         for i, tweet in enumerate(tweets):
-            if i < len(analysis):
-                tweet["sentiment"] = analysis[i]["sentiment"]
-                tweet["relevance"] = analysis[i]["relevance"]
-                tweet["key_points"] = analysis[i]["key_points"]
+            item = analysis.get(i + 1)
+            if item:
+                tweet["sentiment"] = item.get("sentiment", "neutral")
+                tweet["relevance"] = item.get("relevance", "medium")
+                tweet["key_points"] = item.get("key_points", [])
             else:
                 tweet["sentiment"] = "neutral"
                 tweet["relevance"] = "medium"
@@ -1,13 +1,75 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
-import certifi
-from datetime import datetime, timedelta
-import pytz
+from datetime import timedelta
+from analysis_store import AnalysisStore, STATUS_PROPER, STATUS_FALLBACK
+from mongo import get_db
+from timeutils import now_utc
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
+def coverage_pipeline(since):
+    """Status counts for all messages and for those created since `since`, in one $facet"""
+    status = {"$ifNull": ["$analysis_status", "unmigrated"]}
+    return [
+        {"$sort": {"analysis_status": 1}},
+        {"$project": {"_id": 0, "analysis_status": 1, "created_at": 1}},
+        {"$facet": {
+            "all": [{"$group": {"_id": status, "count": {"$sum": 1}}}],
+            "recent": [
+                {"$match": {"created_at": {"$gte": since}}},
+                {"$group": {"_id": status, "count": {"$sum": 1}}},
+            ],
+        }},
+    ]
+
+def coverage_report(db, recent_days=1):
+    """
+    AI analysis coverage of stock_messages in a single aggregation.
+    
+    The status counts for all messages and for the recent window come out of
+    one $facet pass. Sorting on analysis_status and projecting only the
+    indexed fields lets the server answer it from the
+    (analysis_status, created_at) index without loading any document.
+    Examples are single seeks on the partial per-status indexes.
+    """
+    stock_messages = db['stock_messages']
+    since = now_utc() - timedelta(days=recent_days)
+    
+    facets = next(stock_messages.aggregate(coverage_pipeline(since), allowDiskUse=True), {"all": [], "recent": []})
+    by_status = {row["_id"]: row["count"] for row in facets["all"]}
+    recent = {row["_id"]: row["count"] for row in facets["recent"]}
+    
+    total = sum(by_status.values())
+    proper = by_status.get(STATUS_PROPER, 0)
+    fallback = by_status.get(STATUS_FALLBACK, 0)
+    
+    analyses = AnalysisStore(db)
+    examples = {}
+    for name, sort_field in ((STATUS_PROPER, "updated_at"), (STATUS_FALLBACK, "created_at")):
+        example = stock_messages.find_one({"analysis_status": name}, {"content": 1, "analysis_id": 1},
+                                          sort=[(sort_field, -1)])
+        if example:
+            example = next(analyses.attach([example]))
+            examples[name] = {"content": example.get("content", ""), "analysis": example["ai_analysis"]}
+    
+    return {
+        "total": total,
+        "proper": proper,
+        # No confidence score, skipped by the pre-filter or not migrated yet
+        "partial": total - proper - fallback,
+        "fallback": fallback,
+        "by_status": by_status,
+        "recent": {
+            "days": recent_days,
+            "total": sum(recent.values()),
+            "proper": recent.get(STATUS_PROPER, 0),
+            "fallback": recent.get(STATUS_FALLBACK, 0),
+        },
+        "examples": examples,
+        "generated_at": now_utc().isoformat(),
+    }
+
 def check_ai_analysis_coverage():
     """Check how many messages have AI analysis vs fallback data"""
     
@@ -18,92 +80,46 @@ def check_ai_analysis_coverage():
         return
     
     try:
-        client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-        db = client['discord_scraper']
-        stock_messages = db['stock_messages']
+        db = get_db()
         
         print("🔍 Analyzing AI Analysis Coverage in MongoDB")
         print("=" * 50)
         
-        # Total messages
-        total_messages = stock_messages.count_documents({})
+        report = coverage_report(db)
+        total_messages = report["total"]
+        proper_analysis = report["proper"]
+        partial_analysis = report["partial"]
+        fallback_data = report["fallback"]
         print(f"📊 Total messages in collection: {total_messages}")
-        
-        # Messages with proper AI analysis
-        proper_analysis = stock_messages.count_documents({
-            "ai_analysis.has_trade_info": {"$exists": True}
-        })
-        
-        # Messages with fallback data (no AI analysis)
-        fallback_data = stock_messages.count_documents({
-            "ai_analysis.play": None,
-            "ai_analysis.tickers": [],
-            "ai_analysis.action": None,
-            "ai_analysis.price": None,
-            "ai_analysis.confidence": 0.0
-        })
-        
-        # Messages with partial analysis
-        partial_analysis = total_messages - proper_analysis - fallback_data
+        if total_messages == 0:
+            return
         
         print(f"\n📈 Analysis Breakdown:")
         print(f"  ✅ Proper AI Analysis: {proper_analysis} ({proper_analysis/total_messages*100:.1f}%)")
         print(f"  ⚠️  Partial Analysis: {partial_analysis} ({partial_analysis/total_messages*100:.1f}%)")
         print(f"  ❌ Fallback Data: {fallback_data} ({fallback_data/total_messages*100:.1f}%)")
         
-        # Recent messages analysis
-        est_tz = pytz.timezone('America/New_York')
-        one_day_ago = datetime.now(est_tz) - timedelta(days=1)
-        
-        recent_total = stock_messages.count_documents({
-            "created_at": {"$gte": one_day_ago}
-        })
-        
-        recent_proper = stock_messages.count_documents({
-            "created_at": {"$gte": one_day_ago},
-            "ai_analysis.has_trade_info": {"$exists": True}
-        })
-        
-        recent_fallback = stock_messages.count_documents({
-            "created_at": {"$gte": one_day_ago},
-            "ai_analysis.play": None,
-            "ai_analysis.tickers": [],
-            "ai_analysis.action": None,
-            "ai_analysis.price": None,
-            "ai_analysis.confidence": 0.0
-        })
-        
         print(f"\n📅 Last 24 Hours:")
-        print(f"  Total: {recent_total}")
-        print(f"  Proper Analysis: {recent_proper}")
-        print(f"  Fallback Data: {recent_fallback}")
+        print(f"  Total: {report['recent']['total']}")
+        print(f"  Proper Analysis: {report['recent']['proper']}")
+        print(f"  Fallback Data: {report['recent']['fallback']}")
         
         # Show examples of each type
         print(f"\n🔍 Examples:")
         
-        # Example of proper analysis
-        proper_example = stock_messages.find_one({
-            "ai_analysis.has_trade_info": {"$exists": True}
-        })
+        proper_example = report["examples"].get(STATUS_PROPER)
         if proper_example:
             print(f"\n✅ Proper AI Analysis Example:")
             print(f"  Content: {proper_example['content'][:100]}...")
-            print(f"  Sentiment: {proper_example['ai_analysis'].get('sentiment', 'N/A')}")
-            print(f"  Confidence: {proper_example['ai_analysis'].get('confidence', 'N/A')}")
-            print(f"  Tickers: {proper_example['ai_analysis'].get('tickers', [])}")
+            print(f"  Sentiment: {proper_example['analysis'].get('sentiment', 'N/A')}")
+            print(f"  Confidence: {proper_example['analysis'].get('confidence', 'N/A')}")
+            print(f"  Tickers: {proper_example['analysis'].get('tickers', [])}")
         
-        # Example of fallback data
-        fallback_example = stock_messages.find_one({
-            "ai_analysis.play": None,
-            "ai_analysis.tickers": [],
-            "ai_analysis.action": None,
-            "ai_analysis.price": None,
-            "ai_analysis.confidence": 0.0
-        })
+        fallback_example = report["examples"].get(STATUS_FALLBACK)
         if fallback_example:
             print(f"\n❌ Fallback Data Example:")
             print(f"  Content: {fallback_example['content'][:100]}...")
-            print(f"  Analysis: {fallback_example['ai_analysis']}")
+            print(f"  Analysis: {fallback_example['analysis']}")
         
         # Recommendations
         print(f"\n💡 Recommendations:")
@@ -116,7 +132,7 @@ def check_ai_analysis_coverage():
         if proper_analysis > 0:
             print(f"  • {proper_analysis} messages have proper AI analysis")
             print(f"  • These are ready for sentiment analysis and trading insights")
-        
+    
     except Exception as e:
         print(f"❌ Error: {e}")
 
@@ -1,15 +1,117 @@
 import os
+import time
+import argparse
 from dotenv import load_dotenv
-from pymongo import MongoClient
-import certifi
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
+from analysis_store import lookup_stages, STATUS_PROPER
+from mongo import get_db
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-def create_analyzed_collection():
-    """Create a new collection with only messages that have full AI analysis"""
+ANALYZED_COLLECTION = "analyzed_messages"
+SYNC_STATE_COLLECTION = "sync_state"
+
+# Re-read this much before the watermark: writes stamped just before a sync
+# started may only become visible after it has read past them
+SYNC_OVERLAP_SECONDS = float(os.getenv("ANALYZED_SYNC_OVERLAP_SECONDS", "60"))
+
+# Messages with full AI analysis (has_trade_info, sentiment and confidence > 0),
+# flagged on each message when its group's analysis was stored
+proper_analysis_query = {"analysis_status": STATUS_PROPER}
+
+ANALYZED_INDEXES = [
+    "tickers_mentioned",
+    "ai_analysis.sentiment",
+    "ai_analysis.confidence",
+    "timestamp",
+    "author_username",
+]
+
+
+def _create_indexes(collection):
+    for field in ANALYZED_INDEXES:
+        collection.create_index(field)
+
+
+def rebuild_analyzed_messages(db):
+    """
+    Full rebuild without downtime.
+
+    The server writes the result into a temporary collection with $out,
+    indexes are built there, and renameCollection(dropTarget=True) swaps it
+    in atomically, so readers see the old collection until the new one is
+    complete. Nothing passes through Python.
+    """
+    temp_name = f"{ANALYZED_COLLECTION}_rebuild"
+    db[temp_name].drop()
+    db['stock_messages'].aggregate(
+        [{"$match": proper_analysis_query}] + lookup_stages() + [{"$out": temp_name}],
+        allowDiskUse=True,
+    )
+    _create_indexes(db[temp_name])
+    db[temp_name].rename(ANALYZED_COLLECTION, dropTarget=True)
+
+
+def sync_analyzed_messages(db, full=False):
+    """
+    Bring analyzed_messages up to date with stock_messages.
+
+    Incremental runs only touch messages whose updated_at is newer than the
+    stored watermark. A server-side $merge keyed on _id upserts the ones
+    that now have proper analysis, and ones whose analysis stopped being
+    proper are deleted. The first run (or full=True) does a full rebuild instead.
+    Returns {"mode", "merged", "removed", "seconds"}.
+    """
+    stock_messages = db['stock_messages']
+    state = db[SYNC_STATE_COLLECTION]
+    stock_messages.create_index("updated_at")
+
+    started = time.perf_counter()
+    # Only advance to what was certainly visible when the sync began
+    new_watermark = datetime.now(pytz.utc) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+    watermark = (state.find_one({"_id": ANALYZED_COLLECTION}) or {}).get("watermark")
+
+    if full or watermark is None or ANALYZED_COLLECTION not in db.list_collection_names():
+        rebuild_analyzed_messages(db)
+        result = {"mode": "full", "merged": db[ANALYZED_COLLECTION].estimated_document_count(), "removed": 0}
+    else:
+        changed = {"updated_at": {"$gt": watermark}}
+        merged = stock_messages.count_documents({**changed, **proper_analysis_query})
+        if merged:
+            stock_messages.aggregate(
+                [{"$match": {**changed, **proper_analysis_query}}] + lookup_stages() + [
+                    {"$merge": {"into": ANALYZED_COLLECTION, "on": "_id",
+                                "whenMatched": "replace", "whenNotMatched": "insert"}},
+                ],
+                allowDiskUse=True,
+            )
+
+        # Re-analyzed messages that no longer qualify
+        removed = 0
+        stale_ids = []
+        for doc in stock_messages.find({**changed, "analysis_status": {"$ne": STATUS_PROPER}}, {"_id": 1}):
+            stale_ids.append(doc["_id"])
+            if len(stale_ids) >= 1000:
+                removed += db[ANALYZED_COLLECTION].delete_many({"_id": {"$in": stale_ids}}).deleted_count
+                stale_ids = []
+        if stale_ids:
+            removed += db[ANALYZED_COLLECTION].delete_many({"_id": {"$in": stale_ids}}).deleted_count
+        _create_indexes(db[ANALYZED_COLLECTION])
+        result = {"mode": "incremental", "merged": merged, "removed": removed}
+
+    state.update_one(
+        {"_id": ANALYZED_COLLECTION},
+        {"$set": {"watermark": new_watermark, "last_mode": result["mode"], "synced_at": datetime.now(pytz.utc)}},
+        upsert=True,
+    )
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+def create_analyzed_collection(full=False):
+    """Sync the collection of messages that have full AI analysis and print a summary"""
     
     # Connect to MongoDB
     MONGO_URI = os.getenv("MONGO_URI")
@@ -18,51 +120,19 @@ def create_analyzed_collection():
         return
     
     try:
-        client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-        db = client['discord_scraper']
-        
-        # Source collection (all messages)
-        stock_messages = db['stock_messages']
+        db = get_db()
         
-        # New collection (only fully analyzed messages)
-        analyzed_messages = db['analyzed_messages']
-        
-        print("🔍 Creating Analyzed Messages Collection")
+        print("🔍 Syncing Analyzed Messages Collection")
         print("=" * 50)
         
-        # Find messages with proper AI analysis
-        proper_analysis_query = {
-            "ai_analysis.has_trade_info": {"$exists": True},
-            "ai_analysis.sentiment": {"$exists": True},
-            "ai_analysis.confidence": {"$exists": True, "$gt": 0}
-        }
-        
-        # Count messages that will be copied
-        total_analyzed = stock_messages.count_documents(proper_analysis_query)
-        print(f"📊 Found {total_analyzed} messages with full AI analysis")
-        
-        if total_analyzed == 0:
-            print("❌ No messages with full AI analysis found")
-            return
+        result = sync_analyzed_messages(db, full=full)
+        if result["mode"] == "full":
+            print(f"🔄 Rebuilt analyzed_messages ({result['merged']} messages) and swapped it in")
+        else:
+            print(f"⚡ Incremental sync: {result['merged']} messages merged, {result['removed']} removed")
+        print(f"   Took {result['seconds']}s")
         
-        # Clear existing analyzed collection (optional)
-        analyzed_messages.drop()
-        print("🗑️  Cleared existing analyzed_messages collection")
-        
-        # Copy messages with full analysis to new collection
-        analyzed_docs = list(stock_messages.find(proper_analysis_query))
-        
-        # Insert into new collection
-        result = analyzed_messages.insert_many(analyzed_docs)
-        print(f"✅ Copied {len(result.inserted_ids)} messages to analyzed_messages collection")
-        
-        # Create indexes for better performance
-        analyzed_messages.create_index("tickers_mentioned")
-        analyzed_messages.create_index("ai_analysis.sentiment")
-        analyzed_messages.create_index("ai_analysis.confidence")
-        analyzed_messages.create_index("timestamp")
-        analyzed_messages.create_index("author_username")
-        print("📈 Created performance indexes")
+        analyzed_messages = db[ANALYZED_COLLECTION]
         
         # Show summary of the new collection
         print(f"\n📋 Analyzed Messages Collection Summary:")
@@ -121,7 +191,7 @@ def create_analyzed_collection():
         print(f"  • Clean, structured data")
         
         return True
-        
+    
     except Exception as e:
         print(f"❌ Error: {e}")
         return False
@@ -134,8 +204,7 @@ def show_collection_comparison():
         return
     
     try:
-        client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-        db = client['discord_scraper']
+        db = get_db()
         
         stock_messages = db['stock_messages']
         analyzed_messages = db['analyzed_messages']
@@ -144,11 +213,14 @@ def show_collection_comparison():
         print(f"  stock_messages: {stock_messages.count_documents({})} total messages")
         print(f"  analyzed_messages: {analyzed_messages.count_documents({})} clean messages")
         print(f"  Quality: {analyzed_messages.count_documents({})/stock_messages.count_documents({})*100:.1f}% of messages are fully analyzed")
-        
+    
     except Exception as e:
         print(f"Error in comparison: {e}")
 
 if __name__ == "__main__":
-    success = create_analyzed_collection()
+    parser = argparse.ArgumentParser(description="Keep analyzed_messages in sync with stock_messages")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch and swap in atomically")
+    args = parser.parse_args()
+    success = create_analyzed_collection(full=args.full)
     if success:
         show_collection_comparison()
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import pytz
+
+
+class ChannelCheckpoints:
+    """
+    Per-channel ingestion progress stored in MongoDB (`ingest_checkpoints`).
+
+    Message ids are Discord snowflakes, which increase with time, so they are
+    stored as integers and moved with $max/$min: a checkpoint can only move
+    forward, even if two runs overlap. Callers must only advance a checkpoint
+    after the messages up to that id have been flushed to the database, so a
+    crashed run resumes from the last durable page.
+
+    Fields per channel:
+      newest_id          newest message stored (incremental runs start after it)
+      oldest_id          oldest message reached by the backfill (resume before it)
+      backfill_complete  True once the backfill reached the start of the channel
+    """
+
+    def __init__(self, db, collection_name: str = "ingest_checkpoints"):
+        self.collection = db[collection_name]
+
+    def get(self, channel_id: str) -> Dict[str, Any]:
+        return self.collection.find_one({"_id": str(channel_id)}) or {"_id": str(channel_id)}
+
+    def record_page(self, channel_id: str, oldest_id: str, newest_id: str):
+        """Extend the stored range to cover a page of messages that has been flushed"""
+        self.collection.update_one(
+            {"_id": str(channel_id)},
+            {
+                "$min": {"oldest_id": int(oldest_id)},
+                "$max": {"newest_id": int(newest_id)},
+                "$set": {"updated_at": datetime.now(pytz.utc)},
+            },
+            upsert=True,
+        )
+
+    def mark_backfill_complete(self, channel_id: str):
+        self.collection.update_one(
+            {"_id": str(channel_id)},
+            {"$set": {"backfill_complete": True, "updated_at": datetime.now(pytz.utc)}},
+            upsert=True,
+        )
+
+    def newest_id(self, channel_id: str) -> Optional[str]:
+        value = self.get(channel_id).get("newest_id")
+        return str(value) if value is not None else None
+
+    def oldest_id(self, channel_id: str) -> Optional[str]:
+        value = self.get(channel_id).get("oldest_id")
+        return str(value) if value is not None else None
@@ -0,0 +1,346 @@
+import os
+import json
+import random
+import asyncio
+import argparse
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from discord_scraper import AUTHORIZATION, headers, setup_mongodb
+from discord_checkpoints import ChannelCheckpoints
+from discord_ingest import DISCORD_API, DISCORD_CHANNEL_IDS, IngestPipeline, MultiChannelIngestor
+from analysis_store import AnalysisStore
+from message_writer import fan_out
+from ticker_rollups import TickerRollups
+from heavy_hitters import heavy_hitters
+from timeseries_store import message_metrics_hook
+from group_filter import group_filter
+from gateway_opcodes import (
+    OP_DISPATCH, OP_HEARTBEAT, OP_IDENTIFY, OP_RESUME, OP_RECONNECT, OP_INVALID_SESSION, OP_HELLO,
+    OP_HEARTBEAT_ACK, NEW_SESSION_CLOSE_CODES, FATAL_CLOSE_CODES, RESUMABLE_CLOSE,
+)
+
+# Override to point the client at a local fake gateway (see fake_gateway.py)
+DISCORD_GATEWAY_URL = os.getenv("DISCORD_GATEWAY_URL")
+
+GATEWAY_VERSION = 9
+
+# GUILD_MESSAGES | DIRECT_MESSAGES | MESSAGE_CONTENT
+GATEWAY_INTENTS = (1 << 9) | (1 << 12) | (1 << 15)
+
+class GatewayFatalError(Exception):
+    pass
+
+
+class GatewayClient:
+    """
+    Long-lived Discord gateway connection that delivers events to a handler.
+
+    Keeps the heartbeat going, treats a missing heartbeat ACK as a dead
+    connection, and reconnects with exponential backoff. Reconnects RESUME
+    the previous session so Discord replays missed events; when resuming
+    isn't possible a new session is identified and the handler gets a fresh
+    READY (which the streaming ingestor uses to catch up over REST).
+    """
+
+    def __init__(self, token: str, handler: Callable[[str, Dict[str, Any]], Awaitable[None]],
+                 gateway_url: Optional[str] = DISCORD_GATEWAY_URL, intents: int = GATEWAY_INTENTS,
+                 max_backoff: float = 60.0):
+        self.token = token
+        self.handler = handler
+        self.gateway_url = gateway_url
+        self.intents = intents
+        self.max_backoff = max_backoff
+
+        self.session_id: Optional[str] = None
+        self.resume_url: Optional[str] = None
+        self.seq: Optional[int] = None
+        self._acked = True
+        self._reconnect_delay = 0.0
+        self._stopped = asyncio.Event()
+
+        self.connects = 0
+        self.resumes = 0
+        self.events = 0
+
+    def stop(self):
+        self._stopped.set()
+
+    async def run(self):
+        """Stay connected until stop() is called or a fatal close code is received"""
+        backoff = 1.0
+        async with aiohttp.ClientSession() as session:
+            while not self._stopped.is_set():
+                try:
+                    url = self.resume_url if self.session_id and self.resume_url else await self._gateway_url(session)
+                    await self._connect_once(session, url)
+                    backoff = 1.0
+                except GatewayFatalError:
+                    raise
+                except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, ValueError) as e:
+                    print(f"⚠️  Gateway connection failed: {e}")
+                if self._stopped.is_set():
+                    break
+                delay = max(min(backoff, self.max_backoff) * (0.5 + random.random() / 2), self._reconnect_delay)
+                self._reconnect_delay = 0.0
+                print(f"🔌 Gateway disconnected, reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def _gateway_url(self, session: aiohttp.ClientSession) -> str:
+        if self.gateway_url:
+            return self.gateway_url
+        async with session.get(f"{DISCORD_API}/gateway") as resp:
+            resp.raise_for_status()
+            return (await resp.json())["url"]
+
+    async def _connect_once(self, session: aiohttp.ClientSession, url: str):
+        self.connects += 1
+        async with session.ws_connect(f"{url}?v={GATEWAY_VERSION}&encoding=json", heartbeat=None) as ws:
+            hello = await ws.receive_json(timeout=30)
+            if hello.get("op") != OP_HELLO:
+                raise ValueError(f"Expected HELLO from gateway, got op {hello.get('op')}")
+            heartbeat = asyncio.create_task(self._heartbeat(ws, hello["d"]["heartbeat_interval"] / 1000))
+            try:
+                if self.session_id and self.seq is not None:
+                    self.resumes += 1
+                    await ws.send_json({"op": OP_RESUME, "d": {
+                        "token": self.token, "session_id": self.session_id, "seq": self.seq,
+                    }})
+                else:
+                    await ws.send_json({"op": OP_IDENTIFY, "d": {
+                        "token": self.token,
+                        "intents": self.intents,
+                        "properties": {"os": "linux", "browser": "golden-standard", "device": "golden-standard"},
+                    }})
+
+                stop_wait = asyncio.create_task(self._stopped.wait())
+                try:
+                    while True:
+                        receive = asyncio.create_task(ws.receive())
+                        done, _ = await asyncio.wait({receive, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+                        if stop_wait in done:
+                            receive.cancel()
+                            await ws.close(code=RESUMABLE_CLOSE)
+                            return
+                        msg = receive.result()
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        await self._handle(ws, json.loads(msg.data))
+                finally:
+                    stop_wait.cancel()
+            finally:
+                heartbeat.cancel()
+
+        code = ws.close_code
+        if code in FATAL_CLOSE_CODES:
+            raise GatewayFatalError(f"Gateway closed with fatal code {code}")
+        if code in NEW_SESSION_CLOSE_CODES:
+            self._reset_session()
+
+    async def _handle(self, ws, payload: Dict[str, Any]):
+        op = payload.get("op")
+        if op == OP_DISPATCH:
+            self.seq = payload.get("s", self.seq)
+            event_type = payload.get("t")
+            data = payload.get("d") or {}
+            if event_type == "READY":
+                self.session_id = data.get("session_id")
+                self.resume_url = data.get("resume_gateway_url")
+                print(f"✅ Gateway session ready ({self.session_id})")
+            elif event_type == "RESUMED":
+                print(f"♻️  Gateway session resumed at seq {self.seq}")
+            self.events += 1
+            await self.handler(event_type, data)
+        elif op == OP_HEARTBEAT:
+            await ws.send_json({"op": OP_HEARTBEAT, "d": self.seq})
+        elif op == OP_HEARTBEAT_ACK:
+            self._acked = True
+        elif op == OP_RECONNECT:
+            await ws.close(code=RESUMABLE_CLOSE)
+        elif op == OP_INVALID_SESSION:
+            if not payload.get("d"):
+                self._reset_session()
+            # Discord asks for a random 1-5s wait before identifying again
+            self._reconnect_delay = 1 + random.random() * 4
+            await ws.close(code=RESUMABLE_CLOSE)
+
+    async def _heartbeat(self, ws, interval: float):
+        self._acked = True
+        await asyncio.sleep(interval * random.random())
+        while not ws.closed:
+            if not self._acked:
+                # No ACK since the last beat: zombie connection, reconnect and resume
+                print("💀 Missed heartbeat ACK, reconnecting")
+                await ws.close(code=RESUMABLE_CLOSE)
+                return
+            self._acked = False
+            await ws.send_json({"op": OP_HEARTBEAT, "d": self.seq})
+            await asyncio.sleep(interval)
+
+    def _reset_session(self):
+        self.session_id = None
+        self.resume_url = None
+        self.seq = None
+
+
+class StreamingIngestor:
+    """
+    Pushes gateway MESSAGE_CREATE events into the shared IngestPipeline.
+
+    Events are micro-batched per channel (up to `max_batch` messages or
+    `linger` seconds) so author/time grouping still has context. Every new
+    session (READY) first catches up over REST from the last checkpoint,
+    buffering live events meanwhile, so nothing sent while disconnected or
+    between runs is missed. handle_event only queues the event: a separate
+    task feeds the pipeline, so when the pipeline is backed up the gateway
+    connection still reads HEARTBEAT_ACKs instead of looking like a zombie.
+    """
+
+    def __init__(self, pipeline: IngestPipeline, ingestor: Optional[MultiChannelIngestor],
+                 channel_ids: List[str], linger: float = 2.0, max_batch: int = 50):
+        self.pipeline = pipeline
+        self.ingestor = ingestor
+        self.channel_ids = set(channel_ids)
+        self.linger = linger
+        self.max_batch = max_batch
+
+        self._batches: Dict[str, List[Dict[str, Any]]] = {}
+        self._buffered: List[Dict[str, Any]] = []
+        self._catching_up = False
+        self._catch_up_task: Optional[asyncio.Task] = None
+        self._rest_session: Optional[aiohttp.ClientSession] = None
+        self._events: asyncio.Queue = asyncio.Queue()
+        self.received = 0
+
+    async def handle_event(self, event_type: str, data: Dict[str, Any]):
+        """GatewayClient handler; returns at once, events are processed in order by _dispatch"""
+        self._events.put_nowait((event_type, data))
+
+    async def _dispatch(self):
+        while True:
+            item = await self._events.get()
+            if item is None:
+                return
+            try:
+                await self._process(*item)
+            except Exception as e:
+                print(f"❌ Failed to process gateway {item[0]} event: {e}")
+
+    async def _process(self, event_type: str, data: Dict[str, Any]):
+        if event_type == "READY" and self.ingestor is not None:
+            self._catching_up = True
+            # Held so the task isn't garbage collected mid-run and can be awaited on shutdown
+            self._catch_up_task = asyncio.create_task(self._catch_up())
+        elif event_type == "MESSAGE_CREATE" and data.get("channel_id") in self.channel_ids:
+            self.received += 1
+            if self._catching_up:
+                self._buffered.append(data)
+            else:
+                await self._add(data)
+
+    async def _add(self, message: Dict[str, Any]):
+        batch = self._batches.setdefault(message["channel_id"], [])
+        batch.append(message)
+        if len(batch) >= self.max_batch:
+            await self._submit(message["channel_id"])
+
+    async def _submit(self, channel_id: str):
+        batch = self._batches.pop(channel_id, [])
+        if batch:
+            await self.pipeline.submit_page(channel_id, batch)
+            if self.ingestor is not None:
+                # Next catch-up starts after what the stream already delivered
+                newest = max(int(m["id"]) for m in batch)
+                self.ingestor.last_ids[channel_id] = max(self.ingestor.last_ids.get(channel_id, 0), newest)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.linger)
+            for channel_id in list(self._batches):
+                await self._submit(channel_id)
+
+    async def _catch_up(self):
+        try:
+            # Anything still batched from the previous session goes first to keep checkpoint order
+            for channel_id in list(self._batches):
+                await self._submit(channel_id)
+            await asyncio.gather(*(
+                self.ingestor.ingest_channel(self._rest_session, channel_id, "incremental")
+                for channel_id in self.channel_ids
+            ))
+        except Exception as e:
+            print(f"⚠️  REST catch-up failed: {e}")
+        finally:
+            buffered, self._buffered = self._buffered, []
+            self._catching_up = False
+            for message in buffered:
+                # Skip events the catch-up already fetched
+                if int(message["id"]) > self.ingestor.last_ids.get(message["channel_id"], 0):
+                    await self._add(message)
+
+    async def run(self, client: GatewayClient):
+        self.pipeline.start()
+        dispatcher = asyncio.create_task(self._dispatch())
+        flusher = asyncio.create_task(self._flush_periodically())
+        session_headers = {k: v for k, v in headers.items() if v}
+        async with aiohttp.ClientSession(headers=session_headers) as rest_session:
+            self._rest_session = rest_session
+            try:
+                await client.run()
+            finally:
+                flusher.cancel()
+                # Events already received still go into the pipeline
+                self._events.put_nowait(None)
+                await dispatcher
+                if self._catch_up_task is not None:
+                    # Lets it hand over buffered events before the pipeline drains
+                    self._catch_up_task.cancel()
+                    await asyncio.gather(self._catch_up_task, return_exceptions=True)
+                for channel_id in list(self._batches):
+                    await self._submit(channel_id)
+                await self.pipeline.close()
+
+
+async def main(channel_ids: List[str], gateway_url: Optional[str], catch_up: bool):
+    db = setup_mongodb()
+    if db is None:
+        print("❌ Cannot proceed without MongoDB connection")
+        return
+    checkpoints = ChannelCheckpoints(db)
+    analyses = AnalysisStore(db)
+    heavy_hitters.restore(db)
+    rollups = TickerRollups(db, tracker=heavy_hitters)
+    writer = analyses.message_writer(db["stock_messages"],
+                                     after_flush=fan_out(rollups.record, message_metrics_hook(db)))
+    pipeline = IngestPipeline(db, writer, checkpoints, analyses=analyses)
+    ingestor = MultiChannelIngestor(pipeline, checkpoints) if catch_up else None
+    streamer = StreamingIngestor(pipeline, ingestor, channel_ids)
+    client = GatewayClient(AUTHORIZATION, streamer.handle_event, gateway_url=gateway_url)
+
+    print(f"📡 Streaming {len(channel_ids)} channels from the gateway (Ctrl+C to stop)")
+    try:
+        await streamer.run(client)
+    finally:
+        writer.close()
+        heavy_hitters.snapshot()
+        stats = pipeline.stats
+        print(f"\n📊 Received {streamer.received} messages over {client.connects} connections "
+              f"({client.resumes} resumes)")
+        print(f"   ✅ Stored: {stats['stored']}  ⏭️  Skipped: {stats['skipped']}")
+        print(f"   {group_filter.report()}")
+        print(f"   🔥 Most mentioned (last hour): {', '.join(row['item'] for row in heavy_hitters.top('1h', 5)) or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time Discord ingestion over the gateway")
+    parser.add_argument("--channels", nargs="+", default=DISCORD_CHANNEL_IDS)
+    parser.add_argument("--gateway-url", default=DISCORD_GATEWAY_URL,
+                        help="e.g. ws://127.0.0.1:8766 for the local fake gateway")
+    parser.add_argument("--no-catch-up", action="store_true", help="Skip the REST catch-up on new sessions")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.channels, args.gateway_url, not args.no_catch_up))
+    except KeyboardInterrupt:
+        pass
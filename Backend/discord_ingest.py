@@ -0,0 +1,441 @@
+import os
+import time
+import asyncio
+import argparse
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from discord_scraper import (
+    headers,
+    CHANNEL_ID,
+    setup_mongodb,
+    analyze_with_context,
+    build_stock_message_doc,
+)
+from discord_checkpoints import ChannelCheckpoints
+from message_writer import BufferedMessageWriter, fan_out
+from message_grouping import iter_author_groups
+from group_filter import group_filter, skipped_analysis
+from analysis_store import AnalysisStore
+from ticker_rollups import TickerRollups
+from heavy_hitters import heavy_hitters
+from timeseries_store import message_metrics_hook
+from llm_scheduler import GEMINI_MAX_CONCURRENCY
+
+DISCORD_API = "https://discord.com/api/v9"
+
+# Comma separated list of channels to ingest, defaults to the scraper's channel
+DISCORD_CHANNEL_IDS = [c.strip() for c in os.getenv("DISCORD_CHANNEL_IDS", CHANNEL_ID).split(",") if c.strip()]
+
+# Bounded queues between stages so a fast fetcher can't run ahead of Gemini
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "20"))
+
+
+class RouteRateLimiter:
+    """
+    Paces requests per Discord rate-limit bucket from the X-RateLimit-* headers.
+
+    Discord groups routes into buckets (X-RateLimit-Bucket) that are scoped by
+    the major parameter, here the channel id. Each bucket remembers how many
+    requests remain and when it resets. Requests wait for the reset instead of
+    being sent and rejected with a 429. A global 429 pauses every bucket.
+    """
+
+    def __init__(self):
+        self._route_bucket: Dict[str, str] = {}
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._global_until = 0.0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+
+    def _bucket_key(self, route: str, major: str) -> str:
+        bucket = self._route_bucket.get(route)
+        return f"{bucket}:{major}" if bucket else f"{route}:{major}"
+
+    async def acquire(self, route: str, major: str):
+        """Wait until a request on `route` for `major` fits in its bucket, then reserve it"""
+        key = self._bucket_key(route, major)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            while True:
+                now = time.monotonic()
+                state = self._buckets.get(key)
+                delay = self._global_until - now
+                if state and state["remaining"] <= 0:
+                    delay = max(delay, state["reset_at"] - now)
+                if delay <= 0:
+                    break
+                self.waits += 1
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+            if state and state["reset_at"] > time.monotonic():
+                state["remaining"] -= 1
+
+    def update(self, route: str, major: str, response_headers, status: int, body: Any = None) -> float:
+        """Record the limits from a response; returns seconds to wait before retrying a 429"""
+        now = time.monotonic()
+        bucket = response_headers.get("X-RateLimit-Bucket")
+        if bucket:
+            self._route_bucket[route] = bucket
+        key = self._bucket_key(route, major)
+
+        remaining = response_headers.get("X-RateLimit-Remaining")
+        reset_after = response_headers.get("X-RateLimit-Reset-After")
+        if remaining is not None and reset_after is not None:
+            self._buckets[key] = {"remaining": int(remaining), "reset_at": now + float(reset_after)}
+
+        if status != 429:
+            return 0.0
+        self.rate_limited += 1
+        body = body if isinstance(body, dict) else {}
+        retry_after = float(body.get("retry_after") or response_headers.get("Retry-After") or 1.0)
+        if body.get("global") or response_headers.get("X-RateLimit-Global"):
+            self._global_until = max(self._global_until, now + retry_after)
+        else:
+            self._buckets[key] = {"remaining": 0, "reset_at": now + retry_after}
+        return retry_after
+
+
+class _PageTicket:
+    """Tracks one fetched page through the pipeline so its checkpoint can be recorded"""
+
+    __slots__ = ("channel_id", "oldest_id", "newest_id", "pending", "fetched_all")
+
+    def __init__(self, channel_id: str, messages: List[Dict[str, Any]]):
+        ids = [int(m["id"]) for m in messages]
+        self.channel_id = channel_id
+        self.oldest_id = min(ids)
+        self.newest_id = max(ids)
+        self.pending = 0
+        self.fetched_all = False
+
+
+class IngestPipeline:
+    """
+    fetch -> filter -> analyze -> store, each stage a set of asyncio tasks
+    joined by bounded queues.
+
+    Pages enter via submit_page(). The filter stage groups messages by author
+    and time window, analyze workers run Gemini (through the shared
+    scheduler) in threads, and a single store stage feeds the bulk writer.
+    A channel's checkpoint only moves once every earlier page of that channel
+    has been stored and flushed, and stops moving for the rest of the run
+    once any write has failed (a later page would cover the lost messages).
+    An item that raises in any stage (a MongoDB error from the analysis store
+    or the writer, a failed analysis) counts as such a failure; the stage
+    carries on with the next item, so producers and close() never block on
+    a stage that has died.
+    """
+
+    def __init__(self, db, writer: BufferedMessageWriter, checkpoints: Optional[ChannelCheckpoints] = None,
+                 queue_size: int = INGEST_QUEUE_SIZE, analyze_workers: int = GEMINI_MAX_CONCURRENCY,
+                 analyses: Optional[AnalysisStore] = None):
+        self.db = db
+        self.writer = writer
+        self.checkpoints = checkpoints
+        # Pass the store the writer came from (AnalysisStore.message_writer) so analyses flush before messages
+        self.analyses = analyses or AnalysisStore(db, buffered=False)
+        self.analyze_workers = max(1, analyze_workers)
+
+        self.fetch_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.analyze_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.store_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+        self._tickets: Dict[str, deque] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._writer_errors = writer.errors
+        self.write_failed = False
+        self._failed_ids: List[str] = []
+        self.stats = {"pages": 0, "messages": 0, "groups": 0, "analyzed": 0, "stored": 0, "skipped": 0,
+                      "errors": 0}
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._filter_stage())]
+        self._tasks += [asyncio.create_task(self._analyze_stage()) for _ in range(self.analyze_workers)]
+        self._tasks.append(asyncio.create_task(self._store_stage()))
+
+    async def submit_page(self, channel_id: str, messages: List[Dict[str, Any]], checkpoint: bool = True):
+        """Feed a page of raw Discord messages into the pipeline (blocks when the queue is full)"""
+        if not messages:
+            return
+        ticket = _PageTicket(channel_id, messages) if checkpoint and self.checkpoints else None
+        if ticket:
+            self._tickets.setdefault(channel_id, deque()).append(ticket)
+        self.stats["pages"] += 1
+        self.stats["messages"] += len(messages)
+        await self.fetch_queue.put((channel_id, messages, ticket))
+
+    async def close(self):
+        """Drain every stage, flush the writer and record the final checkpoints"""
+        await self.fetch_queue.put(None)
+        await asyncio.gather(*self._tasks)
+        try:
+            await asyncio.to_thread(self.writer.flush)
+        except Exception as e:
+            self._stage_failed("final flush", None, e)
+            raise
+        await self._record_checkpoints()
+
+    def take_failed_ids(self) -> List[str]:
+        """Ids of the messages in items that failed since the last call (they may not be stored)"""
+        failed, self._failed_ids = self._failed_ids, []
+        return failed
+
+    def _stage_failed(self, stage: str, ticket: Optional[_PageTicket], e: Exception,
+                      messages: Optional[List[Dict[str, Any]]] = None):
+        """Count a failed item; the stage keeps draining its queue so nothing upstream blocks"""
+        self.stats["errors"] += 1
+        self._failed_ids.extend(m["id"] for m in messages or [])
+        if not self.write_failed:
+            print(f"❌ {stage} stage failed ({e}), checkpoints stay where they are for the rest of this run")
+        self.write_failed = True
+        if ticket is not None:
+            ticket.fetched_all = True
+            ticket.pending = max(0, ticket.pending - 1)
+
+    async def _filter_stage(self):
+        while True:
+            item = await self.fetch_queue.get()
+            if item is None:
+                for _ in range(self.analyze_workers):
+                    await self.analyze_queue.put(None)
+                return
+            channel_id, messages, ticket = item
+            try:
+                # Nothing to analyze in attachment-only / empty messages
+                messages = [m for m in messages if (m.get("content") or "").strip()]
+                groups = []
+                for author, group in iter_author_groups(messages, 60):
+                    # Groups without stock content would be discarded after analysis, drop them now
+                    decision = group_filter.evaluate(group)
+                    if decision.stock_messages:
+                        groups.append((author, group, decision))
+                    else:
+                        self.stats["skipped"] += len(group)
+            except Exception as e:
+                self._stage_failed("filter", ticket, e, messages)
+                continue
+            if ticket:
+                ticket.pending = len(groups)
+                ticket.fetched_all = True
+                if not groups:
+                    await self.store_queue.put(("done", ticket))
+            for author, group, decision in groups:
+                self.stats["groups"] += 1
+                if decision.analyze:
+                    await self.analyze_queue.put((author, group, ticket))
+                else:
+                    # Low relevance: store without spending a Gemini call
+                    await self.store_queue.put(("group", author, group, skipped_analysis(decision), ticket))
+
+    async def _analyze_stage(self):
+        while True:
+            item = await self.analyze_queue.get()
+            if item is None:
+                await self.store_queue.put(None)
+                return
+            author, group, ticket = item
+            try:
+                analysis = await asyncio.to_thread(analyze_with_context, group, author)
+            except Exception as e:
+                self._stage_failed("analyze", ticket, e, group)
+                continue
+            self.stats["analyzed"] += 1
+            await self.store_queue.put(("group", author, group, analysis, ticket))
+
+    async def _store_group(self, author: str, group: List[Dict[str, Any]], analysis: Dict[str, Any]):
+        analysis_id = await asyncio.to_thread(self.analyses.add, group, analysis, author)
+        for msg in group:
+            doc = build_stock_message_doc(msg, analysis, analysis_id)
+            if doc is None:
+                self.stats["skipped"] += 1
+                continue
+            await asyncio.to_thread(self.writer.add, doc)
+            self.stats["stored"] += 1
+
+    async def _store_stage(self):
+        finished_workers = 0
+        while finished_workers < self.analyze_workers:
+            item = await self.store_queue.get()
+            if item is None:
+                finished_workers += 1
+                continue
+            kind, ticket = item[0], item[-1]
+            if kind == "group":
+                _, author, group, analysis, _ = item
+                try:
+                    await self._store_group(author, group, analysis)
+                except Exception as e:
+                    self._stage_failed("store", ticket, e, group)
+                    continue
+                if ticket:
+                    ticket.pending -= 1
+            if ticket is not None and ticket.pending == 0:
+                try:
+                    await self._record_checkpoints()
+                except Exception as e:
+                    self._stage_failed("store", None, e)
+
+    async def _record_checkpoints(self):
+        """Advance each channel's checkpoint over the prefix of fully stored pages"""
+        if not self.checkpoints:
+            return
+        ready = []
+        for tickets in self._tickets.values():
+            while tickets and tickets[0].fetched_all and tickets[0].pending == 0:
+                ready.append(tickets.popleft())
+        if not ready:
+            return
+        await asyncio.to_thread(self.writer.flush)
+        if self.write_failed or self.writer.errors > self._writer_errors:
+            if not self.write_failed:
+                print(f"❌ {self.writer.errors - self._writer_errors} message writes failed, "
+                      f"checkpoints stay where they are for the rest of this run")
+            self.write_failed = True
+            return
+        for ticket in ready:
+            await asyncio.to_thread(self.checkpoints.record_page, ticket.channel_id,
+                                    ticket.oldest_id, ticket.newest_id)
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {
+            "fetch": self.fetch_queue.qsize(),
+            "analyze": self.analyze_queue.qsize(),
+            "store": self.store_queue.qsize(),
+        }
+
+
+class MultiChannelIngestor:
+    """Fetches many channels concurrently and feeds every page into one IngestPipeline"""
+
+    def __init__(self, pipeline: IngestPipeline, checkpoints: ChannelCheckpoints,
+                 rate_limiter: Optional[RouteRateLimiter] = None, page_size: int = 100, max_retries: int = 5):
+        self.pipeline = pipeline
+        self.checkpoints = checkpoints
+        self.rate_limiter = rate_limiter or RouteRateLimiter()
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self._backfilled: List[str] = []
+        # Newest message id submitted per channel, ahead of the durable checkpoint
+        self.last_ids: Dict[str, int] = {}
+
+    async def fetch_messages(self, session: aiohttp.ClientSession, channel_id: str,
+                             before: Optional[str] = None, after: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """One page of messages, or None if the request failed (an empty list means there are none)"""
+        route = "GET /channels/{channel_id}/messages"
+        params = {"limit": self.page_size}
+        if before:
+            params["before"] = before
+        if after:
+            params["after"] = after
+
+        for _ in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(route, channel_id)
+            async with session.get(f"{DISCORD_API}/channels/{channel_id}/messages", params=params) as resp:
+                body = await resp.json(content_type=None) if resp.status in (200, 429) else await resp.text()
+                retry_after = self.rate_limiter.update(route, channel_id, resp.headers, resp.status, body)
+                if resp.status == 200:
+                    return body
+                if resp.status == 429:
+                    print(f"⏳ Channel {channel_id} rate limited, waiting {retry_after:.1f}s")
+                    continue
+                print(f"Failed to fetch messages for {channel_id}: {resp.status} {body}")
+                return None
+        print(f"Giving up on channel {channel_id} after {self.max_retries} rate-limited retries")
+        return None
+
+    async def ingest_channel(self, session: aiohttp.ClientSession, channel_id: str, mode: str = "incremental"):
+        state = await asyncio.to_thread(self.checkpoints.get, channel_id)
+        before = None
+        after = None
+        if mode == "backfill":
+            if state.get("backfill_complete"):
+                print(f"✅ Backfill already complete for channel {channel_id}")
+                return
+            before = str(state["oldest_id"]) if state.get("oldest_id") else None
+        elif state.get("newest_id") or channel_id in self.last_ids:
+            after = str(max(state.get("newest_id") or 0, self.last_ids.get(channel_id, 0)))
+        else:
+            # No checkpoint yet: start from the newest message already in the database
+            last = await asyncio.to_thread(
+                self.pipeline.db["stock_messages"].find_one,
+                {"channel_id": channel_id}, sort=[("timestamp", -1)], projection={"discord_id": 1},
+            )
+            after = last["discord_id"] if last else None
+
+        while True:
+            page = await self.fetch_messages(session, channel_id, before=before, after=after)
+            if page is None:
+                # Checkpoints cover what was fetched so far; the next run resumes from there
+                print(f"⚠️  Stopped fetching channel {channel_id} after an API error")
+                return
+            await self.pipeline.submit_page(channel_id, page)
+            ids = [int(m["id"]) for m in page]
+            if ids:
+                self.last_ids[channel_id] = max(self.last_ids.get(channel_id, 0), *ids)
+            if len(page) < self.page_size:
+                break
+            if mode == "backfill":
+                before = str(min(ids))
+            elif after:
+                after = str(max(ids))
+            else:
+                break  # first run of a channel without checkpoint: latest page only
+
+        if mode == "backfill":
+            # Reached a short page; mark complete once the pipeline has drained
+            self._backfilled.append(channel_id)
+        print(f"📡 Finished fetching channel {channel_id}")
+
+    async def run(self, channel_ids: List[str], mode: str = "incremental"):
+        self.pipeline.start()
+        started = time.perf_counter()
+        # requests silently drops None headers (missing token), aiohttp doesn't
+        session_headers = {k: v for k, v in headers.items() if v}
+        async with aiohttp.ClientSession(headers=session_headers) as session:
+            await asyncio.gather(*(self.ingest_channel(session, cid, mode) for cid in channel_ids))
+        await self.pipeline.close()
+        if not self.pipeline.write_failed:
+            for channel_id in self._backfilled:
+                await asyncio.to_thread(self.checkpoints.mark_backfill_complete, channel_id)
+        return time.perf_counter() - started
+
+
+async def main(channel_ids: List[str], mode: str):
+    db = setup_mongodb()
+    if db is None:
+        print("❌ Cannot proceed without MongoDB connection")
+        return
+    checkpoints = ChannelCheckpoints(db)
+    analyses = AnalysisStore(db)
+    heavy_hitters.restore(db)
+    rollups = TickerRollups(db, tracker=heavy_hitters)
+    writer = analyses.message_writer(db["stock_messages"],
+                                     after_flush=fan_out(rollups.record, message_metrics_hook(db)))
+    pipeline = IngestPipeline(db, writer, checkpoints, analyses=analyses)
+    ingestor = MultiChannelIngestor(pipeline, checkpoints)
+
+    elapsed = await ingestor.run(channel_ids, mode)
+    writer.close()
+    heavy_hitters.snapshot()
+
+    stats = pipeline.stats
+    limiter = ingestor.rate_limiter
+    print(f"\n📊 Ingested {len(channel_ids)} channels in {elapsed:.1f}s")
+    print(f"   Pages: {stats['pages']}  Messages: {stats['messages']}  Groups analyzed: {stats['analyzed']}")
+    print(f"   ✅ Stored: {stats['stored']}  ⏭️  Skipped: {stats['skipped']}  ❌ Errors: {stats['errors']}")
+    print(f"   {group_filter.report()}")
+    print(f"   🔥 Most mentioned (last hour): {', '.join(row['item'] for row in heavy_hitters.top('1h', 5)) or 'none'}")
+    print(f"   ⏳ Rate-limit waits: {limiter.waits} ({limiter.wait_seconds:.1f}s), 429s: {limiter.rate_limited}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest several Discord channels concurrently")
+    parser.add_argument("--channels", nargs="+", default=DISCORD_CHANNEL_IDS)
+    parser.add_argument("--mode", choices=["incremental", "backfill"], default="incremental")
+    args = parser.parse_args()
+    asyncio.run(main(args.channels, args.mode))
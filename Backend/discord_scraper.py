@@ -1,13 +1,26 @@
 import requests
-from pymongo import MongoClient
-import certifi
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-from datetime import datetime, timedelta
+from datetime import timedelta
 import json
-import re
-import pytz
+import time
+import argparse
+from llm_scheduler import gemini_scheduler, PRIORITY_BACKGROUND
+from gemini_models import model_registry
+from llm_json import parse_stream, validate, LLMJSONError, REQUIRED
+from llm_metrics import llm_metrics
+from message_writer import BufferedMessageWriter, ensure_message_indexes, fan_out
+from mongo import get_client, get_db
+from discord_checkpoints import ChannelCheckpoints
+from ticker_matcher import ticker_matcher
+from group_filter import group_filter, skipped_analysis
+from analysis_store import AnalysisStore, analysis_status, ensure_message_analysis_indexes
+from ticker_rollups import TickerRollups
+from heavy_hitters import heavy_hitters
+from timeseries_store import TIMESERIES_ENABLED, ensure_timeseries_collections, message_metrics_hook, window_store
+from message_grouping import author_key, group_sorted, iter_author_groups
+from timeutils import now_utc, parse_timestamp, parse_timestamps
+from message_search import ensure_text_index
 
 # Always load .env from the project root
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -23,9 +36,10 @@ headers = {
 
 MONGO_URI = os.getenv("MONGO_URI")
 
-client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-db = client['discord_scraper']  # or your existing DB name
-collection = db[f"user_scraped_messages_{CHANNEL_ID}"]
+# Shared pooled client (mongo.py); setup_mongodb reports a missing MONGO_URI
+client = get_client() if MONGO_URI else None
+db = client['discord_scraper'] if client else None  # or your existing DB name
+collection = db[f"user_scraped_messages_{CHANNEL_ID}"] if client else None
 
 if AUTHORIZATION:
     print(f"Loaded DISCORD_USER_TOKEN: {AUTHORIZATION[:4]}...{AUTHORIZATION[-4:]}")  # Debug: Masked token output
@@ -38,109 +52,105 @@ if not GEMINI_API_KEY:
     print("GEMINI_API_KEY is not set or could not be loaded from .env!")
     exit(1)
 
-genai.configure(api_key=GEMINI_API_KEY)
+class DiscordAPIError(Exception):
+    """A message fetch that failed, as opposed to an empty page"""
 
-# Try different model names that might be available
-try:
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    print("Using gemini-1.5-flash model")
-except Exception as e:
-    try:
-        model = genai.GenerativeModel("gemini-1.5-pro")
-        print("Using gemini-1.5-pro model")
-    except Exception as e2:
-        try:
-            model = genai.GenerativeModel("gemini-pro")
-            print("Using gemini-pro model")
-        except Exception as e3:
-            try:
-                model = genai.GenerativeModel("gemini-1.0-pro")
-                print("Using gemini-1.0-pro model")
-            except Exception as e4:
-                print(f"Failed to initialize any Gemini model. Errors:")
-                print(f"gemini-1.5-flash: {e}")
-                print(f"gemini-1.5-pro: {e2}")
-                print(f"gemini-pro: {e3}")
-                print(f"gemini-1.0-pro: {e4}")
-                print("Please check your API key and available models.")
-                print("You may need to enable billing or check quota limits.")
-                exit(1)
-
-def get_messages(channel_id, limit=100):
-    url = f"https://discord.com/api/v9/channels/{channel_id}/messages?limit={limit}"
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Failed to fetch messages: {response.status_code} {response.text}")
-        return []
+class IngestWriteError(Exception):
+    """Messages in a batch failed to store, so its checkpoint was not recorded"""
+
+def get_messages(channel_id, limit=100, before=None, after=None, max_retries=3):
+    """Fetch up to `limit` (max 100) messages, optionally paged with before/after message ids
+    
+    Raises DiscordAPIError on any non-200 response, including a 429 that
+    outlasts the retries, so callers never mistake a failure for the end of
+    the channel.
+    """
+    url = f"https://discord.com/api/v9/channels/{channel_id}/messages"
+    params = {"limit": limit}
+    if before:
+        params["before"] = before
+    if after:
+        params["after"] = after
+    
+    for attempt in range(max_retries + 1):
+        response = requests.get(url, headers=headers, params=params)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 429 and attempt < max_retries:
+            # Rate limited: Discord tells us how long to wait
+            retry_after = float(response.json().get("retry_after", 1.0))
+            print(f"⏳ Rate limited, retrying in {retry_after:.1f}s")
+            time.sleep(retry_after)
+            continue
+        raise DiscordAPIError(f"Failed to fetch messages: {response.status_code} {response.text}")
+
+def iter_channel_history(channel_id, before=None, page_size=100):
+    """Walk a channel from newest to oldest, yielding one page (newest first) at a time"""
+    while True:
+        page = get_messages(channel_id, limit=page_size, before=before)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        before = min(page, key=lambda m: int(m['id']))['id']
+
+def iter_new_messages(channel_id, after, page_size=100):
+    """Walk forward from message id `after` to the present, one page at a time"""
+    while True:
+        page = get_messages(channel_id, limit=page_size, after=after)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after = max(page, key=lambda m: int(m['id']))['id']
 
 def analyze_sentiment_with_gemini(text):
     try:
         prompt = f"Classify the sentiment of this message as positive, neutral, or negative. Only return the label.\nMessage: {text}"
-        response = model.generate_content(prompt)
+        response = model_registry.generate(prompt, priority=PRIORITY_BACKGROUND,
+                                           stage="discord_scraper.sentiment")
         return response.text.strip().lower()
     except Exception as e:
         print(f"Error analyzing sentiment: {e}")
+        llm_metrics.record_fallback("discord_scraper.sentiment", "error")
         return "neutral"  # Default fallback
 
 def group_messages_by_time(messages, time_window_minutes=30):
-    """Group messages that are close in time."""
-    grouped = []
-    current_group = []
-    for msg in sorted(messages, key=lambda x: x.get('timestamp', '')):
-        msg_time = msg.get('timestamp')
-        if isinstance(msg_time, str):
-            try:
-                msg_time = datetime.fromisoformat(msg_time)
-            except Exception:
-                msg_time = datetime.utcnow()
-        msg['timestamp'] = msg_time
-        if not current_group:
-            current_group.append(msg)
-        else:
-            time_diff = (msg_time - current_group[-1]['timestamp']).total_seconds() / 60
-            if time_diff < time_window_minutes:
-                current_group.append(msg)
-            else:
-                grouped.append(current_group)
-                current_group = [msg]
-    if current_group:
-        grouped.append(current_group)
-    return grouped
+    """Group messages that are close in time (messages are not modified)."""
+    times = parse_timestamps([msg.get('timestamp') for msg in messages])
+    rows = sorted(((t, i, msg) for i, (t, msg) in enumerate(zip(times, messages))), key=lambda r: r[:2])
+    return [group for _, group in group_sorted((("", t, msg) for t, _, msg in rows), time_window_minutes)]
 
 def group_messages_by_author(messages, author, time_window_minutes=60):
     """Group messages from the same author within a time window."""
-    author_messages = []
-    for msg in messages:
-        msg_author = msg.get('author')
-        if msg_author:
-            # If author is a dict, extract username or id
-            if isinstance(msg_author, dict):
-                msg_author_id = msg_author.get('username') or msg_author.get('id') or str(msg_author)
-            else:
-                msg_author_id = str(msg_author)
-            
-            if msg_author_id == author:
-                author_messages.append(msg)
-    
-    return group_messages_by_time(author_messages, time_window_minutes)
+    return group_messages_by_time([msg for msg in messages if author_key(msg) == author], time_window_minutes)
+
+# Expected shape of analyze_with_context responses; missing optional fields get defaults
+TRADE_ANALYSIS_SCHEMA = {
+    "has_trade_info": (bool, REQUIRED),
+    "tickers": (list, []),
+    "sentiment": (str, "neutral"),
+    "action": (str, "none"),
+    "price_target": ((str, type(None)), None),
+    "stop_loss": ((str, type(None)), None),
+    "confidence": ((int, float), 0),
+    "strategy": (str, ""),
+    "urgency": (str, "low"),
+    "summary": (str, ""),
+}
+
+def _parse_analysis_stream(response):
+    """Parsed JSON from a streamed response, or the parse error (a bad reply isn't a failed call)"""
+    try:
+        return parse_stream(response)
+    except LLMJSONError as e:
+        return e
 
 def analyze_with_context(messages, target_author=None):
     """Enhanced analysis specifically for stock-related content"""
     try:
-        # Try different models (your existing fallback logic)
-        try:
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            print("Using gemini-1.5-flash model")
-        except Exception as e:
-            try:
-                model = genai.GenerativeModel("gemini-1.5-pro")
-                print("Using gemini-1.5-pro model")
-            except Exception as e2:
-                model = genai.GenerativeModel("gemini-pro")
-                print("Using gemini-pro model")
-        
         # Create enhanced prompt
         messages_text = [f'{msg.get("author", "")}: {msg.get("content", "")}' for msg in messages[-10:]]
         
@@ -175,27 +185,24 @@ Respond in JSON format:
 }}
 """
         
-        response = model.generate_content(prompt)
-        
-        # Clean response (remove markdown)
-        response_text = response.text.strip()
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        response_text = response_text.strip()
+        # Stream the response and stop as soon as the JSON object is complete; the
+        # stream is read inside the scheduled call so quota errors are retried there
+        analysis = model_registry.generate(prompt, priority=PRIORITY_BACKGROUND,
+                                           stage="discord_scraper.analyze", stream=True,
+                                           consume=_parse_analysis_stream)
         
         try:
-            return json.loads(response_text)
-        except Exception as e:
+            if isinstance(analysis, LLMJSONError):
+                raise analysis
+            return validate(analysis, TRADE_ANALYSIS_SCHEMA)
+        except LLMJSONError as e:
             print(f"Error parsing JSON response: {e}")
+            llm_metrics.record_fallback("discord_scraper.analyze", "parse_error")
             return {"play": None, "tickers": [], "action": None, "price": None, "confidence": 0.0}
             
     except Exception as e:
         print(f"Error in analyze_with_context: {e}")
+        llm_metrics.record_fallback("discord_scraper.analyze", "error")
         return {"play": None, "tickers": [], "action": None, "price": None, "confidence": 0.0}
 
 def setup_mongodb():
@@ -206,12 +213,14 @@ def setup_mongodb():
         return None
     
     try:
-        client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-        db = client['discord_scraper']
+        db = get_db('discord_scraper')
         
         # Create indexes for better performance
         stock_messages = db['stock_messages']
         
+        # Unique message id so reruns upsert instead of duplicating
+        ensure_message_indexes(stock_messages)
+        
         # Index on tickers for fast lookups
         stock_messages.create_index("tickers_mentioned")
         
@@ -224,6 +233,24 @@ def setup_mongodb():
         # Compound index for common queries
         stock_messages.create_index([("tickers_mentioned", 1), ("timestamp", -1)])
         
+        # Newest message per channel, where incremental scrapes resume
+        stock_messages.create_index([("channel_id", 1), ("timestamp", -1)])
+        
+        # Full-text search over content, behind /search
+        ensure_text_index(stock_messages)
+        
+        # Messages reference their group's analysis in the analyses collection
+        ensure_message_analysis_indexes(stock_messages)
+        AnalysisStore(db).ensure_indexes()
+        
+        # Hourly per-ticker counters behind get_stock_insights
+        TickerRollups(db).ensure_indexes()
+        
+        # Optional time-series collections for per-ticker metrics and candles (MongoDB 5.0+)
+        if TIMESERIES_ENABLED:
+            for name, status in ensure_timeseries_collections(db).items():
+                print(f"🕒 Time-series {name}: {status}")
+        
         print("✅ MongoDB connected successfully with indexes")
         return db
     except Exception as e:
@@ -231,58 +258,19 @@ def setup_mongodb():
         return None
 
 def parse_discord_timestamp(timestamp_str):
-    """Parse Discord timestamp safely and convert to EST"""
-    try:
-        # Discord timestamps are often in ISO format with 'Z' suffix
-        if isinstance(timestamp_str, str):
-            if timestamp_str.endswith('Z'):
-                dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            else:
-                dt = datetime.fromisoformat(timestamp_str)
-        elif isinstance(timestamp_str, (int, float)):
-            # Unix timestamp
-            dt = datetime.fromtimestamp(float(timestamp_str))
-        else:
-            dt = datetime.utcnow()
-        
-        # Convert to EST/EDT (handles daylight saving automatically)
-        est_tz = pytz.timezone('America/New_York')
-        return dt.astimezone(est_tz)
-        
-    except (ValueError, TypeError):
-        # Fallback to current time in EST
-        est_tz = pytz.timezone('America/New_York')
-        return datetime.now(est_tz)
-
-def is_stock_related_message(content):
-    """Smart filtering for stock-related content"""
-    if not content or content.strip() == "":
-        return False, []
-    
-    # Stock ticker patterns ($AAPL, $TSLA, etc.)
-    ticker_pattern = r'\$[A-Z]{1,5}'
-    tickers = re.findall(ticker_pattern, content.upper())
-    
-    # Stock-related keywords (more comprehensive)
-    stock_keywords = [
-        'stock', 'shares', 'buy', 'sell', 'long', 'short', 'position',
-        'entry', 'exit', 'target', 'stop loss', 'portfolio', 'market',
-        'earnings', 'dividend', 'bullish', 'bearish', 'rally', 'crash',
-        'trading', 'invest', 'hold', 'dump', 'pump', 'moon', 'rocket',
-        'support', 'resistance', 'breakout', 'breakdown', 'volume',
-        'catalyst', 'news', 'fda', 'approval', 'merger', 'acquisition'
-    ]
-    
-    has_tickers = len(tickers) > 0
-    has_keywords = any(keyword in content.lower() for keyword in stock_keywords)
-    
-    return has_tickers or has_keywords, tickers
-
-def store_stock_message(db, message_data, ai_analysis):
-    """Store only stock-related messages with enhanced metadata"""
+    """Parse Discord timestamp safely as UTC (converted to local time only for display)"""
+    return parse_timestamp(timestamp_str)
+
+def build_stock_message_doc(message_data, ai_analysis, analysis_id=None):
+    """Build the stock_messages document for a message, or None if it isn't stock-related
+    
+    The full analysis lives once per group in the `analyses` collection
+    (see analysis_store); the message keeps its id and the scalar fields
+    that queries filter on.
+    """
     
     content = message_data.get('content', '')
-    is_stock, tickers = is_stock_related_message(content)
+    is_stock, tickers = ticker_matcher.match_message(message_data)
     
     if not is_stock:
         return None  # Don't store non-stock messages
@@ -303,82 +291,231 @@ def store_stock_message(db, message_data, ai_analysis):
     
     # Create comprehensive document
     stock_message_doc = {
-        # Discord message data
+        # Source message data (discord_id is the storage key for every source)
         'discord_id': message_data['id'],
+        'source': message_data.get('source', 'discord'),
+        'url': message_data.get('url'),
         'author_id': author_id,
         'author_username': author_username,
         'author_discriminator': author_discriminator,
         'content': content,
-        'channel_id': CHANNEL_ID,  # Use the global CHANNEL_ID
+        'channel_id': message_data.get('channel_id', CHANNEL_ID),
         'guild_id': message_data.get('guild_id'),
         'timestamp': timestamp,
-        'created_at': datetime.now(pytz.timezone('America/New_York')),
+        'created_at': now_utc(),
         
         # Stock analysis data
         'tickers_mentioned': tickers,
         'is_stock_related': True,
         'has_trade_signal': ai_analysis.get('has_trade_info', False),
         
-        # AI Analysis results
-        'ai_analysis': ai_analysis,
+        # AI Analysis results (shared by the group, stored in `analyses`)
+        'analysis_id': analysis_id,
+        'analysis_status': analysis_status(ai_analysis),
         
         # Enhanced metadata for filtering
         'confidence_score': ai_analysis.get('confidence', 0),
         'action_type': ai_analysis.get('action', 'none'),
         'sentiment': ai_analysis.get('sentiment', 'neutral'),
         'urgency': ai_analysis.get('urgency', 'low'),
-        
-        # Search optimization
-        'search_text': content.lower(),  # For text search
         'ticker_count': len(tickers)
     }
     
+    return stock_message_doc
+
+def store_stock_message(db, message_data, ai_analysis, writer=None, analysis_id=None):
+    """Store only stock-related messages with enhanced metadata
+    
+    With a BufferedMessageWriter the document is queued for the next bulk
+    flush; otherwise it is upserted immediately. Either way the message is
+    keyed on discord_id, so storing it again updates the existing document.
+    Returns the discord_id, or None if the message was skipped.
+    """
+    stock_message_doc = build_stock_message_doc(message_data, ai_analysis, analysis_id)
+    if stock_message_doc is None:
+        return None
+    
+    if writer is not None:
+        writer.add(stock_message_doc)
+        return stock_message_doc['discord_id']
+    
     # Store in MongoDB
     try:
-        stock_messages = db['stock_messages']
-        result = stock_messages.insert_one(stock_message_doc)
+        with BufferedMessageWriter(db['stock_messages'], batch_size=1, flush_interval=0,
+                                   after_flush=fan_out(TickerRollups(db, tracker=heavy_hitters).record,
+                                                       message_metrics_hook(db))) as single:
+            single.add(stock_message_doc)
+        if single.errors:
+            # The bulk write error was already reported by the writer
+            return None
         
-        print(f"💾 Stored stock message: {tickers} - {author_username}")
-        return result.inserted_id
+        print(f"💾 Stored stock message: {stock_message_doc['tickers_mentioned']} - {stock_message_doc['author_username']}")
+        return stock_message_doc['discord_id']
         
     except Exception as e:
         print(f"❌ Failed to store message: {e}")
         return None
 
 def get_stock_insights(db, days_back=7):
-    """Get insights from stored stock messages"""
+    """Get insights from stored stock messages
     
-    stock_messages = db['stock_messages']
+    Answered from the hourly ticker_rollups buckets (see ticker_rollups),
+    or from the message_metrics time-series collection when
+    TIMESERIES_ENABLED, so the cost doesn't grow with stock_messages.
+    """
     
-    # Get recent messages
-    cutoff_date = datetime.now(pytz.timezone('America/New_York')) - timedelta(days=days_back)
+    rollups = window_store(db)
     
-    # Most mentioned tickers
-    pipeline = [
-        {"$match": {"created_at": {"$gte": cutoff_date}}},
-        {"$unwind": "$tickers_mentioned"},
-        {"$group": {"_id": "$tickers_mentioned", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 10}
-    ]
+    # Get recent messages (rounded down to the hour)
+    cutoff_date = now_utc() - timedelta(days=days_back)
     
-    top_tickers = list(stock_messages.aggregate(pipeline))
+    # Most mentioned tickers
+    top_tickers = [{"_id": row["ticker"], "count": row["mentions"]}
+                   for row in rollups.window(cutoff_date, limit=10)]
     
     # Sentiment analysis
-    sentiment_pipeline = [
-        {"$match": {"created_at": {"$gte": cutoff_date}}},
-        {"$group": {"_id": "$sentiment", "count": {"$sum": 1}}}
-    ]
-    
-    sentiment_breakdown = list(stock_messages.aggregate(sentiment_pipeline))
+    totals = rollups.totals(cutoff_date)
+    sentiment_breakdown = [{"_id": label, "count": count} for label, count in totals["sentiment"].items()]
     
     return {
         "top_tickers": top_tickers,
         "sentiment_breakdown": sentiment_breakdown,
-        "total_messages": stock_messages.count_documents({"created_at": {"$gte": cutoff_date}})
+        "total_messages": totals["mentions"]
     }
 
 
+def process_messages(db, messages, writer, analyses=None):
+    """Group, analyze and store a batch of fetched messages; returns (plays, stored, skipped)"""
+    if analyses is None:
+        analyses = AnalysisStore(db, buffered=False)
+    all_plays = []
+    stored_count = 0
+    skipped_count = 0
+    
+    # One sort by (author, timestamp), then a single pass over the groups
+    for author, group in iter_author_groups(messages, time_window_minutes=60):
+        # Score the group before spending a Gemini call on it
+        decision = group_filter.evaluate(group)
+        if not decision.stock_messages:
+            skipped_count += len(group)
+            continue
+        if decision.analyze:
+            analysis = analyze_with_context(group, target_author=author)
+        else:
+            analysis = skipped_analysis(decision)
+        analysis_id = analyses.add(group, analysis, author)
+        
+        # Queue each message for the next bulk flush
+        for msg in group:
+            stored_id = store_stock_message(db, msg, analysis, writer=writer, analysis_id=analysis_id)
+            if stored_id:
+                stored_count += 1
+            else:
+                skipped_count += 1
+        
+        all_plays.append({
+            'author': author,
+            'messages': [msg.get('content', '') for msg in group],
+            'analysis': analysis
+        })
+    
+    return all_plays, stored_count, skipped_count
+
+
+def _ingest_pages(db, channel_id, pages, writer, checkpoints, pages_per_batch=5, keep_plays=False,
+                  analyses=None):
+    """Process pages in batches, moving the checkpoint only after each batch is flushed
+    
+    If any write in a batch fails the checkpoint stays where it was and
+    IngestWriteError is raised, since a later batch would move it past the
+    lost messages. If fetching fails, the pages already fetched are stored
+    before the DiscordAPIError is passed on.
+    """
+    totals = {"fetched": 0, "stored": 0, "skipped": 0, "plays": []}
+    batch = []
+    
+    def finish_batch():
+        errors = writer.errors
+        plays, stored, skipped = process_messages(db, batch, writer, analyses)
+        writer.flush()
+        ids = [int(m['id']) for m in batch]
+        if writer.errors > errors:
+            raise IngestWriteError(f"{writer.errors - errors} writes failed for channel {channel_id} "
+                                   f"messages {min(ids)}..{max(ids)}, checkpoint not moved")
+        checkpoints.record_page(channel_id, min(ids), max(ids))
+        totals["fetched"] += len(batch)
+        totals["stored"] += stored
+        totals["skipped"] += skipped
+        if keep_plays:
+            totals["plays"].extend(plays)
+        print(f"📥 Channel {channel_id}: {totals['fetched']} messages processed "
+              f"(checkpoint {min(ids)}..{max(ids)})")
+    
+    try:
+        for i, page in enumerate(pages, start=1):
+            batch.extend(page)
+            if i % pages_per_batch == 0:
+                finish_batch()
+                batch = []
+    except DiscordAPIError:
+        if batch:
+            finish_batch()
+        raise
+    if batch:
+        finish_batch()
+    return totals
+
+def _limit_pages(pages, max_pages, exhausted):
+    for i, page in enumerate(pages):
+        if i >= max_pages:
+            exhausted["value"] = False
+            return
+        yield page
+
+def run_backfill(db, channel_id, writer, checkpoints, max_pages=None, analyses=None):
+    """Walk the channel's full history with before= cursors, resuming after a crash
+    
+    The backfill is only marked complete when Discord answered with a short
+    page; fetch or write errors propagate and leave it resumable.
+    """
+    state = checkpoints.get(channel_id)
+    if state.get("backfill_complete"):
+        print(f"✅ Backfill already complete for channel {channel_id}")
+        return {"fetched": 0, "stored": 0, "skipped": 0, "plays": []}
+    
+    before = checkpoints.oldest_id(channel_id)
+    if before:
+        print(f"↩️  Resuming backfill of channel {channel_id} before message {before}")
+    
+    pages = iter_channel_history(channel_id, before=before)
+    exhausted = {"value": True}
+    if max_pages:
+        pages = _limit_pages(pages, max_pages, exhausted)
+    totals = _ingest_pages(db, channel_id, pages, writer, checkpoints, analyses=analyses)
+    if exhausted["value"]:
+        checkpoints.mark_backfill_complete(channel_id)
+        print(f"🏁 Backfill reached the start of channel {channel_id}")
+    return totals
+
+def run_incremental(db, channel_id, writer, checkpoints, analyses=None):
+    """Fetch only messages newer than the last stored one using after= cursors"""
+    after = checkpoints.newest_id(channel_id)
+    if not after:
+        # No checkpoint yet: start from the newest message already in the database
+        last = db['stock_messages'].find_one(
+            {"channel_id": channel_id}, sort=[("timestamp", -1)], projection={"discord_id": 1}
+        )
+        after = last["discord_id"] if last else None
+    
+    if not after:
+        print(f"ℹ️  Nothing stored for channel {channel_id} yet, fetching latest page")
+        return _ingest_pages(db, channel_id, [get_messages(channel_id)], writer, checkpoints, analyses=analyses)
+    
+    print(f"🔄 Fetching messages in channel {channel_id} after {after}")
+    return _ingest_pages(db, channel_id, iter_new_messages(channel_id, after), writer, checkpoints,
+                         analyses=analyses)
+
+
 if __name__ == "__main__":
     # Setup MongoDB
     db = setup_mongodb()
@@ -386,54 +523,66 @@ if __name__ == "__main__":
         print("❌ Cannot proceed without MongoDB connection")
         exit(1)
     
-    messages = get_messages(CHANNEL_ID)
-    if messages:
-        # Process and store messages
-        all_plays = []
-        stored_count = 0
-        skipped_count = 0
-        
-        # Extract authors (your existing logic)
-        authors = set()
-        for msg in messages:
-            author = msg.get('author')
-            if author:
-                if isinstance(author, dict):
-                    author_id = author.get('username') or author.get('id') or str(author)
-                else:
-                    author_id = str(author)
-                authors.add(author_id)
-        
-        for author in authors:
-            grouped = group_messages_by_author(messages, author, time_window_minutes=60)
-            for group in grouped:
-                analysis = analyze_with_context(group, target_author=author)
-                
-                # Store each message individually
-                for msg in group:
-                    stored_id = store_stock_message(db, msg, analysis)
-                    if stored_id:
-                        stored_count += 1
-                    else:
-                        skipped_count += 1
-                
-                all_plays.append({
-                    'author': author,
-                    'messages': [msg.get('content', '') for msg in group],
-                    'analysis': analysis
-                })
-        
+    parser = argparse.ArgumentParser(description="Scrape and analyze Discord stock messages")
+    parser.add_argument("--mode", choices=["latest", "backfill", "incremental"], default="latest",
+                        help="latest: newest 100 messages; backfill: full history; "
+                             "incremental: only messages since the last checkpoint")
+    parser.add_argument("--channel", default=CHANNEL_ID)
+    parser.add_argument("--max-pages", type=int, help="Stop a backfill after N pages (resume later)")
+    args = parser.parse_args()
+    
+    checkpoints = ChannelCheckpoints(db)
+    analyses = AnalysisStore(db)
+    heavy_hitters.restore(db)
+    rollups = TickerRollups(db, tracker=heavy_hitters)
+    with analyses.message_writer(db['stock_messages'],
+                                 after_flush=fan_out(rollups.record, message_metrics_hook(db))) as writer:
+        try:
+            if args.mode == "backfill":
+                totals = run_backfill(db, args.channel, writer, checkpoints, max_pages=args.max_pages,
+                                      analyses=analyses)
+            elif args.mode == "incremental":
+                totals = run_incremental(db, args.channel, writer, checkpoints, analyses=analyses)
+            else:
+                totals = _ingest_pages(db, args.channel, [get_messages(args.channel)], writer, checkpoints,
+                                       keep_plays=True, analyses=analyses)
+        except (DiscordAPIError, IngestWriteError) as e:
+            # Checkpoints only cover what was stored, so the next run picks up from here
+            print(f"❌ {e}")
+            totals = None
+    heavy_hitters.snapshot()
+    if totals is None:
+        exit(1)
+    
+    all_plays = totals["plays"]
+    stored_count = totals["stored"]
+    skipped_count = totals["skipped"]
+    if totals["fetched"]:
         # Print results
+        write_stats = writer.stats()
         print(f"\n📊 Processing complete:")
-        print(f"   ✅ Stored: {stored_count} stock messages")
+        print(f"   ✅ Stored: {stored_count} stock messages "
+              f"({write_stats['inserted']} new, {write_stats['updated']} updated, "
+              f"{write_stats['flushes']} bulk writes, {write_stats['docs_per_second']} docs/s)")
         print(f"   ⏭️  Skipped: {skipped_count} non-stock messages")
         
+        print(f"\n{group_filter.report()}")
+        llm_stats = gemini_scheduler.stats()
+        print(f"🤖 Gemini scheduler: {llm_stats['completed']} calls, "
+              f"{llm_stats['requeued_on_quota']} requeued on quota, "
+              f"avg wait {llm_stats['wait_seconds']['avg']}s (max {llm_stats['wait_seconds']['max']}s)")
+        model_stats = model_registry.stats()
+        print(f"   Model: {model_stats['active_model']} "
+              f"(reused across calls, saved {model_stats['overhead_saved_ms']}ms of setup)")
+        
         # Get insights
         insights = get_stock_insights(db, days_back=1)
         print(f"\n🔍 Today's Stock Insights:")
         print(f"   Total messages: {insights['total_messages']}")
         print(f"   Top tickers: {[t['_id'] for t in insights['top_tickers'][:5]]}")
+        print(f"   Most mentioned (last hour): {[row['item'] for row in heavy_hitters.top('1h', 5)]}")
         
-        print(json.dumps(all_plays, indent=2, default=str))
+        if args.mode == "latest":
+            print(json.dumps(all_plays, indent=2, default=str))
     else:
         print("No messages fetched.") 
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+import uuid
+import random
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pytz
+from aiohttp import web, WSMsgType
+
+from gateway_opcodes import (
+    OP_DISPATCH, OP_HEARTBEAT, OP_IDENTIFY, OP_RESUME, OP_RECONNECT,
+    OP_INVALID_SESSION, OP_HELLO, OP_HEARTBEAT_ACK,
+)
+
+# Discord snowflakes are ms since the Discord epoch shifted left 22 bits
+DISCORD_EPOCH_MS = 1420070400000
+
+SAMPLE_MESSAGES = [
+    "$AAPL calls looking good into earnings",
+    "Took profits on NVDA, trimming half",
+    "SPY puts for the afternoon dump",
+    "lunch break, back in 30",
+    "$TSLA 250c 6/21 entry 3.40",
+    "anyone watching AMD here?",
+]
+
+
+def make_snowflake() -> str:
+    now_ms = int(datetime.now(pytz.utc).timestamp() * 1000)
+    return str(((now_ms - DISCORD_EPOCH_MS) << 22) | random.randint(0, (1 << 22) - 1))
+
+
+class FakeGateway:
+    """
+    Minimal local stand-in for the Discord gateway, for exercising GatewayClient.
+
+    Speaks the same JSON opcodes: HELLO, IDENTIFY -> READY, heartbeats and
+    ACKs, RESUME (replaying events the client missed), RECONNECT and
+    INVALID_SESSION. Tests and the __main__ demo drive it with
+    dispatch_message(), drop_connections() and request_reconnect().
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8766, heartbeat_interval_ms: int = 5000):
+        # port=0 picks a free port, available from .url once started
+        self.host = host
+        self.port = port
+        self.heartbeat_interval_ms = heartbeat_interval_ms
+
+        self._runner: Optional[web.AppRunner] = None
+        self._sockets: List[web.WebSocketResponse] = []
+        self._session_id: Optional[str] = None
+        self._events: List[Dict[str, Any]] = []  # every dispatch, for replay on RESUME
+        self.seq = 0
+        self.identifies = 0
+        self.resumes = 0
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self._handle_socket)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        await self.drop_connections()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def dispatch_message(self, channel_id: str, content: str, username: str = "trader") -> Dict[str, Any]:
+        """Broadcast a MESSAGE_CREATE to connected clients (and keep it for resumes)"""
+        message = {
+            "id": make_snowflake(),
+            "channel_id": channel_id,
+            "content": content,
+            "timestamp": datetime.now(pytz.utc).isoformat(),
+            "author": {"id": str(abs(hash(username)) % 10 ** 18), "username": username},
+        }
+        await self._dispatch("MESSAGE_CREATE", message)
+        return message
+
+    async def drop_connections(self):
+        """Simulate a network drop: close every socket without ending the session"""
+        for ws in list(self._sockets):
+            await ws.close(code=4000)
+
+    async def request_reconnect(self):
+        for ws in list(self._sockets):
+            await ws.send_json({"op": OP_RECONNECT, "d": None})
+
+    async def invalidate_session(self):
+        self._session_id = None
+        for ws in list(self._sockets):
+            await ws.send_json({"op": OP_INVALID_SESSION, "d": False})
+
+    async def _dispatch(self, event_type: str, data: Dict[str, Any]):
+        self.seq += 1
+        payload = {"op": OP_DISPATCH, "t": event_type, "s": self.seq, "d": data}
+        self._events.append(payload)
+        for ws in list(self._sockets):
+            if not ws.closed:
+                await ws.send_json(payload)
+
+    async def _handle_socket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"op": OP_HELLO, "d": {"heartbeat_interval": self.heartbeat_interval_ms}})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(msg.data)
+            op = payload.get("op")
+            if op == OP_HEARTBEAT:
+                await ws.send_json({"op": OP_HEARTBEAT_ACK})
+            elif op == OP_IDENTIFY:
+                self.identifies += 1
+                self._session_id = uuid.uuid4().hex
+                self._sockets.append(ws)
+                await self._dispatch("READY", {"session_id": self._session_id, "resume_gateway_url": self.url})
+            elif op == OP_RESUME:
+                data = payload.get("d") or {}
+                if data.get("session_id") != self._session_id:
+                    await ws.send_json({"op": OP_INVALID_SESSION, "d": False})
+                    continue
+                self.resumes += 1
+                for event in self._events:
+                    if event["s"] > (data.get("seq") or 0):
+                        await ws.send_json(event)
+                self._sockets.append(ws)
+                await self._dispatch("RESUMED", {})
+
+        if ws in self._sockets:
+            self._sockets.remove(ws)
+        return ws
+
+
+async def main(port: int, channel_id: str, interval: float):
+    gateway = FakeGateway(port=port)
+    await gateway.start()
+    print(f"🧪 Fake gateway listening on {gateway.url}")
+    print(f"   Run: python discord_gateway.py --gateway-url {gateway.url} --channels {channel_id} --no-catch-up")
+    users = ["alice", "bob", "carol"]
+    count = 0
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            count += 1
+            await gateway.dispatch_message(channel_id, random.choice(SAMPLE_MESSAGES), random.choice(users))
+            # Periodically exercise the reconnect/resume path
+            if count % 20 == 0:
+                print("🔌 Dropping connections")
+                await gateway.drop_connections()
+    finally:
+        await gateway.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Discord gateway")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--channel", default="1")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between generated messages")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.port, args.channel, args.interval))
+    except KeyboardInterrupt:
+        pass
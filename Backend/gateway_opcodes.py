@@ -0,0 +1,19 @@
+# Discord gateway protocol constants, kept free of imports so the fake
+# gateway and tests can use them without loading the scraper
+
+# Gateway opcodes
+OP_DISPATCH = 0
+OP_HEARTBEAT = 1
+OP_IDENTIFY = 2
+OP_RESUME = 6
+OP_RECONNECT = 7
+OP_INVALID_SESSION = 9
+OP_HELLO = 10
+OP_HEARTBEAT_ACK = 11
+
+# Close codes after which the session can't be resumed, or we must stop entirely
+NEW_SESSION_CLOSE_CODES = {4007, 4009}
+FATAL_CLOSE_CODES = {4004, 4010, 4011, 4012, 4013, 4014}
+
+# Closing with a 4xxx code keeps the session resumable (1000/1001 would end it)
+RESUMABLE_CLOSE = 4000
@@ -1,45 +1,24 @@
 import os
-import praw
-import google.generativeai as genai
+import json
+import asyncio
 from dotenv import load_dotenv
 from datetime import datetime
+from llm_scheduler import PRIORITY_BACKGROUND
+from gemini_models import model_registry
+from llm_json import salvage_array
+from reddit_harvester import collect
 
 # Load environment variables
 load_dotenv(dotenv_path="/env/.env")
 
-# Reddit setup
-reddit = praw.Reddit(
-    client_id=os.getenv("REDDIT_CLIENT_ID"),
-    client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-    user_agent=os.getenv("REDDIT_USER_AGENT")
-)
-
-# Gemini setup
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-pro")
-
 
 def fetch_reddit_comments(ticker: str, count: int = 5):
-    subreddit = reddit.subreddit("wallstreetbets")
-    posts = subreddit.search(ticker, sort="new", limit=count)
-    comments_data = []
-
-    for post in posts:
-        post.comments.replace_more(limit=0)
-        for comment in post.comments:
-            if (
-                comment.author
-                and comment.author.name.lower() != "visualmod"
-                and len(comment.body.strip()) > 20
-                and ticker.upper() in comment.body.upper()
-            ):
-                comments_data.append({
-                    "content": comment.body.strip(),
-                    "url": f"https://reddit.com{post.permalink}"
-                })
-                break  # one per post
-
-    return comments_data
+    # One sweep over the newest `count` posts; comment trees are fetched concurrently
+    matches = asyncio.run(collect("wallstreetbets", [ticker], posts_per_query=count))
+    return [{
+        "content": match["comment"]["body"].strip(),
+        "url": f"https://reddit.com{match['post']['permalink']}"
+    } for match in matches]
 
 
 def analyze_with_gemini(comments):
@@ -61,8 +40,10 @@ Comments:
 {[c['content'] for c in comments]}
 """
 
-    response = model.generate_content(input_for_gemini)
-    return response.text  # this will be a JSON list
+    response = model_registry.generate(input_for_gemini, priority=PRIORITY_BACKGROUND,
+                                       stage="geminiFunc.reddit")
+    # Keep every complete item even if the list was cut off mid-way
+    return salvage_array(response.text)
 
 
 # 🔄 Put it all together
@@ -72,4 +53,4 @@ if __name__ == "__main__":
         print("No relevant comments found.")
     else:
         analyzed = analyze_with_gemini(raw_comments)
-        print(analyzed)
\ No newline at end of file
+        print(json.dumps(analyzed, indent=2))
\ No newline at end of file
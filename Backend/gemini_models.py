@@ -0,0 +1,217 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+from llm_scheduler import (
+    gemini_scheduler, estimate_tokens, is_quota_error,
+    DEFAULT_OUTPUT_TOKENS, PRIORITY_BACKGROUND,
+)
+from llm_metrics import llm_metrics, usage_tokens
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+logger = logging.getLogger(__name__)
+
+# Preference order, flash first as it's cheaper
+MODEL_CANDIDATES = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-pro", "gemini-1.0-pro"]
+
+# Errors that mean the model itself is unusable for this key, not a transient blip
+_UNAVAILABLE_ERRORS = ("NotFound", "PermissionDenied", "InvalidArgument")
+
+
+class _Consumed:
+    """A response read inside the scheduler job: what `consume` returned, plus the usage it reported"""
+
+    def __init__(self, value: Any, response: Any):
+        self.value = value
+        try:
+            self.usage_metadata = response.usage_metadata
+        except Exception:
+            # A stream stopped early may not have reported usage yet
+            self.usage_metadata = None
+
+
+class ModelRegistry:
+    """
+    Resolves a working Gemini model once per process and reuses it.
+
+    Constructing a GenerativeModel never talks to the API, so the old
+    try/except chains around the constructor could not actually fall back.
+    Here a model is only switched out after real generate_content failures:
+    immediately if the API says the model is unavailable, otherwise after
+    `failure_threshold` consecutive errors, and the preferred model is
+    retried once `cooldown_seconds` have passed.
+    """
+
+    def __init__(self, candidates: Optional[List[str]] = None,
+                 failure_threshold: int = 3, cooldown_seconds: float = 300.0):
+        self.candidates = list(candidates or MODEL_CANDIDATES)
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        self._lock = threading.Lock()
+        self._configured = False
+        self._models: Dict[str, Any] = {}
+        self._failures: Dict[str, int] = {name: 0 for name in self.candidates}
+        self._disabled_until: Dict[str, float] = {name: 0.0 for name in self.candidates}
+        self._active: Optional[str] = None
+
+        # Overhead measurements
+        self._construct_seconds: Dict[str, float] = {}
+        self._reuses: Dict[str, int] = {name: 0 for name in self.candidates}
+        self._switches = 0
+
+    def _configure(self):
+        if self._configured:
+            return
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY is not set or could not be loaded from .env")
+        genai.configure(api_key=api_key)
+        self._configured = True
+
+    def get_model(self) -> Tuple[str, Any]:
+        """Return (name, model) for the first healthy candidate, building it once"""
+        with self._lock:
+            self._configure()
+            now = time.monotonic()
+            for name in self.candidates:
+                if self._disabled_until[name] > now:
+                    continue
+                model = self._models.get(name)
+                if model is None:
+                    start = time.perf_counter()
+                    model = genai.GenerativeModel(name)
+                    self._construct_seconds[name] = time.perf_counter() - start
+                    self._models[name] = model
+                else:
+                    self._reuses[name] += 1
+                if self._active != name:
+                    if self._active is not None:
+                        self._switches += 1
+                    logger.info(f"Using {name} model")
+                    self._active = name
+                return name, model
+        raise RuntimeError("No Gemini model is currently available (all candidates cooling down)")
+
+    def generate(self, prompt: str, priority: int = PRIORITY_BACKGROUND,
+                 stage: str = "default", consume: Optional[Callable[[Any], Any]] = None, **kwargs) -> Any:
+        """
+        Run a prompt on the active model through the shared scheduler.
+
+        With `consume`, the response (usually a stream=True one) is handed to
+        it inside the scheduled job and its return value is returned instead,
+        so errors raised while reading the stream are requeued or fail over
+        like any other, and the TPM reservation is settled from the usage the
+        stream reported.
+        """
+        tried = set()
+        while True:
+            name, model = self.get_model()
+            if name in tried:
+                raise RuntimeError(f"No Gemini model could serve the request (tried {sorted(tried)})")
+            tried.add(name)
+            timing = {}
+
+            def run():
+                # Timed inside the scheduler so queue wait isn't counted as API latency
+                start = time.perf_counter()
+                try:
+                    response = model.generate_content(prompt, **kwargs)
+                    if consume is None:
+                        return response
+                    return _Consumed(consume(response), response)
+                finally:
+                    timing["latency"] = time.perf_counter() - start
+
+            try:
+                response = gemini_scheduler.call(
+                    run, priority=priority, stage=stage,
+                    tokens=estimate_tokens(prompt) + DEFAULT_OUTPUT_TOKENS,
+                )
+            except Exception as e:
+                llm_metrics.record_call(stage, name, "error", timing.get("latency", 0.0))
+                if self._record_failure(name, e):
+                    continue  # model unusable, retry on the next candidate
+                raise
+            self._record_success(name)
+            llm_metrics.record_call(stage, name, "success", timing["latency"], *usage_tokens(response))
+            return response.value if consume is not None else response
+
+    def _record_success(self, name: str):
+        with self._lock:
+            self._failures[name] = 0
+
+    def _record_failure(self, name: str, exc: Exception) -> bool:
+        """Update health after a failed call; True if the caller should try the next model"""
+        with self._lock:
+            if type(exc).__name__ in _UNAVAILABLE_ERRORS:
+                self._disabled_until[name] = time.monotonic() + self.cooldown_seconds
+                logger.warning(f"{name} unavailable ({exc}), switching model")
+                return True
+            if is_quota_error(exc):
+                # The scheduler already retried; quota is per model so try another one
+                self._disabled_until[name] = time.monotonic() + self.cooldown_seconds
+                logger.warning(f"{name} quota exhausted, switching model for {self.cooldown_seconds:.0f}s")
+                return True
+            self._failures[name] += 1
+            if self._failures[name] >= self.failure_threshold:
+                self._disabled_until[name] = time.monotonic() + self.cooldown_seconds
+                self._failures[name] = 0
+                logger.warning(f"{name} failed {self.failure_threshold} times in a row, switching model")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Active model, health and the construction overhead saved by reuse"""
+        with self._lock:
+            now = time.monotonic()
+            saved = sum(self._construct_seconds.get(name, 0.0) * count
+                        for name, count in self._reuses.items())
+            return {
+                "active_model": self._active,
+                "model_switches": self._switches,
+                "models": {
+                    name: {
+                        "built": name in self._models,
+                        "construct_ms": round(self._construct_seconds.get(name, 0.0) * 1000, 3),
+                        "reuses": self._reuses[name],
+                        "consecutive_failures": self._failures[name],
+                        "cooling_down_seconds": round(max(0.0, self._disabled_until[name] - now), 1),
+                    }
+                    for name in self.candidates
+                },
+                "overhead_saved_ms": round(saved * 1000, 3),
+            }
+
+
+# Global registry instance shared by every module in the process
+model_registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    # Measure what rebuilding the model on every call used to cost
+    runs = 200
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY") or "benchmark")
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        genai.GenerativeModel(MODEL_CANDIDATES[0])
+    per_build = (time.perf_counter() - start) / runs
+
+    registry = ModelRegistry()
+    registry._configured = True
+    registry.get_model()
+    start = time.perf_counter()
+    for _ in range(runs):
+        registry.get_model()
+    per_lookup = (time.perf_counter() - start) / runs
+
+    print(f"🔧 New GenerativeModel per call: {per_build * 1e6:.1f} µs")
+    print(f"♻️  Cached registry lookup:       {per_lookup * 1e6:.1f} µs")
+    print(f"💡 Saved per call:               {(per_build - per_lookup) * 1e6:.1f} µs")
@@ -0,0 +1,124 @@
+import os
+import threading
+from typing import Any, Dict, List, NamedTuple
+
+from dotenv import load_dotenv
+
+from llm_scheduler import estimate_tokens, DEFAULT_OUTPUT_TOKENS
+from ticker_matcher import ticker_matcher, TickerMatcher
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Minimum relevance score for a group to be sent to Gemini. 1 analyzes every
+# group with at least one stock-related message (nothing stored loses its
+# analysis); 2 also skips groups whose only signal is a single keyword.
+LLM_MIN_GROUP_SCORE = float(os.getenv("LLM_MIN_GROUP_SCORE", "1"))
+
+# Score per distinct ticker in a group, and per stock message matched only by keywords
+TICKER_WEIGHT = 2.0
+KEYWORD_WEIGHT = 1.0
+
+
+class GroupDecision(NamedTuple):
+    analyze: bool
+    score: float
+    stock_messages: int
+    tickers: List[str]
+
+
+def skipped_analysis(decision: GroupDecision) -> Dict[str, Any]:
+    """Analysis stored for stock messages in groups that scored too low for an LLM call"""
+    return {
+        "has_trade_info": False,
+        "tickers": decision.tickers,
+        "sentiment": "neutral",
+        "action": "none",
+        "confidence": 0,
+        "summary": "",
+        "analysis_skipped": "low_relevance",
+    }
+
+
+class GroupFilter:
+    """
+    Decides which author groups are worth a Gemini call.
+
+    Runs the stock matcher over a group before analysis: groups without any
+    stock-related message are dropped outright (none of their messages would
+    be stored), and groups scoring below `min_score` are stored without an
+    LLM call. Counts what was skipped so each run can report the calls and
+    tokens saved.
+    """
+
+    def __init__(self, matcher: TickerMatcher = ticker_matcher, min_score: float = LLM_MIN_GROUP_SCORE):
+        self.matcher = matcher
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.groups = 0
+            self.analyzed = 0
+            self.skipped_no_stock = 0
+            self.skipped_low_score = 0
+            self.messages_not_analyzed = 0
+            self.tokens_saved = 0
+
+    def score(self, group: List[Dict[str, Any]]) -> GroupDecision:
+        stock_messages = 0
+        keyword_only = 0
+        tickers: List[str] = []
+        for msg in group:
+            is_stock, found = self.matcher.match_message(msg)
+            if not is_stock:
+                continue
+            stock_messages += 1
+            if not found:
+                keyword_only += 1
+            tickers.extend(t for t in found if t not in tickers)
+        score = TICKER_WEIGHT * len(tickers) + KEYWORD_WEIGHT * keyword_only
+        return GroupDecision(stock_messages > 0 and score >= self.min_score, score, stock_messages, tickers)
+
+    def evaluate(self, group: List[Dict[str, Any]]) -> GroupDecision:
+        """Score a group and count the decision"""
+        decision = self.score(group)
+        with self._lock:
+            self.groups += 1
+            if decision.analyze:
+                self.analyzed += 1
+                return decision
+            if decision.stock_messages:
+                self.skipped_low_score += 1
+            else:
+                self.skipped_no_stock += 1
+            self.messages_not_analyzed += len(group)
+            # Same prompt size analyze_with_context would have sent (last 10 messages)
+            text = " ".join(str(msg.get('content', '')) for msg in group[-10:])
+            self.tokens_saved += estimate_tokens(text) + DEFAULT_OUTPUT_TOKENS
+        return decision
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = self.skipped_no_stock + self.skipped_low_score
+            return {
+                "groups": self.groups,
+                "llm_calls": self.analyzed,
+                "llm_calls_saved": saved,
+                "skipped_no_stock": self.skipped_no_stock,
+                "skipped_low_score": self.skipped_low_score,
+                "messages_not_analyzed": self.messages_not_analyzed,
+                "est_tokens_saved": self.tokens_saved,
+                "saved_pct": round(100.0 * saved / self.groups, 1) if self.groups else 0.0,
+            }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"🧮 LLM pre-filter: {s['llm_calls']} of {s['groups']} groups analyzed, "
+                f"{s['llm_calls_saved']} calls saved ({s['saved_pct']}%: {s['skipped_no_stock']} no stock content, "
+                f"{s['skipped_low_score']} below score {self.min_score:g}), ~{s['est_tokens_saved']:,} tokens")
+
+
+# Global filter instance, reports cover the whole process run
+group_filter = GroupFilter()
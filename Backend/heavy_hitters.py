@@ -0,0 +1,256 @@
+import os
+import math
+import time
+import heapq
+import random
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pytz
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+HEAVY_HITTERS_COLLECTION = "heavy_hitters"
+
+# Counters kept per window; top-K answers are reliable for K well below this
+HEAVY_HITTERS_CAPACITY = int(os.getenv("HEAVY_HITTERS_CAPACITY", "500"))
+HEAVY_HITTERS_SNAPSHOT_SECONDS = float(os.getenv("HEAVY_HITTERS_SNAPSHOT_SECONDS", "60"))
+
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+
+# Events older than this many windows add (almost) nothing and are skipped
+_MAX_AGE_WINDOWS = 10
+# Fold the decay into the stored counts before exp() gets large
+_RENORMALIZE_EXPONENT = 50
+
+
+def _epoch(ts: Optional[datetime]) -> float:
+    if ts is None:
+        return time.time()
+    if ts.tzinfo is None:
+        ts = pytz.utc.localize(ts)
+    return ts.timestamp()
+
+
+class DecayedSpaceSaving:
+    """
+    Space-Saving top-K counter over an exponentially decayed stream.
+
+    At most `capacity` items are counted. When a new item arrives and the
+    table is full it takes over the smallest counter (count = min + weight,
+    error = min), so any item whose true count exceeds the minimum is
+    guaranteed to be in the table and counts are over-estimated by at most
+    `error`.
+
+    Each event's weight decays as exp(-age / window), a smooth stand-in for
+    a sliding window of that length. Weights are stored relative to a
+    reference time `t0` (weight = exp((t - t0) / window)), so an update never
+    has to touch the other counters; reads scale by exp(-(now - t0) / window).
+    Since every counter decays by the same factor the ranking only changes
+    on updates, and top() serves a cached sorted list between them.
+    """
+
+    def __init__(self, window_seconds: float, capacity: int = HEAVY_HITTERS_CAPACITY):
+        self.window = float(window_seconds)
+        self.capacity = capacity
+        self.t0 = time.time()
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._ranked: Optional[List[Tuple[str, float, float]]] = None
+
+    def add(self, item: str, at: Optional[float] = None, weight: float = 1.0):
+        at = time.time() if at is None else at
+        exponent = (at - self.t0) / self.window
+        if exponent < -_MAX_AGE_WINDOWS:
+            return
+        if exponent > _RENORMALIZE_EXPONENT:
+            self._renormalize(at)
+            exponent = 0.0
+        weight *= math.exp(exponent)
+
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0.0
+        else:
+            floor, victim = self._pop_min()
+            del self.counts[victim]
+            del self.errors[victim]
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+        self._ranked = None
+
+    def _pop_min(self) -> Tuple[float, str]:
+        # The heap holds stale entries for counters that grew since; skip them
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def _rebuild_heap(self):
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _renormalize(self, at: float):
+        scale = math.exp(-(at - self.t0) / self.window)
+        self.counts = {item: count * scale for item, count in self.counts.items()}
+        self.errors = {item: error * scale for item, error in self.errors.items()}
+        self.t0 = at
+        self._rebuild_heap()
+        self._ranked = None
+
+    def top(self, k: int = 10, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """The k largest decayed counts as of `now`, with their maximum over-estimate"""
+        if self._ranked is None:
+            self._ranked = sorted(((item, count, self.errors[item]) for item, count in self.counts.items()),
+                                  key=lambda r: (-r[1], r[0]))
+        scale = math.exp(-((time.time() if now is None else now) - self.t0) / self.window)
+        return [{"item": item, "count": round(count * scale, 2), "error": round(error * scale, 2)}
+                for item, count, error in self._ranked[:k]]
+
+    def to_doc(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window,
+            "capacity": self.capacity,
+            "t0": self.t0,
+            "items": [{"item": item, "count": count, "error": self.errors[item]}
+                      for item, count in self.counts.items()],
+        }
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "DecayedSpaceSaving":
+        counter = cls(doc["window_seconds"], doc.get("capacity", HEAVY_HITTERS_CAPACITY))
+        counter.t0 = doc["t0"]
+        for row in doc.get("items", [])[:counter.capacity]:
+            counter.counts[row["item"]] = row["count"]
+            counter.errors[row["item"]] = row.get("error", 0.0)
+        counter._rebuild_heap()
+        return counter
+
+
+class HeavyHitterTracker:
+    """
+    Most mentioned tickers over the last 1h/24h/7d, updated as messages are stored.
+
+    record() takes newly inserted stock_messages documents (TickerRollups
+    feeds it from the message writer's after_flush) and adds each ticker
+    mention at the message's timestamp to one DecayedSpaceSaving per window.
+    top() is answered from memory. After restore(db) the counters are
+    snapshotted to MongoDB at most every HEAVY_HITTERS_SNAPSHOT_SECONDS
+    and on snapshot(), so a restarted ingestor resumes where it stopped.
+    Other processes (the API) only load() the latest snapshot and never
+    write one, so they can't overwrite the ingestor's counters.
+    """
+
+    def __init__(self, windows: Dict[str, float] = WINDOWS, capacity: int = HEAVY_HITTERS_CAPACITY,
+                 snapshot_seconds: float = HEAVY_HITTERS_SNAPSHOT_SECONDS):
+        self.windows = dict(windows)
+        self.capacity = capacity
+        self.snapshot_seconds = snapshot_seconds
+        self.counters = {name: DecayedSpaceSaving(seconds, capacity) for name, seconds in self.windows.items()}
+        self._lock = threading.Lock()
+        self._collection = None
+        self._last_snapshot = time.monotonic()
+        # When the counters in memory were last written to (or loaded from) MongoDB
+        self.saved_at: Optional[datetime] = None
+        self.recorded = 0
+        self.snapshots = 0
+
+    def record(self, docs: Iterable[Dict[str, Any]]):
+        with self._lock:
+            for doc in docs:
+                at = _epoch(doc.get("timestamp"))
+                for ticker in dict.fromkeys(doc.get("tickers_mentioned") or []):
+                    for counter in self.counters.values():
+                        counter.add(ticker, at)
+                self.recorded += 1
+        if self._collection is not None and time.monotonic() - self._last_snapshot >= self.snapshot_seconds:
+            self.snapshot()
+
+    def top(self, window: str = "24h", k: int = 10) -> List[Dict[str, Any]]:
+        if window not in self.counters:
+            raise ValueError(f"Unknown window {window!r}, expected one of {list(self.counters)}")
+        with self._lock:
+            return self.counters[window].top(k)
+
+    def load(self, db) -> int:
+        """Replace the counters with the last snapshot in `db` (read-only); returns the windows loaded"""
+        loaded = 0
+        with self._lock:
+            for doc in db[HEAVY_HITTERS_COLLECTION].find({"_id": {"$in": list(self.windows)}}):
+                if doc["_id"] in self.windows and doc.get("window_seconds") == self.windows[doc["_id"]]:
+                    self.counters[doc["_id"]] = DecayedSpaceSaving.from_doc(doc)
+                    loaded += 1
+                    saved_at = doc.get("saved_at")
+                    if saved_at is not None:
+                        # pymongo returns naive UTC datetimes
+                        saved_at = saved_at if saved_at.tzinfo else pytz.utc.localize(saved_at)
+                        self.saved_at = max(self.saved_at, saved_at) if self.saved_at else saved_at
+        return loaded
+
+    def restore(self, db) -> int:
+        """Load the last snapshot and snapshot to `db` from now on (ingest processes only)"""
+        restored = self.load(db)
+        with self._lock:
+            self._collection = db[HEAVY_HITTERS_COLLECTION]
+        return restored
+
+    def snapshot(self):
+        if self._collection is None:
+            return
+        with self._lock:
+            docs = {name: counter.to_doc() for name, counter in self.counters.items()}
+            self._last_snapshot = time.monotonic()
+        saved_at = datetime.now(pytz.utc)
+        for name, doc in docs.items():
+            self._collection.replace_one({"_id": name}, {**doc, "saved_at": saved_at}, upsert=True)
+        self.saved_at = saved_at
+        self.snapshots += 1
+
+
+# Global tracker; ingest processes restore() it against their database on startup
+heavy_hitters = HeavyHitterTracker()
+
+
+def _benchmark(events: int, tickers: int, capacity: int):
+    """Compare Space-Saving top-10 against exact counts on a Zipf-like stream"""
+    weights = [1.0 / (rank + 1) for rank in range(tickers)]
+    names = [f"$T{rank}" for rank in range(tickers)]
+    stream = random.choices(names, weights=weights, k=events)
+    now = time.time()
+
+    counter = DecayedSpaceSaving(window_seconds=10 * 365 * 86400, capacity=capacity)  # ~no decay
+    start = time.perf_counter()
+    for item in stream:
+        counter.add(item, now)
+    add_us = (time.perf_counter() - start) / events * 1e6
+    start = time.perf_counter()
+    for _ in range(1000):
+        top = counter.top(10, now)
+    top_us = (time.perf_counter() - start) / 1000 * 1e6
+
+    exact = [item for item, _ in Counter(stream).most_common(10)]
+    found = [row["item"] for row in top]
+    print(f"📊 {events:,} mentions of {tickers:,} tickers, capacity {capacity}")
+    print(f"  add: {add_us:.2f}us/event, top-10: {top_us:.2f}us/query")
+    print(f"  top-10 overlap with exact counts: {len(set(found) & set(exact))}/10, "
+          f"max error {max(row['error'] for row in top):.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the heavy-hitters counter")
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--tickers", type=int, default=5000)
+    parser.add_argument("--capacity", type=int, default=HEAVY_HITTERS_CAPACITY)
+    args = parser.parse_args()
+    _benchmark(args.events, args.tickers, args.capacity)
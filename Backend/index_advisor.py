@@ -0,0 +1,330 @@
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import pytz
+from dotenv import load_dotenv
+from pymongo.errors import OperationFailure
+
+from mongo import get_db, _percentile
+from analysis_store import ANALYSES_COLLECTION, STATUS_PROPER, STATUS_FALLBACK
+from check_analysis import coverage_pipeline
+from ticker_rollups import ROLLUPS_COLLECTION, ALL_TICKERS
+from trending import TRENDING_TOPIC_SCAN_LIMIT
+from message_search import TEXT_INDEX_NAME, SEARCH_LANGUAGE, search_filter
+from message_writer import DISCORD_ID_FILTER, DISCORD_ID_INDEX
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+PROFILES_COLLECTION = "query_profiles"
+
+# A plan reading more than this many documents per result (and at least
+# MIN_EXAMINED) is flagged even when it uses an index
+EXAMINED_RATIO_LIMIT = 10
+MIN_EXAMINED = 100
+
+Index = List[Tuple[str, Any]]  # direction is 1, -1 or "text"
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    # sample document -> find/aggregate command, as sent to the server
+    build: Callable[[Dict[str, Any]], Dict[str, Any]]
+    index: Index
+    source: str
+    index_options: Dict[str, Any] = {}
+
+
+def _find(collection: str, filter: Dict[str, Any], sort: Optional[Dict[str, int]] = None,
+          limit: int = 0) -> Dict[str, Any]:
+    command: Dict[str, Any] = {"find": collection, "filter": filter}
+    if sort:
+        command["sort"] = sort
+    if limit:
+        command["limit"] = limit
+    return command
+
+
+def _aggregate(collection: str, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+
+
+def _ago(**kwargs) -> datetime:
+    return datetime.now(pytz.utc) - timedelta(**kwargs)
+
+
+def _ticker(sample: Dict[str, Any]) -> str:
+    return (sample.get("tickers_mentioned") or ["$AAPL"])[0]
+
+
+# Every query the ingest, sync, report and API code issues repeatedly, with
+# the index that should serve it. One-off scans (migrations, backfills,
+# whole-collection summaries) are left out.
+QUERY_SHAPES = [
+    QueryShape("message upsert by discord_id", "stock_messages",
+               lambda s: _find("stock_messages", {"discord_id": s.get("discord_id")}),
+               [("discord_id", 1)], "message_writer.BufferedMessageWriter.flush",
+               {"unique": True, "name": DISCORD_ID_INDEX, "partialFilterExpression": DISCORD_ID_FILTER}),
+    QueryShape("newest message in channel", "stock_messages",
+               lambda s: _find("stock_messages", {"channel_id": s.get("channel_id")}, {"timestamp": -1}, 1),
+               [("channel_id", 1), ("timestamp", -1)], "discord_scraper.run_incremental"),
+    QueryShape("changed proper analyses", "stock_messages",
+               lambda s: _find("stock_messages", {"updated_at": {"$gt": _ago(hours=1)},
+                                                  "analysis_status": STATUS_PROPER}),
+               [("updated_at", 1)], "create_analyzed_collection.sync_analyzed_messages",
+               {"name": "proper_by_updated_at", "partialFilterExpression": {"analysis_status": STATUS_PROPER}}),
+    QueryShape("changed non-proper analyses", "stock_messages",
+               lambda s: _find("stock_messages", {"updated_at": {"$gt": _ago(hours=1)},
+                                                  "analysis_status": {"$ne": STATUS_PROPER}}),
+               [("updated_at", 1)], "create_analyzed_collection.sync_analyzed_messages"),
+    QueryShape("coverage status counts", "stock_messages",
+               lambda s: _aggregate("stock_messages", coverage_pipeline(_ago(days=1))),
+               [("analysis_status", 1), ("created_at", 1)], "check_analysis.coverage_report"),
+    QueryShape("newest proper example", "stock_messages",
+               lambda s: _find("stock_messages", {"analysis_status": STATUS_PROPER}, {"updated_at": -1}, 1),
+               [("updated_at", 1)], "check_analysis.coverage_report",
+               {"name": "proper_by_updated_at", "partialFilterExpression": {"analysis_status": STATUS_PROPER}}),
+    QueryShape("newest fallback example", "stock_messages",
+               lambda s: _find("stock_messages", {"analysis_status": STATUS_FALLBACK}, {"created_at": -1}, 1),
+               [("created_at", -1)], "check_analysis.coverage_report",
+               {"name": "fallback_by_created_at", "partialFilterExpression": {"analysis_status": STATUS_FALLBACK}}),
+    QueryShape("trending topic scan", "stock_messages",
+               lambda s: _find("stock_messages", {"timestamp": {"$gte": _ago(hours=24)}}, {"timestamp": -1},
+                               TRENDING_TOPIC_SCAN_LIMIT),
+               [("timestamp", 1)], "trending.TrendingCache._scan_topics"),
+    QueryShape("recent posts for ticker", "stock_messages",
+               lambda s: _find("stock_messages", {"tickers_mentioned": _ticker(s)}, {"timestamp": -1}, 5),
+               [("tickers_mentioned", 1), ("timestamp", -1)], "trending.TrendingCache._sentiment_payload"),
+    QueryShape("topics for ticker", "stock_messages",
+               lambda s: _find("stock_messages", {"tickers_mentioned": _ticker(s),
+                                                  "timestamp": {"$gte": _ago(days=7)}}, {"timestamp": -1}, 500),
+               [("tickers_mentioned", 1), ("timestamp", -1)], "trending.TrendingCache._ticker_topics"),
+    QueryShape("message search", "stock_messages",
+               lambda s: _find("stock_messages", search_filter("buy calls", ticker=_ticker(s))),
+               [("content", "text")], "message_search.search_messages",
+               {"name": TEXT_INDEX_NAME, "default_language": SEARCH_LANGUAGE}),
+    QueryShape("rollup window", ROLLUPS_COLLECTION,
+               lambda s: _aggregate(ROLLUPS_COLLECTION, [
+                   {"$match": {"hour": {"$gte": _ago(days=7)}, "ticker": {"$ne": ALL_TICKERS}}},
+                   {"$group": {"_id": "$ticker", "mentions": {"$sum": "$mentions"}}},
+               ]),
+               [("hour", 1), ("ticker", 1)], "ticker_rollups.TickerRollups.window"),
+    QueryShape("rollup hourly series", ROLLUPS_COLLECTION,
+               lambda s: _find(ROLLUPS_COLLECTION, {"ticker": _ticker(s), "hour": {"$gte": _ago(days=1)}},
+                               {"hour": 1}),
+               [("ticker", 1), ("hour", 1)], "ticker_rollups.TickerRollups.hourly"),
+    QueryShape("analyses by id", ANALYSES_COLLECTION,
+               lambda s: _find(ANALYSES_COLLECTION, {"_id": {"$in": [s.get("analysis_id")]}}),
+               [("_id", 1)], "analysis_store.AnalysisStore.get_many"),
+]
+
+
+def _walk(node: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def plan_summary(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Stages, indexes and work done by the winning plan of an explain() result"""
+    stages: List[str] = []
+    indexes: List[str] = []
+    for node in _walk(explain):
+        if "winningPlan" in node:
+            for step in _walk(node["winningPlan"]):
+                if "stage" in step:
+                    stages.append(step["stage"])
+                if "indexName" in step:
+                    indexes.append(step["indexName"])
+    stats = next((node["executionStats"] for node in _walk(explain) if "executionStats" in node), {})
+    summary = {
+        "stages": stages,
+        "indexes": sorted(set(indexes)),
+        "docs_examined": stats.get("totalDocsExamined", 0),
+        "keys_examined": stats.get("totalKeysExamined", 0),
+        "returned": stats.get("nReturned", 0),
+        "server_ms": stats.get("executionTimeMillis", 0),
+    }
+    flags = []
+    if "COLLSCAN" in stages:
+        flags.append("COLLSCAN")
+    if "SORT" in stages:
+        flags.append("in-memory SORT")
+    if summary["docs_examined"] >= MIN_EXAMINED and \
+            summary["docs_examined"] > EXAMINED_RATIO_LIMIT * max(summary["returned"], 1):
+        flags.append(f"examined {summary['docs_examined']} docs for {summary['returned']}")
+    summary["flags"] = flags
+    return summary
+
+
+def explain(db, command: Dict[str, Any]) -> Dict[str, Any]:
+    return db.command({"explain": command, "verbosity": "executionStats"})
+
+
+def run_command(db, command: Dict[str, Any]) -> int:
+    """Run a find/aggregate command to completion (all batches); returns the document count"""
+    collection = db[command.get("find") or command["aggregate"]]
+    if "find" in command:
+        cursor = collection.find(command["filter"], sort=list(command.get("sort", {}).items()) or None,
+                                 limit=command.get("limit", 0))
+    else:
+        cursor = collection.aggregate(command["pipeline"], allowDiskUse=True)
+    return sum(1 for _ in cursor)
+
+
+def _key_spec(info: Dict[str, Any]) -> Index:
+    """Index keys as passed to create_index; text indexes report their fields in `weights`"""
+    if "weights" in info:
+        return [(field, "text") for field in sorted(info["weights"])]
+    return [(field, int(direction)) for field, direction in info["key"]]
+
+
+def _index_matches(info: Dict[str, Any], keys: Index, options: Dict[str, Any]) -> bool:
+    if _key_spec(info) != keys:
+        return False
+    return info.get("partialFilterExpression") == options.get("partialFilterExpression")
+
+
+def has_index(db, collection: str, keys: Index, options: Dict[str, Any]) -> bool:
+    if keys == [("_id", 1)]:
+        return True
+    return any(_index_matches(info, keys, options) for info in db[collection].index_information().values())
+
+
+def index_usage(db, collection: str) -> List[Dict[str, Any]]:
+    """$indexStats for a collection (access counts since the server or index started)"""
+    try:
+        return list(db[collection].aggregate([{"$indexStats": {}}]))
+    except OperationFailure:
+        return []
+
+
+def unused_and_redundant(db, collections: List[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Indexes nothing has used and indexes another one makes redundant.
+
+    Unused: zero accesses in $indexStats and not the index of any known
+    query shape (those may just not have run since the last restart).
+    Redundant: a plain index whose keys are a prefix of another index's
+    keys, which can serve the same queries.
+    """
+    wanted = {(shape.collection, tuple(shape.index)) for shape in QUERY_SHAPES}
+    unused, redundant = [], []
+    for collection in collections:
+        info = db[collection].index_information()
+        for stat in index_usage(db, collection):
+            name = stat["name"]
+            if name == "_id_" or name not in info or info[name].get("unique") or \
+                    (collection, tuple(_key_spec(info[name]))) in wanted:
+                continue
+            if stat.get("accesses", {}).get("ops", 0) == 0:
+                unused.append({"collection": collection, "index": name,
+                               "since": stat.get("accesses", {}).get("since")})
+        plain = {name: _key_spec(idx) for name, idx in info.items()
+                 if name != "_id_" and not idx.get("unique") and not idx.get("partialFilterExpression")
+                 and not idx.get("sparse") and "weights" not in idx}
+        for name, keys in plain.items():
+            for other, other_keys in plain.items():
+                if other != name and len(keys) < len(other_keys) and other_keys[:len(keys)] == keys:
+                    redundant.append({"collection": collection, "index": name, "covered_by": other})
+                    break
+    return unused, redundant
+
+
+def profile(db, runs: int = 20, apply: bool = False, shapes: List[QueryShape] = QUERY_SHAPES) -> Dict[str, Any]:
+    """
+    Explain and time every query shape; recommend (or create) the indexes flagged plans need.
+
+    Each shape is explained with executionStats and then run `runs` times
+    against real data (the newest stored message supplies ids and tickers)
+    for p50/p95/max latency.
+    """
+    sample = db["stock_messages"].find_one({"tickers_mentioned.0": {"$exists": True}},
+                                           sort=[("_id", -1)]) or {}
+    results, recommendations = [], []
+    for shape in shapes:
+        command = shape.build(sample)
+        row: Dict[str, Any] = {"name": shape.name, "collection": shape.collection, "source": shape.source}
+        try:
+            row.update(plan_summary(explain(db, command)))
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                run_command(db, command)
+                timings.append((time.perf_counter() - started) * 1000)
+            row.update({"p50_ms": round(_percentile(timings, 0.50), 2),
+                        "p95_ms": round(_percentile(timings, 0.95), 2),
+                        "max_ms": round(max(timings), 2) if timings else 0.0})
+        except OperationFailure as e:
+            row["error"] = str(e)
+            results.append(row)
+            continue
+
+        missing = not has_index(db, shape.collection, shape.index, shape.index_options)
+        if missing:
+            row["flags"].append("recommended index missing")
+        if row["flags"] and missing:
+            recommendation = {"collection": shape.collection, "keys": shape.index, "options": shape.index_options,
+                              "for": shape.name, "created": False}
+            if recommendation not in recommendations:
+                if apply:
+                    db[shape.collection].create_index(shape.index, **shape.index_options)
+                    recommendation["created"] = True
+                recommendations.append(recommendation)
+        results.append(row)
+
+    collections = sorted({shape.collection for shape in shapes})
+    unused, redundant = unused_and_redundant(db, collections)
+    return {
+        "created_at": datetime.now(pytz.utc),
+        "runs": runs,
+        "shapes": results,
+        "recommendations": recommendations,
+        "unused_indexes": unused,
+        "redundant_indexes": redundant,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"🔍 Query shapes ({report['runs']} runs each)")
+    for row in report["shapes"]:
+        if "error" in row:
+            print(f"  ❌ {row['name']}: {row['error']}")
+            continue
+        icon = "⚠️ " if row["flags"] else "✅"
+        print(f"  {icon} {row['name']} [{row['collection']}] p50 {row['p50_ms']}ms p95 {row['p95_ms']}ms "
+              f"via {', '.join(row['indexes']) or 'no index'}"
+              f"{' - ' + '; '.join(row['flags']) if row['flags'] else ''}")
+    if report["recommendations"]:
+        print(f"\n💡 Recommended indexes:")
+        for rec in report["recommendations"]:
+            keys = ", ".join(f"{field}: {direction}" for field, direction in rec["keys"])
+            status = "created" if rec["created"] else "run with --apply to create"
+            print(f"  • {rec['collection']} {{{keys}}} for '{rec['for']}' ({status})")
+    for row in report["unused_indexes"]:
+        print(f"  🗑️  Unused: {row['collection']}.{row['index']} (no accesses since {row['since']})")
+    for row in report["redundant_indexes"]:
+        print(f"  ♻️  Redundant: {row['collection']}.{row['index']} is a prefix of {row['covered_by']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explain and time the queries the code issues; advise on indexes")
+    parser.add_argument("--runs", type=int, default=20, help="Timed executions per query shape")
+    parser.add_argument("--apply", action="store_true", help="Create the recommended indexes")
+    parser.add_argument("--no-save", action="store_true", help=f"Don't record the report in {PROFILES_COLLECTION}")
+    args = parser.parse_args()
+
+    db = get_db()
+    report = profile(db, runs=args.runs, apply=args.apply)
+    print_report(report)
+    if not args.no_save:
+        db[PROFILES_COLLECTION].insert_one(report)
+        print(f"\n📝 Report saved to {PROFILES_COLLECTION}")
@@ -0,0 +1,223 @@
+import re
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Marks a schema field that has no default and must be present
+REQUIRED = object()
+
+_JSON_START = re.compile(r"[\{\[]")
+
+
+class LLMJSONError(ValueError):
+    pass
+
+
+def extract_json(text: str) -> Any:
+    """
+    Return the first valid JSON object/array in an LLM response.
+
+    Handles markdown fences, leading/trailing prose and multiple JSON blobs
+    (the first one that parses wins).
+    """
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    decoder = json.JSONDecoder()
+    for match in _JSON_START.finditer(text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+            return value
+        except ValueError:
+            continue
+    raise LLMJSONError(f"No valid JSON object or array found in response: {text[:200]!r}")
+
+
+class StreamingJSONParser:
+    """
+    Incremental parser fed with response chunks as they arrive.
+
+    `feed()` returns the first complete top-level JSON value as soon as its
+    closing bracket is seen, so the caller can stop reading the stream. While
+    a top-level array is still open, every element that has fully arrived is
+    kept in `items`, which lets a truncated batch response be salvaged.
+    """
+
+    def __init__(self):
+        self.result: Any = None
+        self.done = False
+        self.items: List[Any] = []
+        self._reset()
+
+    def _reset(self):
+        self._text: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item_start: Optional[int] = None
+        self._root: Optional[str] = None
+        self.items = []
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        for ch in chunk:
+            if self.done:
+                break
+            if self._root is None:
+                if ch in "{[":
+                    self._root = ch
+                    self._text.append(ch)
+                    self._depth = 1
+                continue
+
+            self._text.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 1 and self._root == "[":
+                    self._item_start = len(self._text) - 1
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._root == "[" and self._item_start is not None:
+                    self._keep_item("".join(self._text[self._item_start:]))
+                    self._item_start = None
+                elif self._depth == 0:
+                    self._finish()
+        return self.result if self.done else None
+
+    def _keep_item(self, raw: str):
+        try:
+            self.items.append(json.loads(raw))
+        except ValueError:
+            pass
+
+    def _finish(self):
+        raw = "".join(self._text)
+        try:
+            self.result = json.loads(raw)
+            self.done = True
+        except ValueError:
+            # Bracketed prose like "[note]" before the real JSON; keep scanning
+            self._reset()
+
+
+def _chunk_text(chunk: Any) -> str:
+    if isinstance(chunk, str):
+        return chunk
+    try:
+        return chunk.text
+    except Exception:
+        # Gemini raises on .text for chunks without text parts (e.g. safety blocks)
+        return ""
+
+
+def parse_stream(chunks: Iterable[Any]) -> Any:
+    """
+    Parse the first JSON value out of a streamed response, stopping early.
+
+    Accepts raw strings or Gemini stream chunks. If the stream ends before a
+    top-level array is closed, the elements that did arrive are returned.
+    If the incremental scan never completes (e.g. a stray quote in prose
+    before the JSON left it inside a string), the whole text is searched
+    with extract_json instead.
+    """
+    parser = StreamingJSONParser()
+    received: List[str] = []
+    for chunk in chunks:
+        text = _chunk_text(chunk)
+        received.append(text)
+        result = parser.feed(text)
+        if parser.done:
+            return result
+    if parser.items:
+        return parser.items
+    try:
+        return extract_json("".join(received))
+    except LLMJSONError:
+        raise LLMJSONError("Stream ended before a complete JSON value was received")
+
+
+def salvage_array(text: str) -> List[Any]:
+    """Return every complete element of a (possibly truncated) JSON array response"""
+    parser = StreamingJSONParser()
+    parser.feed(text or "")
+    if parser.done:
+        return parser.result if isinstance(parser.result, list) else [parser.result]
+    if parser.items:
+        return parser.items
+    try:
+        value = extract_json(text)
+    except LLMJSONError:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _coerce(value: Any, expected: Tuple[type, ...]) -> Any:
+    if isinstance(value, bool) and bool not in expected:
+        raise TypeError
+    if isinstance(value, expected):
+        return value
+    if value is None and type(None) in expected:
+        return None
+    if isinstance(value, str):
+        stripped = value.strip()
+        if bool in expected and stripped.lower() in ("true", "false"):
+            return stripped.lower() == "true"
+        if int in expected and re.fullmatch(r"-?\d+", stripped):
+            return int(stripped)
+        if float in expected:
+            return float(stripped.rstrip("%"))
+        if list in expected:
+            return [stripped] if stripped else []
+    if str in expected and isinstance(value, (int, float)):
+        return str(value)
+    if float in expected and isinstance(value, int):
+        return float(value)
+    if int in expected and isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise TypeError
+
+
+def validate(value: Any, schema: Dict[str, Tuple[Any, Any]]) -> Dict[str, Any]:
+    """
+    Check a parsed response against `schema` and return a normalized copy.
+
+    `schema` maps field -> (type or tuple of types, default). Fields with a
+    REQUIRED default must be present and coercible; other missing or
+    mistyped fields fall back to their default. Unknown fields are kept.
+    """
+    if not isinstance(value, dict):
+        raise LLMJSONError(f"Expected a JSON object, got {type(value).__name__}")
+
+    result = dict(value)
+    for field, (types, default) in schema.items():
+        expected = types if isinstance(types, tuple) else (types,)
+        if field not in value:
+            if default is REQUIRED:
+                raise LLMJSONError(f"Missing required field '{field}'")
+            result[field] = default
+            continue
+        try:
+            result[field] = _coerce(value[field], expected)
+        except (TypeError, ValueError):
+            if default is REQUIRED:
+                raise LLMJSONError(f"Field '{field}' has unexpected type {type(value[field]).__name__}")
+            result[field] = default
+    return result
+
+
+def parse_llm_json(text: str, schema: Optional[Dict[str, Tuple[Any, Any]]] = None) -> Any:
+    """Extract the first JSON value from `text` and validate it if a schema is given"""
+    value = extract_json(text)
+    return validate(value, schema) if schema else value
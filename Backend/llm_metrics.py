@@ -0,0 +1,191 @@
+import os
+import json
+import bisect
+import argparse
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Every call is also appended here so the CLI report can summarize past runs.
+# Set LLM_METRICS_LOG to an empty string to disable.
+LLM_METRICS_LOG = os.getenv("LLM_METRICS_LOG", os.path.join(os.path.dirname(__file__), "logs", "llm_calls.jsonl"))
+
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+TOKEN_BUCKETS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        running = 0
+        result = []
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            running += count
+            result.append(("+Inf" if bound == float("inf") else f"{bound:g}", running))
+        return result
+
+
+def usage_tokens(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt_tokens, response_tokens) from a Gemini response, if it reports usage"""
+    try:
+        usage = response.usage_metadata
+        return int(usage.prompt_token_count or 0), int(usage.candidates_token_count or 0)
+    except Exception:
+        return None, None
+
+
+class LLMMetrics:
+    """Latency and token histograms for every LLM call, labelled by stage/model/outcome"""
+
+    def __init__(self, log_path: Optional[str] = LLM_METRICS_LOG):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._latency: Dict[Tuple[str, str, str], Histogram] = {}
+        self._prompt_tokens: Dict[Tuple[str, str], Histogram] = {}
+        self._response_tokens: Dict[Tuple[str, str], Histogram] = {}
+        self._fallbacks: Dict[Tuple[str, str], int] = {}
+
+    def record_call(self, stage: str, model: str, outcome: str, latency: float,
+                    prompt_tokens: Optional[int] = None, response_tokens: Optional[int] = None):
+        """Record one generate_content call (outcome: success | error)"""
+        with self._lock:
+            self._latency.setdefault((stage, model, outcome), Histogram(LATENCY_BUCKETS)).observe(latency)
+            if prompt_tokens is not None:
+                self._prompt_tokens.setdefault((stage, model), Histogram(TOKEN_BUCKETS)).observe(prompt_tokens)
+            if response_tokens is not None:
+                self._response_tokens.setdefault((stage, model), Histogram(TOKEN_BUCKETS)).observe(response_tokens)
+        self._log({
+            "event": "call", "stage": stage, "model": model, "outcome": outcome,
+            "latency": round(latency, 4), "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+        })
+
+    def record_fallback(self, stage: str, reason: str):
+        """Record that a caller gave up on the LLM result and used fallback data"""
+        with self._lock:
+            self._fallbacks[(stage, reason)] = self._fallbacks.get((stage, reason), 0) + 1
+        self._log({"event": "fallback", "stage": stage, "reason": reason})
+
+    def _log(self, event: Dict[str, Any]):
+        if not self.log_path:
+            return
+        event["ts"] = datetime.utcnow().isoformat()
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(event) + "\n")
+        except OSError:
+            pass  # metrics must never break the pipeline
+
+    def prometheus_text(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += ["# HELP llm_call_latency_seconds Gemini generate_content latency",
+                      "# TYPE llm_call_latency_seconds histogram"]
+            for (stage, model, outcome), hist in sorted(self._latency.items()):
+                labels = f'stage="{stage}",model="{model}",outcome="{outcome}"'
+                lines += _histogram_lines("llm_call_latency_seconds", labels, hist)
+
+            for name, series, help_text in (
+                ("llm_prompt_tokens", self._prompt_tokens, "Prompt tokens per call"),
+                ("llm_response_tokens", self._response_tokens, "Response tokens per call"),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (stage, model), hist in sorted(series.items()):
+                    lines += _histogram_lines(name, f'stage="{stage}",model="{model}"', hist)
+
+            lines += ["# HELP llm_fallbacks_total LLM results replaced by fallback data",
+                      "# TYPE llm_fallbacks_total counter"]
+            for (stage, reason), count in sorted(self._fallbacks.items()):
+                lines.append(f'llm_fallbacks_total{{stage="{stage}",reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name: str, labels: str, hist: Histogram) -> List[str]:
+    lines = [f'{name}_bucket{{{labels},le="{le}"}} {count}' for le, count in hist.cumulative()]
+    lines.append(f"{name}_sum{{{labels}}} {hist.total:g}")
+    lines.append(f"{name}_count{{{labels}}} {hist.count}")
+    return lines
+
+
+# Global metrics instance shared by every module in the process
+llm_metrics = LLMMetrics()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def report(log_path: str = LLM_METRICS_LOG, since_hours: Optional[float] = None):
+    """Print a per-stage summary of the calls recorded in the metrics log"""
+    if not log_path or not os.path.exists(log_path):
+        print(f"❌ No metrics log found at {log_path}")
+        return
+
+    cutoff = datetime.utcnow() - timedelta(hours=since_hours) if since_hours else None
+    stages: Dict[str, Dict[str, Any]] = {}
+    with open(log_path) as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if cutoff and datetime.fromisoformat(event["ts"]) < cutoff:
+                continue
+            s = stages.setdefault(event["stage"], {
+                "calls": 0, "errors": 0, "fallbacks": 0, "latencies": [],
+                "prompt_tokens": 0, "response_tokens": 0, "models": set(),
+            })
+            if event["event"] == "fallback":
+                s["fallbacks"] += 1
+                continue
+            s["calls"] += 1
+            s["errors"] += event["outcome"] != "success"
+            s["latencies"].append(event["latency"])
+            s["prompt_tokens"] += event.get("prompt_tokens") or 0
+            s["response_tokens"] += event.get("response_tokens") or 0
+            s["models"].add(event["model"])
+
+    print("🤖 LLM Usage Report" + (f" (last {since_hours:g}h)" if since_hours else ""))
+    print("=" * 50)
+    if not stages:
+        print("No calls recorded")
+        return
+    for stage, s in sorted(stages.items(), key=lambda item: -sum(item[1]["latencies"])):
+        calls = s["calls"]
+        print(f"\n📍 {stage} ({', '.join(sorted(s['models'])) or 'n/a'})")
+        print(f"  Calls: {calls}  Errors: {s['errors']}  Fallbacks: {s['fallbacks']}")
+        print(f"  Latency: total {sum(s['latencies']):.1f}s  "
+              f"p50 {_percentile(s['latencies'], 0.5):.2f}s  p95 {_percentile(s['latencies'], 0.95):.2f}s")
+        print(f"  Tokens: prompt {s['prompt_tokens']} ({s['prompt_tokens'] / max(calls, 1):.0f}/call)  "
+              f"response {s['response_tokens']} ({s['response_tokens'] / max(calls, 1):.0f}/call)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize recorded LLM calls")
+    parser.add_argument("--log", default=LLM_METRICS_LOG, help="Path to the metrics log")
+    parser.add_argument("--since", type=float, help="Only include the last N hours")
+    args = parser.parse_args()
+    report(args.log, args.since)
@@ -0,0 +1,283 @@
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+logger = logging.getLogger(__name__)
+
+# Lower value = served first. Interactive API requests always jump ahead of
+# scraper backfill that is already waiting in the queue.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Free-tier gemini-1.5-flash limits; override in .env for paid plans
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+# Share of the per-minute budget background work may use, so a backfill can
+# never fill the whole window and starve interactive requests
+BACKGROUND_BUDGET_SHARE = float(os.getenv("GEMINI_BACKGROUND_SHARE", "0.8"))
+
+# Rough allowance for the response when reserving tokens up front
+DEFAULT_OUTPUT_TOKENS = 256
+
+WINDOW_SECONDS = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for TPM reservations"""
+    return max(1, len(text or "") // 4)
+
+
+def is_quota_error(exc: Exception) -> bool:
+    """True for Gemini 429 / quota exhaustion errors that are worth retrying later"""
+    if type(exc).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(exc).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+
+def _response_tokens(result: Any) -> Optional[int]:
+    """Pull the real token usage off a generate_content response if present"""
+    try:
+        total = result.usage_metadata.total_token_count
+    except Exception:
+        # Not a Gemini response, or a stream that hasn't been consumed yet
+        return None
+    return int(total) if total else None
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "fn", "tokens", "stage", "enqueued_at",
+                 "not_before", "attempts", "reservation", "future")
+
+    def __init__(self, priority: int, seq: int, fn: Callable[[], Any], tokens: int, stage: str):
+        self.priority = priority
+        self.seq = seq
+        self.fn = fn
+        self.tokens = tokens
+        self.stage = stage
+        self.enqueued_at = time.monotonic()
+        self.not_before = 0.0
+        self.attempts = 0
+        self.reservation: Optional[list] = None
+        self.future: Future = Future()
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class GeminiScheduler:
+    """
+    Priority queue in front of every Gemini call.
+
+    Requests are queued instead of failing when the RPM/TPM budget for the
+    rolling minute is used up, and quota errors from the API put the job back
+    in the queue (keeping its place) after a backoff.
+    """
+
+    def __init__(self, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM,
+                 max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 background_share: float = BACKGROUND_BUDGET_SHARE,
+                 max_retries: int = 5, retry_backoff: float = 15.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.background_share = background_share
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._heap: List[_Job] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._window: deque = deque()  # [dispatch time, tokens] for the last minute
+        self._paused_until = 0.0
+        self._workers: List[threading.Thread] = []
+
+        # Stats
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._requeued = 0
+        self._waits: deque = deque(maxlen=500)
+        self._max_wait = 0.0
+        self._stage_waits: Dict[str, float] = {}
+        self._stage_counts: Dict[str, int] = {}
+
+    def submit(self, fn: Callable[[], Any], priority: int = PRIORITY_BACKGROUND,
+               tokens: int = 1, stage: str = "default") -> Future:
+        """Queue a call and return a Future for its result"""
+        job = _Job(priority, next(self._seq), fn, max(1, tokens), stage)
+        with self._cond:
+            self._ensure_workers()
+            heapq.heappush(self._heap, job)
+            self._cond.notify()
+        return job.future
+
+    def call(self, fn: Callable[[], Any], priority: int = PRIORITY_BACKGROUND,
+             tokens: int = 1, stage: str = "default", timeout: Optional[float] = None) -> Any:
+        """Queue a call and block until it has run"""
+        return self.submit(fn, priority=priority, tokens=tokens, stage=stage).result(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times and current budget usage"""
+        with self._cond:
+            now = time.monotonic()
+            self._trim_window(now)
+            waits = sorted(self._waits)
+            depth = {"interactive": 0, "background": 0}
+            for job in self._heap:
+                depth["interactive" if job.priority <= PRIORITY_INTERACTIVE else "background"] += 1
+            return {
+                "queue_depth": len(self._heap),
+                "queue_depth_by_priority": depth,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "requeued_on_quota": self._requeued,
+                "wait_seconds": {
+                    "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95": round(waits[int(len(waits) * 0.95) - 1], 3) if waits else 0.0,
+                    "max": round(self._max_wait, 3),
+                },
+                "avg_wait_by_stage": {
+                    stage: round(total / self._stage_counts[stage], 3)
+                    for stage, total in self._stage_waits.items()
+                },
+                "budget": {
+                    "rpm_limit": self.rpm,
+                    "tpm_limit": self.tpm,
+                    "requests_last_minute": len(self._window),
+                    "tokens_last_minute": sum(tokens for _, tokens in self._window),
+                    "paused_for_seconds": round(max(0.0, self._paused_until - now), 1),
+                },
+            }
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        for i in range(self.max_concurrency):
+            worker = threading.Thread(target=self._worker_loop, name=f"gemini-scheduler-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _trim_window(self, now: float):
+        while self._window and now - self._window[0][0] >= WINDOW_SECONDS:
+            self._window.popleft()
+
+    def _budget_delay(self, job: _Job, now: float) -> float:
+        """Seconds until `job` fits in the rolling-minute budget (0 = dispatch now)"""
+        delay = max(0.0, self._paused_until - now, job.not_before - now)
+        share = 1.0 if job.priority <= PRIORITY_INTERACTIVE else self.background_share
+        rpm_limit = max(1, int(self.rpm * share))
+        tpm_limit = max(1, int(self.tpm * share))
+
+        if len(self._window) >= rpm_limit:
+            oldest = self._window[len(self._window) - rpm_limit][0]
+            delay = max(delay, oldest + WINDOW_SECONDS - now)
+
+        used = sum(tokens for _, tokens in self._window)
+        if used + job.tokens > tpm_limit:
+            # Wait until enough old reservations fall out of the window
+            freed = 0
+            for dispatched_at, tokens in self._window:
+                freed += tokens
+                if used - freed + job.tokens <= tpm_limit:
+                    delay = max(delay, dispatched_at + WINDOW_SECONDS - now)
+                    break
+        return delay
+
+    def _next_job(self) -> _Job:
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                self._trim_window(now)
+                job = self._heap[0]
+                delay = self._budget_delay(job, now)
+                if delay > 0:
+                    # Re-check on wake-up: a higher priority job may have arrived
+                    self._cond.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._heap)
+                job.reservation = [now, job.tokens]
+                self._window.append(job.reservation)
+                self._in_flight += 1
+                if job.attempts == 0:
+                    waited = now - job.enqueued_at
+                    self._waits.append(waited)
+                    self._max_wait = max(self._max_wait, waited)
+                    self._stage_waits[job.stage] = self._stage_waits.get(job.stage, 0.0) + waited
+                    self._stage_counts[job.stage] = self._stage_counts.get(job.stage, 0) + 1
+                    if waited > 5:
+                        logger.info(f"Gemini call for {job.stage} waited {waited:.1f}s in queue "
+                                    f"({len(self._heap)} still queued)")
+                return job
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            # Requeued jobs are already marked running from their first attempt
+            if not job.future.running() and not job.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._in_flight -= 1
+                continue
+            try:
+                result = job.fn()
+            except Exception as e:
+                with self._cond:
+                    self._in_flight -= 1
+                    if is_quota_error(e) and job.attempts < self.max_retries:
+                        job.attempts += 1
+                        backoff = self.retry_backoff * job.attempts
+                        # Pause everyone: a 429 means the server-side budget is gone
+                        self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+                        job.not_before = time.monotonic() + backoff
+                        heapq.heappush(self._heap, job)
+                        self._requeued += 1
+                        self._cond.notify_all()
+                        logger.warning(f"Gemini quota hit for {job.stage}, requeued "
+                                       f"(attempt {job.attempts}/{self.max_retries}, backoff {backoff:.0f}s)")
+                        continue
+                    self._failed += 1
+                job.future.set_exception(e)
+                continue
+
+            with self._cond:
+                self._in_flight -= 1
+                self._completed += 1
+                actual = _response_tokens(result)
+                if actual and job.reservation is not None:
+                    # Swap our estimate for the real usage so TPM tracking stays honest
+                    job.reservation[1] = actual
+                self._cond.notify_all()
+            job.future.set_result(result)
+
+
+# Global scheduler instance shared by every module in the process
+gemini_scheduler = GeminiScheduler()
+
+
+def generate_content(model, prompt: str, priority: int = PRIORITY_BACKGROUND,
+                     stage: str = "default", **kwargs) -> Any:
+    """Run `model.generate_content(prompt)` through the shared scheduler"""
+    tokens = estimate_tokens(prompt) + DEFAULT_OUTPUT_TOKENS
+    return gemini_scheduler.call(
+        lambda: model.generate_content(prompt, **kwargs),
+        priority=priority,
+        tokens=tokens,
+        stage=stage,
+    )
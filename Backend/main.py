@@ -1,14 +1,17 @@
 # Create FastAPI app
 import logging
+import asyncio
 import os
 import json
 import time
 import requests
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any
 from fastapi import FastAPI, HTTPException, Query, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from bson import ObjectId
@@ -25,6 +28,16 @@ from Polygon import (
     get_market_news,
     PolygonException
 )
+from llm_scheduler import gemini_scheduler
+from gemini_models import model_registry
+from llm_metrics import llm_metrics
+from mongo import get_db, close_clients, pool_stats, query_stats, MONGO_MAX_POOL_SIZE
+from check_analysis import coverage_report
+from trending import trending_cache
+from heavy_hitters import heavy_hitters, WINDOWS
+from timeseries_store import TIMESERIES_ENABLED, CandleStore
+from message_search import search_messages, SORTS, SEARCH_MAX_PAGE_SIZE
+from timeutils import UTC, to_display
 
 # Load environment variables
 load_dotenv()
@@ -32,6 +45,13 @@ load_dotenv()
 # Get Polygon API key
 POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
 
+# Workers for asyncio.to_thread, which every MongoDB read in the API goes through
+API_THREAD_POOL_SIZE = int(os.getenv("API_THREAD_POOL_SIZE", str(MONGO_MAX_POOL_SIZE)))
+
+# How long a computed coverage report is served before it is recomputed
+ANALYSIS_COVERAGE_CACHE_SECONDS = float(os.getenv("ANALYSIS_COVERAGE_CACHE_SECONDS", "300"))
+_coverage_cache: Dict[str, Any] = {"report": None, "computed_at": 0.0}
+
 '''
 TWITTER_API_KEY = os.getenv("TWITTER_API_KEY")
 TWITTER_API_SECRET = os.getenv("TWITTER_API_SECRET")
@@ -46,11 +66,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # MongoDB is read with the pooled sync client from asyncio.to_thread workers;
+    # one worker per pooled connection, so requests queue here rather than in the driver
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=API_THREAD_POOL_SIZE, thread_name_prefix="api-worker"))
+    # Precompute trending lists on a schedule so requests only read memory
+    trending_cache.start()
+    try:
+        yield
+    finally:
+        await trending_cache.stop()
+        close_clients()
+
 # Create FastAPI app
 app = FastAPI(
     title="SentimentTech API",
     description="API for SentimentTech - Real-time sentiment analysis for financial markets",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Setup CORS
@@ -116,6 +151,44 @@ class StockPriceResponse(BaseModel):
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/health/llm", tags=["Health"])
+async def llm_scheduler_health():
+    """
+    Gemini scheduler queue depth, wait times, budget usage and model health
+    """
+    return {
+        **gemini_scheduler.stats(),
+        "models": model_registry.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/health/db", tags=["Health"])
+async def db_health():
+    """
+    MongoDB round trip, connection pool usage and query latency percentiles
+    """
+    try:
+        started = time.perf_counter()
+        await asyncio.to_thread(lambda: get_db().command("ping"))
+        ping_ms = round(1000 * (time.perf_counter() - started), 2)
+    except Exception as e:
+        logger.error(f"MongoDB ping failed: {e}")
+        raise HTTPException(status_code=503, detail=f"MongoDB unavailable: {str(e)}")
+    return {
+        "status": "healthy",
+        "ping_ms": ping_ms,
+        "pools": pool_stats(),
+        "queries": query_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+async def metrics():
+    """
+    LLM latency/token histograms in Prometheus text format
+    """
+    return llm_metrics.prometheus_text()
+
 # Initial Routes
 @app.get("/", tags=["Root"])
 async def root():
@@ -128,7 +201,9 @@ async def root():
             "/stocks/{symbol}/price",
             "/stocks/{symbol}/sentiment",
             "/trending/stocks",
-            "/trending/topics"
+            "/trending/topics",
+            "/search",
+            "/analysis/coverage"
         ]
     }
 
@@ -257,44 +332,67 @@ async def get_stock_price(
             start = (now - timedelta(days=30)).strftime("%Y-%m-%d")
             multiplier, timespan = 1, "day"
 
-        # Build Polygon API URL with more reliable date range
-        url = f"https://api.polygon.io/v2/aggs/ticker/{symbol.upper()}/range/{multiplier}/{timespan}/{start}/{end_date}"
-        params = {
-            "adjusted": "true",
-            "sort": "asc",
-            "apiKey": POLYGON_API_KEY
-        }
-        
-        logger.info(f"Calling Polygon API: {url}")
-        
-        # Add longer delay to avoid rate limiting
-        time.sleep(0.2)
-        
-        response = requests.get(url, params=params)
-        
-        if response.status_code != 200:
-            logger.error(f"Polygon API error: {response.status_code} - {response.text}")
-            # Return empty data instead of throwing error to prevent frontend crashes
-            return {
-                "symbol": symbol.upper(),
-                "interval": interval,
-                "data": []
-            }
-        
-        data = response.json()
+        # Bars already fetched for this range are served from the candles time-series collection
+        bar = f"{multiplier}{timespan}"
+        results = None
+        if TIMESERIES_ENABLED:
+            candle_store = CandleStore(get_db())
+            try:
+                if await asyncio.to_thread(candle_store.covered, symbol, bar, start, end_date):
+                    results = await asyncio.to_thread(candle_store.window, symbol, bar, start, end_date)
+                    logger.info(f"Serving {len(results)} stored {bar} candles for {symbol}")
+            except Exception as e:
+                # The candle store is a cache; Polygon still has the data
+                logger.error(f"Reading stored {bar} candles for {symbol} failed, fetching from Polygon: {e}")
+                results = None
         
-        if not data.get("results"):
-            logger.warning(f"No historical data found for {symbol}")
-            return {
-                "symbol": symbol.upper(),
-                "interval": interval,
-                "data": []
+        if results is None:
+            # Build Polygon API URL with more reliable date range
+            url = f"https://api.polygon.io/v2/aggs/ticker/{symbol.upper()}/range/{multiplier}/{timespan}/{start}/{end_date}"
+            params = {
+                "adjusted": "true",
+                "sort": "asc",
+                "apiKey": POLYGON_API_KEY
             }
+            
+            logger.info(f"Calling Polygon API: {url}")
+            
+            # Add longer delay to avoid rate limiting
+            time.sleep(0.2)
+            
+            response = requests.get(url, params=params)
+            
+            if response.status_code != 200:
+                logger.error(f"Polygon API error: {response.status_code} - {response.text}")
+                # Return empty data instead of throwing error to prevent frontend crashes
+                return {
+                    "symbol": symbol.upper(),
+                    "interval": interval,
+                    "data": []
+                }
+            
+            data = response.json()
+            
+            if not data.get("results"):
+                logger.warning(f"No historical data found for {symbol}")
+                return {
+                    "symbol": symbol.upper(),
+                    "interval": interval,
+                    "data": []
+                }
+            
+            results = data["results"]
+            if TIMESERIES_ENABLED:
+                try:
+                    stored = await asyncio.to_thread(candle_store.store, symbol, bar, results, start, end_date)
+                    logger.info(f"Stored {stored} new {bar} candles for {symbol}")
+                except Exception as e:
+                    logger.error(f"Storing {bar} candles for {symbol} failed: {e}")
         
         # Transform data to match frontend expectations
         candles = []
-        for item in data.get("results", []):
-            timestamp = datetime.utcfromtimestamp(item["t"] / 1000)
+        for item in results:
+            timestamp = to_display(datetime.fromtimestamp(item["t"] / 1000, UTC))
             
             # Format time based on interval
             if interval == "1D":
@@ -336,66 +434,15 @@ async def get_stock_sentiment(symbol: str):
     """
     logger.info(f"Fetching sentiment data for {symbol}")
     
-    # This would call to our sentiment analysis service
-    # For now, return mock data
-    return {
-        "symbol": symbol.upper(),
-        "overall_sentiment": {
-            "score": 0.65,
-            "magnitude": 0.8,
-            "label": "positive"
-        },
-        "social_sentiment": {
-            "reddit": {
-                "score": 0.45,
-                "magnitude": 0.9,
-                "label": "neutral"
-            },
-            "twitter": {
-                "score": 0.75, 
-                "magnitude": 0.85,
-                "label": "positive"
-            },
-            "news": {
-                "score": 0.68,
-                "magnitude": 0.7,
-                "label": "positive"
-            }
-        },
-        "trending_topics": [
-            "earnings", "iphone", "artificial intelligence", "vision pro", "tariffs"
-        ],
-        "recent_posts": [
-            {
-                "id": "post1",
-                "platform": "reddit",
-                "content": "Apple's services business continues to grow impressively",
-                "created_at": datetime.now() - timedelta(hours=2),
-                "sentiment": {
-                    "score": 0.82,
-                    "magnitude": 0.7,
-                    "label": "positive"
-                },
-                "url": "https://reddit.com/r/investing/comments/123456",
-                "author": "investor123",
-                "likes": 42
-            },
-            {
-                "id": "post2",
-                "platform": "twitter",
-                "content": "Vision Pro sales seem to be below expectations. Not a good sign.",
-                "created_at": datetime.now() - timedelta(hours=5),
-                "sentiment": {
-                    "score": -0.45,
-                    "magnitude": 0.65,
-                    "label": "negative"
-                },
-                "author": "@techanalyst",
-                "likes": 118
-            }
-        ],
-        "last_updated": datetime.now()
-    }
+    # Precomputed for trending symbols; anything else is computed once and cached until the next refresh
+    cached = trending_cache.cached_sentiment(symbol)
+    if cached is not None:
+        return cached
+    try:
+        return await asyncio.to_thread(trending_cache.symbol_sentiment, symbol)
+    except Exception as e:
+        logger.error(f"Error computing sentiment for {symbol}: {e}")
+        raise HTTPException(status_code=503, detail=f"Sentiment data unavailable: {str(e)}")
 
 @app.get("/trending/stocks", tags=["Trending"])
 async def get_trending_stocks():
@@ -404,36 +451,10 @@ async def get_trending_stocks():
     """
     logger.info("Fetching trending stocks")
     
-    # This would query our analytics database
-    return {
-        "trending_stocks": [
-            {
-                "symbol": "NVDA",
-                "name": "NVIDIA Corporation",
-                "sentiment_score": 0.87,
-                "sentiment_label": "positive",
-                "mention_count": 1245,
-                "price_change_24h": 2.3
-            },
-            {
-                "symbol": "AAPL",
-                "name": "Apple Inc.",
-                "sentiment_score": 0.65,
-                "sentiment_label": "positive", 
-                "mention_count": 986,
-                "price_change_24h": 1.18
-            },
-            {
-                "symbol": "TSLA",
-                "name": "Tesla, Inc.",
-                "sentiment_score": 0.42,
-                "sentiment_label": "neutral",
-                "mention_count": 875,
-                "price_change_24h": -0.8
-            }
-        ],
-        "last_updated": datetime.now().isoformat()
-    }
+    # Served from the in-memory snapshot refreshed in the background
+    if not trending_cache.ready:
+        raise HTTPException(status_code=503, detail="Trending data is still being computed")
+    return trending_cache.trending_stocks()
 
 @app.get("/trending/topics", tags=["Trending"])
 async def get_trending_topics():
@@ -442,30 +463,80 @@ async def get_trending_topics():
     """
     logger.info("Fetching trending topics")
     
+    if not trending_cache.ready:
+        raise HTTPException(status_code=503, detail="Trending data is still being computed")
+    return trending_cache.trending_topics()
+
+@app.get("/trending/tickers", tags=["Trending"])
+async def get_most_mentioned_tickers(
+    window: str = Query("24h", description=f"One of {', '.join(WINDOWS)}"),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """
+    Most mentioned tickers over a decaying window, from the streaming heavy-hitters counters
+    """
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
     return {
-        "trending_topics": [
-            {
-                "topic": "Artificial Intelligence",
-                "sentiment_score": 0.78,
-                "mention_count": 2341,
-                "related_stocks": ["NVDA", "MSFT", "GOOG"]
-            },
-            {
-                "topic": "Interest Rates",
-                "sentiment_score": -0.25,
-                "mention_count": 1872,
-                "related_stocks": ["JPM", "GS", "BAC"]
-            },
-            {
-                "topic": "Semiconductor Shortage",
-                "sentiment_score": 0.15,
-                "mention_count": 1544,
-                "related_stocks": ["INTC", "AMD", "TSM"]
-            }
-        ],
-        "last_updated": datetime.now().isoformat()
+        "window": window,
+        "tickers": [{"symbol": row["item"].lstrip("$"), "mentions": row["count"], "max_error": row["error"]}
+                    for row in heavy_hitters.top(window, limit)],
+        # When the ingestor saved the counters, not when the trending cache last loaded them
+        "last_updated": heavy_hitters.saved_at.isoformat() if heavy_hitters.saved_at else None
     }
 
+@app.get("/health/trending", tags=["Health"])
+async def trending_health():
+    """
+    Trending cache refresh status
+    """
+    return trending_cache.stats()
+
+# Routes for searching stored messages
+@app.get("/search", tags=["Search"])
+async def search(
+    q: str = Query(..., min_length=1, description="Words to find; \"quoted phrases\" must match, -word excludes"),
+    ticker: Optional[str] = Query(None, description="Only messages mentioning this ticker"),
+    author: Optional[str] = Query(None, description="Only messages by this Discord username"),
+    since: Optional[datetime] = Query(None, description="Messages sent at or after this time"),
+    until: Optional[datetime] = Query(None, description="Messages sent before this time"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    sort: str = Query("relevance", description=f"One of {', '.join(SORTS)}")
+):
+    """
+    Full-text search over stored Discord messages
+    """
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORTS)}")
+    try:
+        return await asyncio.to_thread(search_messages, get_db(), q, ticker=ticker, author=author,
+                                       since=since, until=until, page=page, page_size=page_size, sort=sort)
+    except Exception as e:
+        logger.error(f"Error searching messages for '{q}': {e}")
+        raise HTTPException(status_code=503, detail=f"Search unavailable: {str(e)}")
+
+# Routes for analysis data
+@app.get("/analysis/coverage", tags=["Analysis"])
+async def get_analysis_coverage(refresh: bool = Query(False, description="Recompute instead of serving the cached report")):
+    """
+    Share of stored messages with proper AI analysis vs fallback data
+    """
+    age = time.monotonic() - _coverage_cache["computed_at"]
+    if not refresh and _coverage_cache["report"] is not None and age < ANALYSIS_COVERAGE_CACHE_SECONDS:
+        return {**_coverage_cache["report"], "cached": True}
+    
+    try:
+        # Shared with the CLI report, so it runs on the pooled sync client off the event loop
+        report = await asyncio.to_thread(coverage_report, get_db())
+    except Exception as e:
+        logger.error(f"Error computing analysis coverage: {e}")
+        raise HTTPException(status_code=503, detail=f"Analysis coverage unavailable: {str(e)}")
+    
+    _coverage_cache["report"] = report
+    _coverage_cache["computed_at"] = time.monotonic()
+    return {**report, "cached": False}
+
 # MongoDB test routes - commented out for now
 # @app.get("/test-insert", tags=["MongoDB"])
 # async def test_insert():
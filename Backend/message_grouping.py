@@ -0,0 +1,121 @@
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from timeutils import UTC, parse_timestamp, parse_timestamps
+
+Message = Dict[str, Any]
+
+
+def author_key(msg: Message) -> Optional[str]:
+    """Author identifier used for grouping (username, then id); None if there's no author"""
+    author = msg.get('author')
+    if not author:
+        return None
+    if isinstance(author, dict):
+        return author.get('username') or author.get('id') or str(author)
+    return str(author)
+
+
+def message_time(msg: Message) -> datetime:
+    """UTC timestamp of a message, without modifying the message (naive values are taken as UTC)"""
+    return parse_timestamp(msg.get('timestamp'))
+
+
+def group_sorted(rows: Iterable[Tuple[str, datetime, Message]],
+                 time_window_minutes: float = 60) -> Iterator[Tuple[str, List[Message]]]:
+    """
+    Split (author, time, message) rows, already ordered by author then time,
+    into (author, messages) groups in one pass.
+
+    A message joins the current group while it is less than the window after
+    the previous message from the same author. Only the current group is held
+    in memory, so rows can come straight from a sorted database cursor.
+    """
+    window = timedelta(minutes=time_window_minutes)
+    for author, rows_for_author in groupby(rows, key=itemgetter(0)):
+        group: List[Message] = []
+        last_time = None
+        for _, msg_time, msg in rows_for_author:
+            if group and msg_time - last_time >= window:
+                yield author, group
+                group = []
+            group.append(msg)
+            last_time = msg_time
+        if group:
+            yield author, group
+
+
+def iter_author_groups(messages: Iterable[Message],
+                       time_window_minutes: float = 60) -> Iterator[Tuple[str, List[Message]]]:
+    """
+    Group messages by author and time window with a single sort.
+
+    The timestamps are parsed in one batch and the messages are left
+    untouched. Messages without an author are skipped. Groups come out
+    ordered by author, then time.
+    """
+    rows = []
+    authored = [(author_key(msg), msg) for msg in messages]
+    authored = [(author, msg) for author, msg in authored if author is not None]
+    times = parse_timestamps([msg.get('timestamp') for _, msg in authored])
+    for index, ((author, msg), msg_time) in enumerate(zip(authored, times)):
+        rows.append((author, msg_time, index, msg))
+    # index breaks ties so the dicts themselves are never compared
+    rows.sort(key=itemgetter(0, 1, 2))
+    return group_sorted(((author, t, msg) for author, t, _, msg in rows), time_window_minutes)
+
+
+def _legacy_grouping(messages: List[Message], time_window_minutes: float) -> List[List[Message]]:
+    """The previous per-author rescan + re-sort, kept for the benchmark"""
+    groups = []
+    for author in {author_key(m) for m in messages if author_key(m)}:
+        author_messages = sorted((m for m in messages if author_key(m) == author),
+                                 key=lambda m: m.get('timestamp', ''))
+        current = []
+        for msg in author_messages:
+            msg_time = message_time(msg)
+            if current and (msg_time - message_time(current[-1])).total_seconds() / 60 >= time_window_minutes:
+                groups.append(current)
+                current = []
+            current.append(msg)
+        if current:
+            groups.append(current)
+    return groups
+
+
+def _benchmark(count: int, authors: int):
+    start_time = datetime(2024, 1, 1, tzinfo=UTC)
+    messages = [{
+        'id': str(i),
+        'author': {'id': str(i % authors), 'username': f'user{i % authors}'},
+        'content': f'$AAPL message {i}',
+        'timestamp': (start_time + timedelta(seconds=random.randint(0, 30 * 24 * 3600))).isoformat(),
+    } for i in range(count)]
+
+    start = time.perf_counter()
+    new_groups = list(iter_author_groups(messages, 60))
+    new_seconds = time.perf_counter() - start
+    print(f"⚡ Single pass:     {new_seconds:.2f}s for {count:,} messages, {authors} authors "
+          f"({len(new_groups):,} groups)")
+
+    if count * authors > 50_000_000:
+        print("⏭️  Skipping the per-author rescan, it would take too long at this size")
+        return
+    start = time.perf_counter()
+    old_groups = _legacy_grouping(messages, 60)
+    old_seconds = time.perf_counter() - start
+    print(f"🐢 Per-author scan: {old_seconds:.2f}s ({len(old_groups):,} groups), "
+          f"{old_seconds / new_seconds:.1f}x slower")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark message grouping")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--authors", type=int, default=200)
+    args = parser.parse_args()
+    _benchmark(args.messages, args.authors)
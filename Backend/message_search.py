@@ -0,0 +1,123 @@
+import os
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from mongo import get_db
+from trending import _post
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+TEXT_INDEX_NAME = "content_text"
+# Stemming and stop words for the text index; "none" indexes every word as written
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+SEARCH_MAX_PAGE_SIZE = 100
+
+SORTS = ("relevance", "recent")
+
+
+def ensure_text_index(stock_messages):
+    """Text index over message content (a collection can only have one)"""
+    stock_messages.create_index([("content", "text")], name=TEXT_INDEX_NAME, default_language=SEARCH_LANGUAGE)
+
+
+def normalize_ticker(ticker: str) -> str:
+    """'aapl' or '$AAPL' -> '$AAPL', as stored in tickers_mentioned"""
+    return "$" + ticker.strip().lstrip("$").upper()
+
+
+def search_filter(query: str, ticker: Optional[str] = None, author: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    $text filter plus the optional ticker/author/date filters.
+
+    Words match any of them (stemmed); "quoted phrases" must appear and
+    -words must not, as in MongoDB's $search string syntax.
+    """
+    filter: Dict[str, Any] = {"$text": {"$search": query}}
+    if ticker:
+        filter["tickers_mentioned"] = normalize_ticker(ticker)
+    if author:
+        filter["author_username"] = author
+    if since or until:
+        filter["timestamp"] = {key: value for key, value in (("$gte", since), ("$lt", until)) if value}
+    return filter
+
+
+def search_messages(db, query: str, ticker: Optional[str] = None, author: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    page: int = 1, page_size: int = 20, sort: str = "relevance") -> Dict[str, Any]:
+    """
+    One page of stock_messages matching `query`, with the total match count.
+
+    The page and the count come from a single aggregation over the text
+    index; results are SocialMediaPost dicts with the text score attached.
+    """
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SORTS)}")
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), SEARCH_MAX_PAGE_SIZE)
+    order = {"score": -1, "timestamp": -1} if sort == "relevance" else {"timestamp": -1, "score": -1}
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": search_filter(query, ticker, author, since, until)},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$facet": {
+            "results": [
+                {"$sort": order},
+                {"$skip": (page - 1) * page_size},
+                {"$limit": page_size},
+                {"$project": {"discord_id": 1, "content": 1, "timestamp": 1, "created_at": 1, "sentiment": 1,
+                              "confidence_score": 1, "author_username": 1, "guild_id": 1, "channel_id": 1,
+                              "tickers_mentioned": 1, "source": 1, "url": 1, "score": 1}},
+            ],
+            "total": [{"$count": "count"}],
+        }},
+    ]
+    facets = next(db['stock_messages'].aggregate(pipeline), {"results": [], "total": []})
+    total = facets["total"][0]["count"] if facets["total"] else 0
+    return {
+        "query": query,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": (total + page_size - 1) // page_size,
+        "results": [
+            {**_post(doc), "tickers": doc.get("tickers_mentioned", []), "score": round(doc.get("score", 0.0), 3)}
+            for doc in facets["results"]
+        ],
+    }
+
+
+def drop_search_text(db) -> int:
+    """Remove the old lowercase content copy from stored messages; returns the documents updated"""
+    result = db['stock_messages'].update_many({"search_text": {"$exists": True}}, {"$unset": {"search_text": ""}})
+    return result.modified_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search over stored stock messages")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("setup", help="Create the text index and drop the old search_text field")
+    query_parser = sub.add_parser("query", help="Search message content")
+    query_parser.add_argument("text")
+    query_parser.add_argument("--ticker")
+    query_parser.add_argument("--author")
+    query_parser.add_argument("--page", type=int, default=1)
+    query_parser.add_argument("--page-size", type=int, default=20)
+    query_parser.add_argument("--sort", choices=SORTS, default="relevance")
+    args = parser.parse_args()
+
+    db = get_db()
+    if args.command == "setup":
+        ensure_text_index(db['stock_messages'])
+        print(f"✅ Text index {TEXT_INDEX_NAME} ready ({SEARCH_LANGUAGE})")
+        print(f"🧹 Removed search_text from {drop_search_text(db):,} messages")
+    else:
+        found = search_messages(db, args.text, ticker=args.ticker, author=args.author,
+                                page=args.page, page_size=args.page_size, sort=args.sort)
+        print(f"🔍 {found['total']:,} messages match '{args.text}' (page {found['page']}/{max(found['pages'], 1)})")
+        for row in found["results"]:
+            print(f"  [{row['score']}] {row['created_at']:%Y-%m-%d %H:%M %Z} {row['author']}: {row['content'][:100]}")
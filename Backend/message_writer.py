@@ -0,0 +1,280 @@
+import os
+import time
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import certifi
+import pytz
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+MESSAGE_WRITER_BATCH_SIZE = int(os.getenv("MESSAGE_WRITER_BATCH_SIZE", "500"))
+MESSAGE_WRITER_FLUSH_INTERVAL = float(os.getenv("MESSAGE_WRITER_FLUSH_INTERVAL", "2.0"))
+
+# Fields that keep their first-seen value when a message is re-ingested
+INSERT_ONLY_FIELDS = ("created_at",)
+
+DISCORD_ID_INDEX = "discord_id_unique"
+# Only string ids have to be unique; documents without one (older imports) are
+# left alone. A range rather than $type, so equality and $in lookups on
+# discord_id can still use the index.
+DISCORD_ID_FILTER = {"discord_id": {"$gt": ""}}
+
+
+def remove_duplicate_messages(collection) -> int:
+    """Delete all but the oldest copy of each discord_id (needed before the unique index)"""
+    pipeline = [
+        # Documents without an id aren't copies of each other
+        {"$match": DISCORD_ID_FILTER},
+        {"$group": {"_id": "$discord_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = 0
+    for group in collection.aggregate(pipeline, allowDiskUse=True):
+        extra_ids = sorted(group["ids"])[1:]
+        removed += collection.delete_many({"_id": {"$in": extra_ids}}).deleted_count
+    return removed
+
+
+def ensure_message_indexes(collection):
+    """Create the unique discord_id index, cleaning up duplicates from older runs first"""
+    existing = collection.index_information().get(DISCORD_ID_INDEX)
+    if existing is not None and existing.get("partialFilterExpression") != DISCORD_ID_FILTER:
+        # Built by an older version over every document; rebuilt with the filter
+        collection.drop_index(DISCORD_ID_INDEX)
+    options = {"unique": True, "name": DISCORD_ID_INDEX, "partialFilterExpression": DISCORD_ID_FILTER}
+    try:
+        collection.create_index("discord_id", **options)
+    except OperationFailure as e:
+        if e.code != 11000:  # duplicate key
+            raise
+        removed = remove_duplicate_messages(collection)
+        print(f"🧹 Removed {removed} duplicate messages before creating unique index")
+        collection.create_index("discord_id", **options)
+
+
+def fan_out(*callbacks: Optional[Callable[[List[Dict[str, Any]]], Any]]) -> Callable[[List[Dict[str, Any]]], None]:
+    """
+    One after_flush callback calling each of `callbacks` in order (None
+    entries are skipped). A callback that raises is reported and the rest
+    still run; the first error is re-raised once they all have.
+    """
+    active = [callback for callback in callbacks if callback is not None]
+
+    def call_all(docs: List[Dict[str, Any]]):
+        failed = None
+        for callback in active:
+            try:
+                callback(docs)
+            except Exception as e:
+                print(f"❌ after_flush callback {getattr(callback, '__qualname__', callback)} failed: {e}")
+                failed = failed or e
+        if failed is not None:
+            raise failed
+    return call_all
+
+
+class BufferedMessageWriter:
+    """
+    Accumulates message documents and flushes them as unordered bulk upserts.
+
+    Upserts are keyed on `discord_id` (or `key_field`), so re-running the
+    scraper over the same messages updates them in place instead of inserting
+    duplicates. A flush happens when `batch_size` documents are buffered, when
+    `flush_interval` seconds have passed since the last one, or on close().
+    `before_flush` runs first on every non-empty flush, e.g. to write the
+    documents these ones reference. `after_flush` is called with the
+    documents that were newly inserted (not updates of existing ones), so
+    counters derived from it never see the same message twice; an error in
+    it is counted in `hook_errors` and doesn't fail the flush, as the
+    messages themselves are already stored. If the bulk write itself fails
+    (network error, server selection timeout) the batch goes back into the
+    buffer and the error is re-raised.
+    """
+
+    def __init__(self, collection, batch_size: int = MESSAGE_WRITER_BATCH_SIZE,
+                 flush_interval: float = MESSAGE_WRITER_FLUSH_INTERVAL, key_field: str = "discord_id",
+                 before_flush: Optional[Callable[[], Any]] = None,
+                 after_flush: Optional[Callable[[List[Dict[str, Any]]], Any]] = None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.key_field = key_field
+        self.before_flush = before_flush
+        self.after_flush = after_flush
+
+        self._buffer: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self._timer: Optional[threading.Thread] = None
+
+        # Throughput stats
+        self.written = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = 0
+        self.hook_errors = 0
+        self.flush_failures = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+
+    def add(self, doc: Dict[str, Any]):
+        """Buffer one document; later copies of the same key replace earlier ones"""
+        with self._lock:
+            self._start_timer()
+            self._buffer[doc[self.key_field]] = doc
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> List[Any]:
+        """Write everything buffered; returns the keys that were newly inserted"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return []
+            if self.before_flush is not None:
+                self.before_flush()
+            docs = list(self._buffer.values())
+            self._buffer = {}
+
+            now = datetime.now(pytz.utc)
+            ops = []
+            for doc in docs:
+                # The key comes from the upsert filter; $set on _id would be rejected
+                update = {k: v for k, v in doc.items() if k not in INSERT_ONLY_FIELDS and k != self.key_field}
+                update["updated_at"] = now
+                spec = {"$set": update}
+                insert_only = {k: doc[k] for k in INSERT_ONLY_FIELDS if k in doc}
+                if insert_only:
+                    spec["$setOnInsert"] = insert_only
+                ops.append(UpdateOne({self.key_field: doc[self.key_field]}, spec, upsert=True))
+
+            start = time.perf_counter()
+            try:
+                result = self.collection.bulk_write(ops, ordered=False)
+                details = result.bulk_api_result
+            except BulkWriteError as e:
+                # Unordered: the rest of the batch is still applied
+                details = e.details
+                self.errors += len(details.get("writeErrors", []))
+                print(f"❌ {len(details.get('writeErrors', []))} message writes failed in bulk flush")
+            except Exception as e:
+                # Nothing is known to be written (network error, no server): keep the batch
+                # for the next flush, behind any newer copies added since
+                self.flush_failures += 1
+                self._buffer = {**{doc[self.key_field]: doc for doc in docs}, **self._buffer}
+                print(f"❌ Bulk flush of {len(docs)} messages failed, kept for retry: {e}")
+                raise
+            self.flush_seconds += time.perf_counter() - start
+            self.flushes += 1
+
+            upserted = details.get("upserted", [])
+            self.inserted += len(upserted)
+            self.updated += details.get("nModified", 0)
+            self.written += len(docs)
+            inserted_docs = [docs[item["index"]] for item in upserted]
+            if self.after_flush is not None and inserted_docs:
+                try:
+                    self.after_flush(inserted_docs)
+                except Exception as e:
+                    self.hook_errors += 1
+                    print(f"❌ after_flush failed for {len(inserted_docs)} new messages: {e}")
+            return [doc[self.key_field] for doc in inserted_docs]
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "written": self.written,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "errors": self.errors,
+            "hook_errors": self.hook_errors,
+            "flush_failures": self.flush_failures,
+            "flushes": self.flushes,
+            "docs_per_second": round(self.written / self.flush_seconds, 1) if self.flush_seconds else 0.0,
+        }
+
+    def _start_timer(self):
+        if self._timer is not None or not self.flush_interval:
+            return
+        self._timer = threading.Thread(target=self._flush_periodically, name="message-writer", daemon=True)
+        self._timer.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            with self._lock:
+                if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                    self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _benchmark(uri: str, count: int, batch_size: int):
+    """Compare one insert_one per message against buffered bulk upserts"""
+    kwargs = {"tlsCAFile": certifi.where()} if uri.startswith("mongodb+srv") else {}
+    client = MongoClient(uri, **kwargs)
+    db = client["discord_scraper_bench"]
+    now = datetime.now(pytz.utc)
+
+    def make_docs(offset):
+        return [{
+            "discord_id": str(offset + i),
+            "author_username": f"user{i % 50}",
+            "content": f"$AAPL looking strong into earnings #{i}",
+            "tickers_mentioned": ["$AAPL"],
+            "timestamp": now,
+            "created_at": now,
+        } for i in range(count)]
+
+    db.drop_collection("single_inserts")
+    single = db["single_inserts"]
+    start = time.perf_counter()
+    for doc in make_docs(0):
+        single.insert_one(doc)
+    single_rate = count / (time.perf_counter() - start)
+
+    db.drop_collection("bulk_upserts")
+    bulk = db["bulk_upserts"]
+    ensure_message_indexes(bulk)
+    start = time.perf_counter()
+    with BufferedMessageWriter(bulk, batch_size=batch_size, flush_interval=0) as writer:
+        for doc in make_docs(0):
+            writer.add(doc)
+    bulk_rate = count / (time.perf_counter() - start)
+
+    # Rerun the same ids: should update in place, not duplicate
+    start = time.perf_counter()
+    with BufferedMessageWriter(bulk, batch_size=batch_size, flush_interval=0) as writer:
+        for doc in make_docs(0):
+            writer.add(doc)
+    rerun_rate = count / (time.perf_counter() - start)
+
+    print(f"📊 {count} messages against {uri}")
+    print(f"  insert_one loop:          {single_rate:,.0f} docs/s")
+    print(f"  bulk upsert (batch {batch_size}): {bulk_rate:,.0f} docs/s ({bulk_rate / single_rate:.1f}x)")
+    print(f"  bulk upsert rerun:        {rerun_rate:,.0f} docs/s, "
+          f"{bulk.count_documents({})} docs stored (no duplicates)")
+    client.drop_database("discord_scraper_bench")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark buffered bulk upserts")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=MESSAGE_WRITER_BATCH_SIZE)
+    args = parser.parse_args()
+    _benchmark(args.uri, args.docs, args.batch_size)
@@ -0,0 +1,223 @@
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import certifi
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "discord_scraper")
+
+# Pool and selection settings for the shared client. The API reaches it from
+# worker threads (asyncio.to_thread), so MONGO_MAX_POOL_SIZE also sizes its thread pool
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+# primary, primaryPreferred, secondary, secondaryPreferred or nearest
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "goldenstandard")
+# Latencies kept per (collection, command) for the percentiles in /health/db
+MONGO_LATENCY_SAMPLES = int(os.getenv("MONGO_LATENCY_SAMPLES", "1000"))
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters for one client, fed by pymongo's CMAP events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.max_checked_out = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        # duration: time spent waiting for a connection (pymongo >= 4.7)
+        wait = getattr(event, "duration", None) or 0.0
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkout_wait_seconds += wait
+            self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, wait)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open_connections": self.created - self.closed,
+                "in_use": self.checked_out,
+                "max_in_use": self.max_checked_out,
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_checkout_wait_ms": round(1000 * self.checkout_wait_seconds / self.checkouts, 2)
+                if self.checkouts else 0.0,
+                "max_checkout_wait_ms": round(1000 * self.max_checkout_wait_seconds, 2),
+                "pool_clears": self.pool_clears,
+            }
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+class QueryLatency(monitoring.CommandListener):
+    """Recent command latencies per (collection, command), fed by pymongo's command events"""
+
+    # Driver housekeeping, not queries the code issues
+    IGNORED = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "buildInfo"}
+
+    def __init__(self, samples: int = MONGO_LATENCY_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Tuple[str, str]] = {}
+        self._latency: Dict[Tuple[str, str], Deque[float]] = {}
+        self._failures: Dict[Tuple[str, str], int] = {}
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        # find/aggregate/... name their collection; getMore carries a cursor id instead
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        collection = target if isinstance(target, str) else "-"
+        with self._lock:
+            self._pending[event.request_id] = (collection, event.command_name)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            key = self._pending.pop(event.request_id, None)
+            if key is None:
+                return
+            self._latency.setdefault(key, deque(maxlen=self.samples)).append(event.duration_micros / 1000)
+            if failed:
+                self._failures[key] = self._failures.get(key, 0) + 1
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latency = {key: list(values) for key, values in self._latency.items()}
+            failures = dict(self._failures)
+        return {
+            f"{collection}.{command}": {
+                "count": len(values),
+                "failures": failures.get((collection, command), 0),
+                "p50_ms": round(_percentile(values, 0.50), 2),
+                "p95_ms": round(_percentile(values, 0.95), 2),
+                "p99_ms": round(_percentile(values, 0.99), 2),
+            }
+            for (collection, command), values in sorted(latency.items())
+        }
+
+
+sync_pool_metrics = PoolMetrics()
+query_latency = QueryLatency()
+
+_client: Optional[MongoClient] = None
+_lock = threading.Lock()
+
+
+def client_options(metrics: Optional[PoolMetrics] = None, uri: Optional[str] = MONGO_URI) -> Dict[str, Any]:
+    """Keyword arguments for MongoClient"""
+    options: Dict[str, Any] = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "appname": MONGO_APP_NAME,
+    }
+    # Atlas (SRV or explicit TLS) needs certifi's CA bundle; a plain local server must not get TLS options
+    if uri and (uri.startswith("mongodb+srv://") or "tls=true" in uri.lower() or "ssl=true" in uri.lower()):
+        options["tlsCAFile"] = certifi.where()
+    if metrics is not None:
+        options["event_listeners"] = [metrics, query_latency]
+    return options
+
+
+def get_client() -> MongoClient:
+    """Process-wide pooled MongoClient for scripts and the API's worker threads, created on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if not MONGO_URI:
+                    raise RuntimeError("MONGO_URI not found in .env")
+                _client = MongoClient(MONGO_URI, **client_options(sync_pool_metrics))
+    return _client
+
+
+def get_db(name: str = MONGO_DB_NAME):
+    return get_client()[name]
+
+
+def close_clients():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        "read_preference": MONGO_READ_PREFERENCE,
+        "sync": {"connected": _client is not None, **sync_pool_metrics.stats()},
+    }
+
+
+def query_stats() -> Dict[str, Any]:
+    """Latency percentiles of the commands this process sent, by collection and command"""
+    return query_latency.stats()
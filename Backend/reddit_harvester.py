@@ -0,0 +1,309 @@
+import os
+import re
+import time
+import asyncio
+import argparse
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
+REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
+REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT", "goldenstandard/1.0")
+
+REDDIT_AUTH_URL = "https://www.reddit.com/api/v1/access_token"
+REDDIT_API = "https://oauth.reddit.com"
+
+# Comment trees fetched at once; the rate limiter still paces them
+REDDIT_CONCURRENCY = int(os.getenv("REDDIT_CONCURRENCY", "8"))
+REDDIT_COMMENTS_PER_POST = int(os.getenv("REDDIT_COMMENTS_PER_POST", "20"))
+# Post ids remembered (with their comment count) so unchanged posts aren't fetched again
+REDDIT_SEEN_POSTS = int(os.getenv("REDDIT_SEEN_POSTS", "10000"))
+
+# Reddit rejects longer search queries
+MAX_QUERY_LENGTH = 512
+# Bots, never someone talking about a position
+IGNORED_AUTHORS = {"visualmod", "automoderator"}
+MIN_COMMENT_LENGTH = 20
+
+
+class RedditRateLimiter:
+    """
+    Paces requests by the X-Ratelimit-Remaining / X-Ratelimit-Reset headers
+    Reddit returns with every OAuth response, so a burst of concurrent
+    comment fetches waits for the window to reset instead of getting 429s.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.remaining: Optional[float] = None
+        self.reset_at = 0.0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self.remaining is not None and self.remaining < 1 and self.reset_at > now:
+                delay = self.reset_at - now
+                self.waits += 1
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+                self.remaining = None
+            if self.remaining is not None:
+                self.remaining -= 1
+
+    def update(self, response_headers, status: int) -> float:
+        """Record the window from a response; returns seconds to wait before retrying a 429"""
+        remaining = response_headers.get("X-Ratelimit-Remaining")
+        reset = response_headers.get("X-Ratelimit-Reset")
+        if remaining is not None and reset is not None:
+            self.remaining = float(remaining)
+            self.reset_at = time.monotonic() + float(reset)
+        if status != 429:
+            return 0.0
+        self.rate_limited += 1
+        self.remaining = 0
+        retry_after = float(response_headers.get("Retry-After") or reset or 1.0)
+        self.reset_at = max(self.reset_at, time.monotonic() + retry_after)
+        return retry_after
+
+
+def search_queries(tickers: List[str], max_length: int = MAX_QUERY_LENGTH) -> List[str]:
+    """Tickers OR'd into as few search queries as fit Reddit's query length"""
+    queries: List[str] = []
+    current = ""
+    for symbol in dict.fromkeys(t.strip().lstrip("$").upper() for t in tickers if t.strip()):
+        candidate = f"{current} OR {symbol}" if current else symbol
+        if current and len(candidate) > max_length:
+            queries.append(current)
+            candidate = symbol
+        current = candidate
+    if current:
+        queries.append(current)
+    return queries
+
+
+def ticker_pattern(tickers: List[str]) -> "re.Pattern":
+    """
+    Matches any of the tickers as a whole word: case-insensitively after a
+    $, and only in capitals without one (so ALL or IT in a sentence don't count).
+    """
+    symbols = "|".join(sorted({re.escape(t.strip().lstrip("$").upper()) for t in tickers}, key=len, reverse=True))
+    return re.compile(rf"\$(?i:({symbols}))\b|\b({symbols})\b")
+
+
+def matched_tickers(pattern: "re.Pattern", text: str) -> List[str]:
+    return list(dict.fromkeys((a or b).upper() for a, b in pattern.findall(text)))
+
+
+def _walk_comments(children: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Depth-first over a comment listing; 'more' stubs are skipped, not expanded"""
+    stack = list(reversed(children))
+    while stack:
+        child = stack.pop()
+        if child.get("kind") != "t1":
+            continue
+        data = child["data"]
+        yield data
+        replies = data.get("replies")
+        if isinstance(replies, dict):
+            stack.extend(reversed(replies["data"]["children"]))
+
+
+class RedditHarvester:
+    """
+    Streams comments mentioning any of a set of tickers from one subreddit.
+
+    One search per batch of OR'd tickers finds the newest posts; their
+    comment trees are then fetched concurrently (up to `concurrency`,
+    paced by Reddit's rate-limit headers) and matching comments are
+    yielded as each tree arrives. Comment listings come back without the
+    "load more" stubs expanded, so no post ever stalls the sweep the way
+    replace_more() did. Posts already fetched are skipped until their
+    comment count grows.
+    """
+
+    def __init__(self, subreddit: str, client_id: Optional[str] = REDDIT_CLIENT_ID,
+                 client_secret: Optional[str] = REDDIT_CLIENT_SECRET, user_agent: str = REDDIT_USER_AGENT,
+                 concurrency: int = REDDIT_CONCURRENCY, comments_per_post: int = REDDIT_COMMENTS_PER_POST,
+                 seen_capacity: int = REDDIT_SEEN_POSTS):
+        self.subreddit = subreddit
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.user_agent = user_agent
+        self.concurrency = max(1, concurrency)
+        self.comments_per_post = comments_per_post
+        self.seen_capacity = seen_capacity
+        self.rate_limiter = RedditRateLimiter()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._token: Optional[str] = None
+        self._token_expires = 0.0
+        self._auth_lock = asyncio.Lock()
+        self._seen_posts: "OrderedDict[str, int]" = OrderedDict()
+        self.stats = {"searches": 0, "posts": 0, "posts_skipped": 0, "trees": 0, "tree_errors": 0,
+                      "comments": 0, "matched": 0}
+
+    async def start(self):
+        if not self.client_id or not self.client_secret:
+            raise RuntimeError("REDDIT_CLIENT_ID / REDDIT_CLIENT_SECRET not found in .env")
+        self.session = aiohttp.ClientSession(headers={"User-Agent": self.user_agent})
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def _authorize(self) -> str:
+        """App-only OAuth token, renewed a minute before it expires"""
+        async with self._auth_lock:
+            if self._token and time.monotonic() < self._token_expires - 60:
+                return self._token
+            auth = aiohttp.BasicAuth(self.client_id, self.client_secret)
+            async with self.session.post(REDDIT_AUTH_URL, auth=auth,
+                                         data={"grant_type": "client_credentials"}) as resp:
+                resp.raise_for_status()
+                body = await resp.json()
+            self._token = body["access_token"]
+            self._token_expires = time.monotonic() + float(body.get("expires_in", 3600))
+            return self._token
+
+    async def _get(self, path: str, params: Dict[str, Any], max_retries: int = 3) -> Any:
+        for _ in range(max_retries + 1):
+            token = await self._authorize()
+            await self.rate_limiter.acquire()
+            async with self.session.get(f"{REDDIT_API}{path}", params={**params, "raw_json": 1},
+                                        headers={"Authorization": f"bearer {token}"}) as resp:
+                retry_after = self.rate_limiter.update(resp.headers, resp.status)
+                if resp.status == 200:
+                    return await resp.json()
+                if resp.status == 429:
+                    print(f"⏳ Reddit rate limited, waiting {retry_after:.1f}s")
+                    continue
+                if resp.status == 401:
+                    self._token = None
+                    continue
+                print(f"Failed to fetch {path}: {resp.status} {await resp.text()}")
+                return None
+        return None
+
+    async def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Newest posts in the subreddit matching `query`"""
+        self.stats["searches"] += 1
+        body = await self._get(f"/r/{self.subreddit}/search",
+                               {"q": query, "restrict_sr": 1, "sort": "new", "limit": min(limit, 100)})
+        if not body:
+            return []
+        return [child["data"] for child in body["data"]["children"] if child.get("kind") == "t3"]
+
+    def _is_new(self, post: Dict[str, Any]) -> bool:
+        seen = self._seen_posts.get(post["id"])
+        return seen is None or post.get("num_comments", 0) > seen
+
+    def _mark_seen(self, post: Dict[str, Any]):
+        """Remember a post's comment count once its tree has been fetched"""
+        self._seen_posts[post["id"]] = post.get("num_comments", 0)
+        self._seen_posts.move_to_end(post["id"])
+        while len(self._seen_posts) > self.seen_capacity:
+            self._seen_posts.popitem(last=False)
+
+    async def _comment_tree(self, semaphore: asyncio.Semaphore,
+                            post: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]:
+        """The post and its comments, or None for the comments if the tree couldn't be fetched"""
+        try:
+            async with semaphore:
+                body = await self._get(f"/r/{self.subreddit}/comments/{post['id']}",
+                                       {"sort": "new", "limit": 500, "depth": 5})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # One dropped connection must not end the sweep for every other post
+            print(f"Failed to fetch comments for {post['id']}: {e!r}")
+            body = None
+        if not body or len(body) < 2:
+            self.stats["tree_errors"] += 1
+            return post, None
+        self.stats["trees"] += 1
+        return post, list(_walk_comments(body[1]["data"]["children"]))
+
+    async def harvest(self, tickers: List[str], posts_per_query: int = 25) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield {"post", "comment", "tickers", "post_tickers"} for matching comments as comment trees arrive.
+
+        `tickers` are the ones the comment itself names; `post_tickers` the
+        ones in the post's title and text, kept apart so a reply about
+        something else isn't counted as a mention of the post's tickers.
+        At most `comments_per_post` comments are yielded per post. A post
+        whose tree couldn't be fetched is tried again on the next sweep.
+        """
+        pattern = ticker_pattern(tickers)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        posts: Dict[str, Dict[str, Any]] = {}
+        for query in search_queries(tickers):
+            for post in await self.search(query, posts_per_query):
+                posts.setdefault(post["id"], post)
+        self.stats["posts"] += len(posts)
+        fresh = [post for post in posts.values() if self._is_new(post)]
+        self.stats["posts_skipped"] += len(posts) - len(fresh)
+
+        for next_tree in asyncio.as_completed([self._comment_tree(semaphore, post) for post in fresh]):
+            post, comments = await next_tree
+            if comments is None:
+                continue
+            self._mark_seen(post)
+            post_tickers = matched_tickers(pattern, f"{post.get('title', '')} {post.get('selftext', '')}")
+            yielded = 0
+            for comment in comments:
+                self.stats["comments"] += 1
+                body = (comment.get("body") or "").strip()
+                author = comment.get("author") or ""
+                if len(body) <= MIN_COMMENT_LENGTH or author.lower() in IGNORED_AUTHORS or author == "[deleted]":
+                    continue
+                found = matched_tickers(pattern, body)
+                if not found:
+                    continue
+                self.stats["matched"] += 1
+                yield {"post": post, "comment": comment, "tickers": found, "post_tickers": post_tickers}
+                yielded += 1
+                if yielded >= self.comments_per_post:
+                    break
+
+
+async def collect(subreddit: str, tickers: List[str], posts_per_query: int = 25) -> List[Dict[str, Any]]:
+    """Run one sweep and return every match (for scripts that don't stream)"""
+    harvester = RedditHarvester(subreddit)
+    await harvester.start()
+    try:
+        return [match async for match in harvester.harvest(tickers, posts_per_query)]
+    finally:
+        await harvester.close()
+
+
+async def _main(subreddit: str, tickers: List[str], posts: int):
+    harvester = RedditHarvester(subreddit)
+    await harvester.start()
+    started = time.perf_counter()
+    try:
+        async for match in harvester.harvest(tickers, posts):
+            comment = match["comment"]
+            print(f"💬 [{', '.join(match['tickers'])}] u/{comment.get('author')}: {comment['body'][:100]!r}")
+    finally:
+        await harvester.close()
+    stats = harvester.stats
+    limiter = harvester.rate_limiter
+    print(f"\n📊 {stats['searches']} searches, {stats['posts']} posts ({stats['posts_skipped']} unchanged), "
+          f"{stats['trees']} comment trees ({stats['tree_errors']} failed), "
+          f"{stats['matched']}/{stats['comments']} comments matched in {time.perf_counter() - started:.1f}s")
+    print(f"   ⏳ Rate-limit waits: {limiter.waits} ({limiter.wait_seconds:.1f}s), 429s: {limiter.rate_limited}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream comments mentioning tickers from a subreddit")
+    parser.add_argument("--subreddit", default="wallstreetbets")
+    parser.add_argument("--tickers", nargs="+", default=["NVDA", "TSLA", "AAPL"])
+    parser.add_argument("--posts", type=int, default=25, help="Newest posts per search query")
+    args = parser.parse_args()
+    asyncio.run(_main(args.subreddit, args.tickers, args.posts))
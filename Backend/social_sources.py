@@ -0,0 +1,403 @@
+import os
+import re
+import abc
+import time
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+from discord_scraper import headers as discord_headers, setup_mongodb
+from discord_ingest import DISCORD_CHANNEL_IDS, IngestPipeline, MultiChannelIngestor
+from analysis_store import AnalysisStore
+from ticker_rollups import TickerRollups
+from heavy_hitters import heavy_hitters
+from timeseries_store import message_metrics_hook
+from message_writer import fan_out
+from group_filter import group_filter
+from timeutils import parse_timestamp
+from reddit_harvester import RedditHarvester
+from x_search import XSearch
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Tickers swept by default, comma separated
+SOCIAL_TICKERS = [t.strip() for t in os.getenv("SOCIAL_TICKERS", "AAPL,TSLA,NVDA").split(",") if t.strip()]
+SOCIAL_POSTS_PER_TICKER = int(os.getenv("SOCIAL_POSTS_PER_TICKER", "10"))
+# Post ids remembered between rounds so they aren't looked up or analyzed again
+SOCIAL_SEEN_CAPACITY = int(os.getenv("SOCIAL_SEEN_CAPACITY", "50000"))
+
+REDDIT_SUBREDDIT = os.getenv("REDDIT_SUBREDDIT", "wallstreetbets")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Shorter texts ("$SPY calls") are too common to mean the same post was cross-posted
+MIN_FINGERPRINT_LENGTH = 40
+
+
+def cashtag(ticker: str) -> str:
+    return "$" + ticker.strip().lstrip("$").upper()
+
+
+def social_post(source: str, post_id: str, content: str, author_id: Optional[str], author_name: Optional[str],
+                timestamp: Any, channel_id: str, url: Optional[str] = None, tickers: Iterable[str] = (),
+                metrics: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    The normalized post record every source produces.
+
+    It has the shape of a Discord message (id, author, content, timestamp,
+    channel_id), so grouping, the pre-filter, analysis and
+    build_stock_message_doc take posts from any source unchanged. `tickers`
+    holds the tickers the source found the post for; `source` and `url`
+    are stored with the message.
+    """
+    return {
+        "id": post_id,
+        "source": source,
+        "author": {"id": author_id, "username": author_name or "unknown"},
+        "content": content,
+        "timestamp": parse_timestamp(timestamp),
+        "channel_id": channel_id,
+        "guild_id": None,
+        "url": url,
+        "tickers": [cashtag(t) for t in tickers],
+        "metrics": metrics or {},
+    }
+
+
+def content_fingerprint(post: Dict[str, Any]) -> Optional[str]:
+    """Same text from any source (cross-posts, reposts) gives the same fingerprint; None for short texts"""
+    text = _WHITESPACE_RE.sub(" ", (post.get("content") or "").lower()).strip()
+    if len(text) < MIN_FINGERPRINT_LENGTH:
+        return None
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def engagement(post: Dict[str, Any]) -> int:
+    return sum(value for value in post.get("metrics", {}).values() if isinstance(value, int))
+
+
+class SocialSource(abc.ABC):
+    """
+    An async source of normalized posts.
+
+    Subclasses implement fetch(), answering every ticker of a round at
+    once (batched searches, channel polls). start()/close() open and
+    release whatever the source holds (HTTP sessions, clients).
+    """
+
+    name = "source"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def commit(self):
+        """Called once the posts of the last fetch() have been submitted to the pipeline"""
+
+    @abc.abstractmethod
+    async def fetch(self, tickers: List[str], limit: int = SOCIAL_POSTS_PER_TICKER) -> List[Dict[str, Any]]:
+        """Normalized posts (see social_post) about `tickers`, up to about `limit` per ticker"""
+
+
+class DiscordSource(SocialSource):
+    """
+    New messages from Discord channels.
+
+    Channels aren't searched by ticker: each round returns what was posted
+    since the previous round (the newest stored message on the first one)
+    and the pipeline's stock filter decides what is kept. A channel's
+    cursor only moves past a page once commit() confirms the page was
+    submitted, and a channel whose request failed is asked again next
+    round. Requests share discord_ingest's per-bucket rate limiter.
+    """
+
+    name = "discord"
+
+    def __init__(self, channel_ids: List[str] = DISCORD_CHANNEL_IDS, db=None):
+        self.channel_ids = channel_ids
+        self.db = db
+        self.fetcher = MultiChannelIngestor(pipeline=None, checkpoints=None)
+        self.after: Dict[str, Optional[str]] = {}
+        # Newest id per channel in the last fetch, applied to `after` by commit()
+        self._fetched_after: Dict[str, str] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        # requests silently drops None headers (missing token), aiohttp doesn't
+        self.session = aiohttp.ClientSession(headers={k: v for k, v in discord_headers.items() if v})
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def _channel(self, channel_id: str) -> List[Dict[str, Any]]:
+        try:
+            if channel_id not in self.after and self.db is not None:
+                last = await asyncio.to_thread(
+                    self.db["stock_messages"].find_one,
+                    {"channel_id": channel_id}, sort=[("timestamp", -1)], projection={"discord_id": 1},
+                )
+                self.after[channel_id] = last["discord_id"] if last else None
+            # None when the request failed; the cursor stays put and the channel is asked again next round
+            page = await self.fetcher.fetch_messages(self.session, channel_id, after=self.after.get(channel_id)) or []
+        except Exception as e:
+            print(f"❌ Discord channel {channel_id} fetch failed: {e}")
+            return []
+        if page:
+            self._fetched_after[channel_id] = max(page, key=lambda m: int(m["id"]))["id"]
+        posts = []
+        for msg in page:
+            guild_id = msg.get("guild_id")
+            posts.append({
+                **msg,
+                "source": self.name,
+                "channel_id": msg.get("channel_id", channel_id),
+                "url": f"https://discord.com/channels/{guild_id}/{channel_id}/{msg['id']}" if guild_id else None,
+                "metrics": {"reactions": sum(r.get("count", 0) for r in msg.get("reactions") or [])},
+            })
+        return posts
+
+    async def fetch(self, tickers: List[str], limit: int = SOCIAL_POSTS_PER_TICKER) -> List[Dict[str, Any]]:
+        self._fetched_after = {}
+        posts: List[Dict[str, Any]] = []
+        for page in await asyncio.gather(*(self._channel(cid) for cid in self.channel_ids)):
+            posts.extend(page)
+        return posts
+
+    def commit(self):
+        self.after.update(self._fetched_after)
+        self._fetched_after = {}
+
+
+class RedditSource(SocialSource):
+    """
+    Comments mentioning the tickers under the newest r/<subreddit> posts.
+
+    All tickers are covered by one RedditHarvester sweep (OR'd searches,
+    concurrent comment trees) instead of a search per ticker.
+    """
+
+    name = "reddit"
+
+    def __init__(self, subreddit: str = REDDIT_SUBREDDIT, harvester: Optional[RedditHarvester] = None):
+        self.subreddit = subreddit
+        self.harvester = harvester or RedditHarvester(subreddit)
+
+    async def start(self):
+        await self.harvester.start()
+
+    async def close(self):
+        await self.harvester.close()
+
+    async def fetch(self, tickers: List[str], limit: int = SOCIAL_POSTS_PER_TICKER) -> List[Dict[str, Any]]:
+        posts = []
+        async for match in self.harvester.harvest(tickers, posts_per_query=limit * len(tickers)):
+            post, comment = match["post"], match["comment"]
+            posts.append(social_post(
+                self.name, f"reddit-{post['id']}-{comment['id']}", comment["body"].strip(),
+                author_id=comment.get("author_fullname") or comment["author"], author_name=comment["author"],
+                timestamp=comment.get("created_utc"), channel_id=f"reddit/r/{self.subreddit}",
+                url=f"https://reddit.com{comment.get('permalink') or post.get('permalink', '')}",
+                tickers=match["tickers"],
+                metrics={"upvotes": comment.get("score", 0),
+                         "replies": len((comment.get("replies") or {}).get("data", {}).get("children", []))},
+            ))
+        return posts
+
+
+class XSource(SocialSource):
+    """
+    Recent English tweets with the tickers' cashtags.
+
+    XSearch answers every ticker from combined, cached queries; a tweet
+    naming several of the tickers becomes one post attributed to all of them.
+    """
+
+    name = "x"
+
+    def __init__(self, search: Optional[XSearch] = None):
+        self.search = search or XSearch()
+
+    async def start(self):
+        await self.search.start()
+
+    async def close(self):
+        await self.search.close()
+
+    async def fetch(self, tickers: List[str], limit: int = SOCIAL_POSTS_PER_TICKER) -> List[Dict[str, Any]]:
+        tweets: Dict[str, Dict[str, Any]] = {}
+        tweet_tickers: Dict[str, List[str]] = {}
+        for ticker, found in (await self.search.search(tickers, limit)).items():
+            for tweet in found:
+                tweets[tweet["id"]] = tweet
+                tweet_tickers.setdefault(tweet["id"], []).append(ticker)
+        return [social_post(
+            self.name, tweet["id"] if tweet["source"] != "twitter" else f"twitter-{tweet['id']}", tweet["text"],
+            author_id=tweet["author_id"], author_name=tweet["username"], timestamp=tweet["created_at"],
+            channel_id="x/search", url=tweet["url"], tickers=tweet_tickers[tweet_id], metrics=tweet["metrics"],
+        ) for tweet_id, tweet in tweets.items()]
+
+
+SOURCES = {"discord": DiscordSource, "reddit": RedditSource, "x": XSource}
+
+
+class SocialIngestor:
+    """
+    Fetches every source concurrently, dedupes, and feeds the shared IngestPipeline.
+
+    Each round asks all sources for the same tickers at once; a failing
+    source is logged and skipped. Posts are deduplicated by id and by
+    content fingerprint across sources (the most engaged copy wins), and
+    ids already stored or seen in an earlier round are dropped before
+    they can cost an analysis call. Ids the pipeline reports as failed
+    (analysis or storage raised) are forgotten at the start of the next
+    round, so those posts are submitted again if a source still returns them.
+    """
+
+    def __init__(self, sources: List[SocialSource], pipeline: IngestPipeline,
+                 seen_capacity: int = SOCIAL_SEEN_CAPACITY):
+        self.sources = sources
+        self.pipeline = pipeline
+        self.seen_capacity = seen_capacity
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.stats: Dict[str, Any] = {"rounds": 0, "fetched": 0, "duplicates": 0, "already_seen": 0,
+                                      "submitted": 0, "failed": 0, "sources": {}}
+
+    async def _fetch_source(self, source: SocialSource, tickers: List[str], limit: int) -> List[Dict[str, Any]]:
+        stats = self.stats["sources"].setdefault(source.name, {"posts": 0, "errors": 0, "seconds": 0.0})
+        started = time.perf_counter()
+        try:
+            posts = await source.fetch(tickers, limit)
+        except Exception as e:
+            print(f"❌ {source.name} fetch failed: {e}")
+            stats["errors"] += 1
+            posts = []
+        stats["posts"] += len(posts)
+        stats["seconds"] += time.perf_counter() - started
+        return posts
+
+    def _remember(self, ids: Iterable[str]):
+        for post_id in ids:
+            self._seen[post_id] = None
+        while len(self._seen) > self.seen_capacity:
+            self._seen.popitem(last=False)
+
+    def _forget_failed(self):
+        failed = self.pipeline.take_failed_ids()
+        for post_id in failed:
+            self._seen.pop(post_id, None)
+        self.stats["failed"] += len(failed)
+
+    def dedupe(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One post per id and per content fingerprint; the ids of the copies dropped are remembered as seen"""
+        best: Dict[str, Dict[str, Any]] = {}
+        ids = set()
+        for post in posts:
+            if post["id"] in ids:
+                continue
+            ids.add(post["id"])
+            key = content_fingerprint(post) or post["id"]
+            if key not in best or engagement(post) > engagement(best[key]):
+                best[key] = post
+        self.stats["duplicates"] += len(posts) - len(best)
+        kept = {post["id"] for post in best.values()}
+        # Otherwise a losing copy comes back next round and is analyzed once its winner has been seen
+        self._remember(post_id for post_id in ids if post_id not in kept)
+        return list(best.values())
+
+    async def _unseen(self, posts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        posts = [post for post in posts if post["id"] not in self._seen]
+        stored = set()
+        if posts:
+            cursor = await asyncio.to_thread(
+                lambda: list(self.pipeline.db["stock_messages"].find(
+                    {"discord_id": {"$in": [post["id"] for post in posts]}}, {"_id": 0, "discord_id": 1})))
+            stored = {doc["discord_id"] for doc in cursor}
+        self._remember(post["id"] for post in posts)
+        return [post for post in posts if post["id"] not in stored]
+
+    async def run_once(self, tickers: List[str], limit: int = SOCIAL_POSTS_PER_TICKER) -> int:
+        """One round over every source; returns the posts submitted to the pipeline"""
+        self._forget_failed()
+        batches = await asyncio.gather(*(self._fetch_source(source, tickers, limit) for source in self.sources))
+        posts = [post for batch in batches for post in batch]
+        self.stats["fetched"] += len(posts)
+        unique = self.dedupe(posts)
+        fresh = await self._unseen(unique)
+        self.stats["already_seen"] += len(unique) - len(fresh)
+
+        by_channel: Dict[str, List[Dict[str, Any]]] = {}
+        for post in fresh:
+            by_channel.setdefault(post["channel_id"], []).append(post)
+        for channel_id, channel_posts in by_channel.items():
+            await self.pipeline.submit_page(channel_id, channel_posts, checkpoint=False)
+        for source in self.sources:
+            source.commit()
+        self.stats["rounds"] += 1
+        self.stats["submitted"] += len(fresh)
+        return len(fresh)
+
+    async def run(self, tickers: List[str], rounds: int = 1, interval: float = 300,
+                  limit: int = SOCIAL_POSTS_PER_TICKER):
+        for source in self.sources:
+            await source.start()
+        self.pipeline.start()
+        try:
+            for round_number in range(rounds):
+                if round_number:
+                    await asyncio.sleep(interval)
+                submitted = await self.run_once(tickers, limit)
+                print(f"🌐 Round {round_number + 1}: {submitted} new posts for {', '.join(tickers)}")
+        finally:
+            await self.pipeline.close()
+            for source in self.sources:
+                await source.close()
+
+
+async def main(tickers: List[str], source_names: List[str], rounds: int, interval: float, limit: int):
+    db = setup_mongodb()
+    if db is None:
+        print("❌ Cannot proceed without MongoDB connection")
+        return
+    analyses = AnalysisStore(db)
+    heavy_hitters.restore(db)
+    rollups = TickerRollups(db, tracker=heavy_hitters)
+    writer = analyses.message_writer(db["stock_messages"],
+                                     after_flush=fan_out(rollups.record, message_metrics_hook(db)))
+    pipeline = IngestPipeline(db, writer, analyses=analyses)
+    sources = [SOURCES[name](db=db) if name == "discord" else SOURCES[name]() for name in source_names]
+    ingestor = SocialIngestor(sources, pipeline)
+
+    started = time.perf_counter()
+    await ingestor.run(tickers, rounds=rounds, interval=interval, limit=limit)
+    writer.close()
+    heavy_hitters.snapshot()
+
+    stats = ingestor.stats
+    print(f"\n📊 {stats['rounds']} rounds in {time.perf_counter() - started:.1f}s")
+    for name, source_stats in stats["sources"].items():
+        print(f"   {name}: {source_stats['posts']} posts, {source_stats['errors']} errors, "
+              f"{source_stats['seconds']:.1f}s fetching")
+    print(f"   Fetched: {stats['fetched']}  Duplicates: {stats['duplicates']}  "
+          f"Already seen: {stats['already_seen']}  New: {stats['submitted']}  Failed: {stats['failed']}")
+    print(f"   ✅ Stored: {pipeline.stats['stored']}  ⏭️  Skipped: {pipeline.stats['skipped']}  "
+          f"❌ Errors: {pipeline.stats['errors']}")
+    print(f"   {group_filter.report()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest posts about tickers from several social sources")
+    parser.add_argument("--tickers", nargs="+", default=SOCIAL_TICKERS)
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=300, help="Seconds between rounds")
+    parser.add_argument("--limit", type=int, default=SOCIAL_POSTS_PER_TICKER, help="Posts per ticker per source")
+    args = parser.parse_args()
+    asyncio.run(main(args.tickers, args.sources, args.rounds, args.interval, args.limit))
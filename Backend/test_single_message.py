@@ -1,8 +1,10 @@
 import requests
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 import json
+from llm_scheduler import PRIORITY_INTERACTIVE
+from gemini_models import model_registry
+from llm_json import extract_json, LLMJSONError
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -16,9 +18,8 @@ headers = {
     "User-Agent": "Mozilla/5.0",
 }
 
-# Gemini setup
+# Gemini setup (model is resolved lazily by the registry)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
 
 def get_single_message(channel_id):
     """Get just 1 message from Discord"""
@@ -35,18 +36,6 @@ def get_single_message(channel_id):
 def analyze_single_message(message):
     """Analyze a single Discord message for trade-related content"""
     try:
-        # Try different models
-        try:
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            print("Using gemini-1.5-flash model")
-        except Exception as e:
-            try:
-                model = genai.GenerativeModel("gemini-1.5-pro")
-                print("Using gemini-1.5-pro model")
-            except Exception as e2:
-                model = genai.GenerativeModel("gemini-pro")
-                print("Using gemini-pro model")
-        
         # Extract message content
         content = message.get('content', '')
         author = message.get('author', {})
@@ -85,25 +74,17 @@ Now analyze the message and respond with JSON only:
         print(f"\n🔍 Analyzing message from {author_name}...")
         print(f"Message: {content[:100]}...")
         
-        response = model.generate_content(prompt)
+        response = model_registry.generate(prompt, priority=PRIORITY_INTERACTIVE,
+                                           stage="test_single_message")
         
-        # Clean the response text - remove markdown code blocks if present
         response_text = response.text.strip()
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]  # Remove ```json
-        if response_text.startswith('```'):
-            response_text = response_text[3:]  # Remove ```
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]  # Remove trailing ```
-        
-        response_text = response_text.strip()
         
-        # Try to parse JSON response
+        # Try to parse JSON response (tolerates markdown fences and stray prose)
         try:
-            result = json.loads(response_text)
+            result = extract_json(response_text)
             print(f"\n✅ Analysis complete!")
             return result
-        except json.JSONDecodeError as e:
+        except LLMJSONError as e:
             print(f"❌ Failed to parse JSON response: {e}")
             print(f"Cleaned response: {response_text}")
             
@@ -0,0 +1,36 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+# Backend modules are flat and import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules that configure Gemini at import time refuse to load without a key
+os.environ.setdefault("GEMINI_API_KEY", "test")
+# Keep test calls out of the real LLM call log
+os.environ["LLM_METRICS_LOG"] = ""
+
+
+@pytest.fixture
+def fake_server():
+    """
+    `async with fake_server(web.get(path, handler), ...) as url:` serves the
+    routes on a free local port inside the test's own event loop and yields
+    the base URL to point the client module at.
+    """
+    @asynccontextmanager
+    async def serve(*routes):
+        app = web.Application()
+        app.router.add_routes(routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        try:
+            host, port = runner.addresses[0][:2]
+            yield f"http://{host}:{port}"
+        finally:
+            await runner.cleanup()
+    return serve
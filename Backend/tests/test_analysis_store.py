@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+
+from analysis_store import MIGRATION_INDEX_NAME, AnalysisStore, migrate_embedded_analyses
+
+
+def test_migration_groups_identical_analyses_per_author():
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    start = datetime(2024, 3, 1, 15)
+    bullish = {"has_trade_info": True, "tickers": ["$AAPL"], "sentiment": "bullish"}
+    bearish = {"has_trade_info": True, "tickers": ["$TSLA"], "sentiment": "bearish"}
+    rows = [("alice", bullish), ("bob", bearish), ("alice", bullish), ("bob", bearish), ("alice", bearish)]
+    db["stock_messages"].insert_many([
+        {"discord_id": str(i), "author_username": author, "channel_id": "1", "ai_analysis": analysis,
+         "timestamp": start + timedelta(minutes=i)}
+        for i, (author, analysis) in enumerate(rows)
+    ])
+
+    migrated_from = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    totals = migrate_embedded_analyses(db, batch_size=2)
+
+    assert (totals["messages"], totals["analyses"]) == (5, 3)
+    messages = {m["discord_id"]: m for m in db["stock_messages"].find()}
+    assert not any("ai_analysis" in m for m in messages.values())
+    assert messages["0"]["analysis_id"] == messages["2"]["analysis_id"] != messages["4"]["analysis_id"]
+    assert messages["1"]["analysis_id"] == messages["3"]["analysis_id"]
+    # Newer than any sync watermark, so the incremental analyzed_messages sync sees them
+    assert all(m["updated_at"] >= migrated_from for m in messages.values())
+    assert MIGRATION_INDEX_NAME not in db["stock_messages"].index_information()
+
+    # Re-running after completion is a no-op
+    assert migrate_embedded_analyses(db)["messages"] == 0
+    assert db[AnalysisStore(db).collection.name].count_documents({}) == 3
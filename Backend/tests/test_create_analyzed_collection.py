@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+from analysis_store import ANALYSES_COLLECTION, STATUS_FALLBACK, STATUS_PROPER
+from create_analyzed_collection import ANALYZED_COLLECTION, SYNC_STATE_COLLECTION, sync_analyzed_messages
+
+HOUR_AGO = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)
+
+
+@pytest.fixture
+def merge_stage(monkeypatch):
+    """
+    mongomock has no $merge: run the rest of the pipeline and upsert the
+    results by _id (whenMatched replace, whenNotMatched insert).
+    """
+    aggregate = mongomock.collection.Collection.aggregate
+
+    def with_merge(self, pipeline, **kwargs):
+        if "$merge" not in pipeline[-1]:
+            return aggregate(self, pipeline, **kwargs)
+        into = self.database[pipeline[-1]["$merge"]["into"]]
+        for doc in aggregate(self, pipeline[:-1], **kwargs):
+            into.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        return iter([])
+
+    monkeypatch.setattr(mongomock.collection.Collection, "aggregate", with_merge)
+
+
+@pytest.fixture
+def db(merge_stage):
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    db[ANALYSES_COLLECTION].insert_many([
+        {"_id": "bullish", "analysis": {"has_trade_info": True, "sentiment": "bullish", "confidence": 8}},
+        {"_id": "failed", "analysis": {"has_trade_info": False, "sentiment": "neutral", "confidence": 0}},
+    ])
+    db["stock_messages"].insert_many([
+        message("1", "bullish", STATUS_PROPER),
+        message("2", "bullish", STATUS_PROPER),
+        message("3", "failed", STATUS_FALLBACK),
+    ])
+    return db
+
+
+def message(discord_id, analysis_id, status, updated_at=HOUR_AGO):
+    return {"_id": discord_id, "discord_id": discord_id, "content": "$AAPL calls", "analysis_id": analysis_id,
+            "analysis_status": status, "updated_at": updated_at}
+
+
+def reanalyze(db, discord_id, analysis_id, status):
+    db["stock_messages"].update_one({"_id": discord_id}, {"$set": {
+        "analysis_id": analysis_id, "analysis_status": status,
+        "updated_at": datetime.now(timezone.utc).replace(tzinfo=None)}})
+
+
+def analyzed(db):
+    return {doc["_id"]: doc["ai_analysis"].get("sentiment") for doc in db[ANALYZED_COLLECTION].find()}
+
+
+def test_first_sync_rebuilds_and_records_the_watermark(db):
+    started = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = sync_analyzed_messages(db)
+
+    assert (result["mode"], result["merged"], result["removed"]) == ("full", 2, 0)
+    assert analyzed(db) == {"1": "bullish", "2": "bullish"}
+    state = db[SYNC_STATE_COLLECTION].find_one({"_id": ANALYZED_COLLECTION})
+    # Backed off by the overlap so late-visible writes are re-read next time
+    assert started - timedelta(seconds=61) < state["watermark"] < started
+    assert state["last_mode"] == "full"
+    assert "analyzed_messages_rebuild" not in db.list_collection_names()
+
+
+def test_incremental_sync_merges_changes_and_deletes_stale(db):
+    sync_analyzed_messages(db)
+    reanalyze(db, "3", "bullish", STATUS_PROPER)
+    reanalyze(db, "1", "failed", STATUS_FALLBACK)
+
+    result = sync_analyzed_messages(db)
+
+    assert (result["mode"], result["merged"], result["removed"]) == ("incremental", 1, 1)
+    assert analyzed(db) == {"2": "bullish", "3": "bullish"}
+    assert db[SYNC_STATE_COLLECTION].find_one({"_id": ANALYZED_COLLECTION})["last_mode"] == "incremental"
+
+
+def test_incremental_sync_skips_messages_older_than_the_watermark(db):
+    sync_analyzed_messages(db)
+    # Changed without a new updated_at: invisible to the incremental sync
+    db["stock_messages"].update_one({"_id": "3"}, {"$set": {"analysis_id": "bullish",
+                                                            "analysis_status": STATUS_PROPER}})
+
+    assert sync_analyzed_messages(db)["merged"] == 0
+    assert "3" not in analyzed(db)
+    # ...until a full sync
+    assert sync_analyzed_messages(db, full=True)["mode"] == "full"
+    assert analyzed(db) == {"1": "bullish", "2": "bullish", "3": "bullish"}
+
+
+def test_missing_collection_forces_a_full_sync(db):
+    sync_analyzed_messages(db)
+    db[ANALYZED_COLLECTION].drop()
+
+    result = sync_analyzed_messages(db)
+
+    assert (result["mode"], result["merged"]) == ("full", 2)
+    assert analyzed(db) == {"1": "bullish", "2": "bullish"}
@@ -0,0 +1,159 @@
+import asyncio
+
+import mongomock
+
+import discord_ingest
+from discord_gateway import GatewayClient, StreamingIngestor
+from discord_ingest import IngestPipeline
+from fake_gateway import FakeGateway
+from message_writer import BufferedMessageWriter
+
+
+async def wait_for(condition, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_resume_replays_events_missed_while_disconnected():
+    async def run():
+        gateway = FakeGateway(port=0)
+        await gateway.start()
+        events = []
+
+        async def handler(event_type, data):
+            events.append((event_type, data.get("content")))
+
+        client = GatewayClient("token", handler, gateway_url=gateway.url, max_backoff=0.2)
+        task = asyncio.create_task(client.run())
+        try:
+            await wait_for(lambda: ("READY", None) in events)
+            await gateway.dispatch_message("1", "$AAPL calls")
+            await wait_for(lambda: ("MESSAGE_CREATE", "$AAPL calls") in events)
+
+            await gateway.drop_connections()
+            await wait_for(lambda: not gateway._sockets)
+            await gateway.dispatch_message("1", "$TSLA puts while you were away")
+            await wait_for(lambda: ("RESUMED", None) in events)
+
+            await gateway.request_reconnect()
+            await wait_for(lambda: gateway.resumes == 2)
+            await gateway.dispatch_message("1", "$NVDA after reconnect")
+            await wait_for(lambda: ("MESSAGE_CREATE", "$NVDA after reconnect") in events)
+        finally:
+            client.stop()
+            await asyncio.wait_for(task, 5)
+            await gateway.stop()
+
+        messages = [content for event_type, content in events if event_type == "MESSAGE_CREATE"]
+        assert messages == ["$AAPL calls", "$TSLA puts while you were away", "$NVDA after reconnect"]
+        assert (gateway.identifies, gateway.resumes) == (1, 2)
+        assert client.seq == gateway.seq
+
+    asyncio.run(run())
+
+
+def test_invalid_session_identifies_again():
+    async def run():
+        gateway = FakeGateway(port=0)
+        await gateway.start()
+        events = []
+
+        async def handler(event_type, data):
+            events.append(event_type)
+
+        client = GatewayClient("token", handler, gateway_url=gateway.url)
+        task = asyncio.create_task(client.run())
+        try:
+            await wait_for(lambda: events.count("READY") == 1)
+            first_session = client.session_id
+            await gateway.invalidate_session()
+            await wait_for(lambda: events.count("READY") == 2)
+        finally:
+            client.stop()
+            await asyncio.wait_for(task, 5)
+            await gateway.stop()
+        assert gateway.identifies == 2
+        assert client.session_id != first_session
+
+    asyncio.run(run())
+
+
+def test_streamed_messages_reach_the_database(monkeypatch):
+    monkeypatch.setattr(discord_ingest, "analyze_with_context",
+                        lambda group, author: {"has_trade_info": True, "tickers": ["$AAPL"]})
+    db = mongomock.MongoClient()["discord_scraper_test"]
+
+    async def run():
+        gateway = FakeGateway(port=0)
+        await gateway.start()
+        writer = BufferedMessageWriter(db["stock_messages"], flush_interval=0)
+        pipeline = IngestPipeline(db, writer, analyze_workers=1)
+        streamer = StreamingIngestor(pipeline, None, ["1"], linger=0.05)
+        client = GatewayClient("token", streamer.handle_event, gateway_url=gateway.url)
+        task = asyncio.create_task(streamer.run(client))
+        try:
+            await wait_for(lambda: gateway.identifies == 1 and gateway._sockets)
+            await gateway.dispatch_message("1", "$AAPL calls into earnings", "alice")
+            await gateway.dispatch_message("2", "$TSLA in a channel we don't follow", "bob")
+            await gateway.dispatch_message("1", "$AAPL adding more here", "alice")
+            await wait_for(lambda: streamer.received == 2 and pipeline.stats["messages"] == 2)
+        finally:
+            client.stop()
+            await asyncio.wait_for(task, 5)
+            await gateway.stop()
+        writer.close()
+
+    asyncio.run(run())
+    assert sorted(doc["content"] for doc in db["stock_messages"].find()) == [
+        "$AAPL adding more here", "$AAPL calls into earnings"]
+
+
+class StalledPipeline:
+    """submit_page blocks until released, like a pipeline waiting on a slow LLM"""
+
+    def __init__(self):
+        self.released = asyncio.Event()
+        self.pages = []
+
+    def start(self):
+        pass
+
+    async def submit_page(self, channel_id, messages, checkpoint=True):
+        await self.released.wait()
+        self.pages.append([m["content"] for m in messages])
+
+    async def close(self):
+        pass
+
+
+def test_backpressure_does_not_stall_heartbeats():
+    async def run():
+        gateway = FakeGateway(port=0, heartbeat_interval_ms=50)
+        await gateway.start()
+        pipeline = StalledPipeline()
+        streamer = StreamingIngestor(pipeline, None, ["1"], max_batch=1)
+        client = GatewayClient("token", streamer.handle_event, gateway_url=gateway.url, max_backoff=0.2)
+        task = asyncio.create_task(streamer.run(client))
+        try:
+            await wait_for(lambda: gateway.identifies == 1 and gateway._sockets)
+            await gateway.dispatch_message("1", "$AAPL calls")
+            await gateway.dispatch_message("1", "$AAPL more calls")
+            await wait_for(lambda: streamer.received == 1)
+            # Many heartbeat intervals with the pipeline stuck
+            await asyncio.sleep(0.5)
+            assert (client.connects, gateway.resumes) == (1, 0)
+            pipeline.released.set()
+            await wait_for(lambda: len(pipeline.pages) == 2)
+            # A receive loop stuck in submit_page would have missed ACKs and now reconnect
+            await asyncio.sleep(0.3)
+            assert (client.connects, gateway.resumes) == (1, 0)
+        finally:
+            pipeline.released.set()
+            client.stop()
+            await asyncio.wait_for(task, 5)
+            await gateway.stop()
+        assert pipeline.pages == [["$AAPL calls"], ["$AAPL more calls"]]
+
+    asyncio.run(run())
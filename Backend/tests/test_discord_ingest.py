@@ -0,0 +1,123 @@
+import asyncio
+
+import mongomock
+import pytest
+from aiohttp import web
+from pymongo.errors import AutoReconnect
+
+import discord_ingest
+from discord_checkpoints import ChannelCheckpoints
+from analysis_store import AnalysisStore
+from discord_ingest import IngestPipeline, MultiChannelIngestor
+from message_writer import BufferedMessageWriter
+
+
+def message(discord_id):
+    return {"id": str(discord_id), "content": f"Loading up on $AAPL calls #{discord_id}",
+            "timestamp": "2024-03-01T15:00:00+00:00", "author": {"id": "7", "username": "trader"}}
+
+
+class FakeDiscord:
+    """Channel history served newest first; `failures` maps request number -> status"""
+
+    def __init__(self, ids, failures=None):
+        self.ids = sorted(ids, reverse=True)
+        self.failures = failures or {}
+        self.requests = 0
+
+    async def messages(self, request):
+        self.requests += 1
+        status = self.failures.get(self.requests)
+        if status == 429:
+            return web.json_response({"retry_after": 0, "global": False}, status=429)
+        if status:
+            return web.json_response({"message": "error"}, status=status)
+        limit = int(request.query["limit"])
+        ids = self.ids
+        if "before" in request.query:
+            ids = [i for i in ids if i < int(request.query["before"])]
+        if "after" in request.query:
+            ids = [i for i in ids if i > int(request.query["after"])][-limit:]
+        return web.json_response([message(i) for i in ids[:limit]])
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(discord_ingest, "analyze_with_context",
+                        lambda group, author: {"has_trade_info": True, "tickers": ["$AAPL"]})
+    return mongomock.MongoClient()["discord_scraper_test"]
+
+
+def ingest(db, monkeypatch, fake_server, fake, mode="backfill", page_size=50, max_retries=2):
+    async def run():
+        async with fake_server(web.get("/channels/{channel_id}/messages", fake.messages)) as url:
+            monkeypatch.setattr(discord_ingest, "DISCORD_API", url)
+            writer = BufferedMessageWriter(db["stock_messages"], flush_interval=0)
+            checkpoints = ChannelCheckpoints(db)
+            pipeline = IngestPipeline(db, writer, checkpoints, analyze_workers=2)
+            ingestor = MultiChannelIngestor(pipeline, checkpoints, page_size=page_size, max_retries=max_retries)
+            await ingestor.run(["chan"], mode)
+            writer.close()
+            return pipeline, checkpoints.get("chan")
+    # A stage that dies would leave the run blocked on a full queue
+    return asyncio.run(asyncio.wait_for(run(), 30))
+
+
+def test_backfill_stores_everything_and_completes(db, monkeypatch, fake_server):
+    pipeline, state = ingest(db, monkeypatch, fake_server, FakeDiscord(range(1, 121)))
+
+    assert db["stock_messages"].count_documents({}) == 120
+    assert (state["oldest_id"], state["newest_id"], state.get("backfill_complete")) == (1, 120, True)
+
+
+@pytest.mark.parametrize("failures", [{2: 500}, {2: 401}, {2: 429, 3: 429, 4: 429}])
+def test_fetch_error_does_not_complete_backfill(db, monkeypatch, fake_server, failures):
+    pipeline, state = ingest(db, monkeypatch, fake_server, FakeDiscord(range(1, 121), failures))
+
+    assert not state.get("backfill_complete")
+    assert (state["oldest_id"], state["newest_id"]) == (71, 120)
+
+    pipeline, state = ingest(db, monkeypatch, fake_server, FakeDiscord(range(1, 121)))
+    assert state["backfill_complete"] is True
+    assert db["stock_messages"].count_documents({}) == 120
+
+
+def test_incremental_fetches_after_checkpoint(db, monkeypatch, fake_server):
+    ChannelCheckpoints(db).record_page("chan", "1", "100")
+    pipeline, state = ingest(db, monkeypatch, fake_server, FakeDiscord(range(1, 131)), mode="incremental")
+
+    assert pipeline.stats["messages"] == 30
+    assert state["newest_id"] == 130
+
+
+def test_failed_writes_freeze_checkpoints(db, monkeypatch, fake_server):
+    db["stock_messages"].create_index("content", unique=True)
+    db["stock_messages"].insert_one({"discord_id": "x", "content": "Loading up on $AAPL calls #120"})
+
+    pipeline, state = ingest(db, monkeypatch, fake_server, FakeDiscord(range(1, 121)))
+    assert pipeline.write_failed
+    assert "oldest_id" not in state
+    assert not state.get("backfill_complete")
+
+
+def test_store_stage_errors_do_not_block_the_pipeline(db, monkeypatch, fake_server):
+    add = AnalysisStore.add
+    calls = {"n": 0}
+
+    def flaky(self, *args):
+        calls["n"] += 1
+        if calls["n"] % 2:
+            raise AutoReconnect("connection reset")
+        return add(self, *args)
+
+    monkeypatch.setattr(AnalysisStore, "add", flaky)
+    # One group per page and more pages than the queues hold
+    pipeline, state = ingest(db, monkeypatch, fake_server, FakeDiscord(range(1, 61)), page_size=1)
+
+    assert pipeline.write_failed
+    assert pipeline.stats["errors"] == 30
+    assert db["stock_messages"].count_documents({}) == 30
+    failed = pipeline.take_failed_ids()
+    assert len(failed) == 30 and not db["stock_messages"].count_documents({"discord_id": {"$in": failed}})
+    assert pipeline.take_failed_ids() == []
+    assert not state.get("backfill_complete")
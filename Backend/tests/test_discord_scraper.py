@@ -0,0 +1,120 @@
+import mongomock
+import pytest
+
+import discord_scraper
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["discord_scraper_test"]
+
+
+def message(discord_id, content="Loading up on $AAPL calls before earnings"):
+    return {"id": discord_id, "content": content, "timestamp": "2024-03-01T15:00:00+00:00",
+            "author": {"id": "7", "username": "trader"}}
+
+
+def test_store_stock_message(db):
+    assert discord_scraper.store_stock_message(db, message("1"), {"has_trade_info": True}) == "1"
+    assert db["stock_messages"].count_documents({"discord_id": "1"}) == 1
+
+
+def test_store_stock_message_reports_failed_write(db):
+    db["stock_messages"].create_index("content", unique=True)
+    discord_scraper.store_stock_message(db, message("1"), {})
+
+    assert discord_scraper.store_stock_message(db, message("2"), {}) is None
+    assert db["stock_messages"].count_documents({}) == 1
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeDiscord:
+    """Serves a channel's history newest first, with scripted failures per request number"""
+
+    def __init__(self, ids, failures=None):
+        self.ids = sorted(ids, reverse=True)
+        self.failures = failures or {}
+        self.requests = 0
+
+    def get(self, url, headers=None, params=None):
+        self.requests += 1
+        if self.requests in self.failures:
+            status = self.failures[self.requests]
+            return FakeResponse(status, {"retry_after": 0} if status == 429 else {"message": "error"})
+        ids = self.ids
+        if params.get("before"):
+            ids = [i for i in ids if i < int(params["before"])]
+        page = ids[:params["limit"]]
+        return FakeResponse(200, [message(str(i)) for i in page])
+
+
+def store_all(db, messages, writer, analyses=None):
+    for msg in messages:
+        writer.add({"discord_id": msg["id"], "content": msg["content"]})
+    return [], len(messages), 0
+
+
+@pytest.fixture
+def backfill(db, monkeypatch):
+    monkeypatch.setattr(discord_scraper, "process_messages", store_all)
+    monkeypatch.setattr(discord_scraper.time, "sleep", lambda seconds: None)
+    checkpoints = discord_scraper.ChannelCheckpoints(db)
+
+    def run(fake, writer=None):
+        monkeypatch.setattr(discord_scraper.requests, "get", fake.get)
+        writer = writer or discord_scraper.BufferedMessageWriter(db["stock_messages"], flush_interval=0)
+        return discord_scraper.run_backfill(db, "chan", writer, checkpoints)
+    return run, checkpoints
+
+
+def test_backfill_walks_history_and_completes(db, backfill):
+    run, checkpoints = backfill
+    totals = run(FakeDiscord(range(1, 251)))
+
+    assert totals["fetched"] == 250
+    state = checkpoints.get("chan")
+    assert (state["oldest_id"], state["newest_id"], state.get("backfill_complete")) == (1, 250, True)
+
+
+@pytest.mark.parametrize("status", [500, 401, 429])
+def test_backfill_error_is_not_the_end_of_the_channel(db, backfill, status):
+    run, checkpoints = backfill
+    # Page 2 fails (a 429 fails on every retry)
+    failures = {2: status} if status != 429 else {n: 429 for n in range(2, 6)}
+    with pytest.raises(discord_scraper.DiscordAPIError):
+        run(FakeDiscord(range(1, 251), failures))
+
+    state = checkpoints.get("chan")
+    assert not state.get("backfill_complete")
+    # The page that did arrive is stored and checkpointed, so a rerun resumes below it
+    assert (state["oldest_id"], state["newest_id"]) == (151, 250)
+
+    totals = run(FakeDiscord(range(1, 251)))
+    assert totals["fetched"] == 150
+    assert checkpoints.get("chan")["backfill_complete"] is True
+
+
+def test_rate_limit_retry_succeeds(db, backfill):
+    run, checkpoints = backfill
+    assert run(FakeDiscord(range(1, 51), {1: 429}))["fetched"] == 50
+    assert checkpoints.get("chan")["backfill_complete"] is True
+
+
+def test_failed_writes_do_not_move_the_checkpoint(db, backfill):
+    run, checkpoints = backfill
+    db["stock_messages"].create_index("content", unique=True)
+    db["stock_messages"].insert_one({"discord_id": "x", "content": "Loading up on $AAPL calls before earnings"})
+
+    with pytest.raises(discord_scraper.IngestWriteError):
+        run(FakeDiscord(range(1, 51)))
+    assert "oldest_id" not in checkpoints.get("chan")
+    assert not checkpoints.get("chan").get("backfill_complete")
@@ -0,0 +1,81 @@
+import pytest
+
+import gemini_models
+from gemini_models import ModelRegistry
+from llm_json import parse_stream
+from llm_scheduler import GeminiScheduler
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class Usage:
+    prompt_token_count = 40
+    candidates_token_count = 8
+    total_token_count = 48
+
+
+class FakeStream:
+    """A stream=True response: iterable chunks, usage known once read"""
+
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.usage_metadata = Usage()
+
+    def __iter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i == self.fail_after:
+                raise ResourceExhausted("429 quota exceeded")
+            yield chunk
+
+
+class FakeModel:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = GeminiScheduler(rpm=1000, tpm=10_000_000, retry_backoff=0.01)
+    monkeypatch.setattr(gemini_models, "gemini_scheduler", scheduler)
+    return scheduler
+
+
+def registry_with(models):
+    registry = ModelRegistry(candidates=list(models))
+    registry._configured = True
+    registry._models.update(models)
+    return registry
+
+
+def test_quota_error_mid_stream_is_requeued(scheduler):
+    model = FakeModel([FakeStream(['{"a": ', '1}'], fail_after=1), FakeStream(['{"a": ', '1}'])])
+    registry = registry_with({"flash": model})
+
+    assert registry.generate("prompt", stream=True, consume=parse_stream) == {"a": 1}
+    assert model.calls == 2
+    assert scheduler.stats()["requeued_on_quota"] == 1
+
+
+def test_stream_usage_settles_tpm_reservation(scheduler):
+    registry = registry_with({"flash": FakeModel([FakeStream(['{"a": 1}'])])})
+
+    registry.generate("x" * 4000, stream=True, consume=parse_stream)
+    assert scheduler.stats()["budget"]["tokens_last_minute"] == Usage.total_token_count
+
+
+def test_exhausted_quota_fails_over_to_next_model(scheduler):
+    scheduler.max_retries = 0
+    flash = FakeModel([FakeStream(['{"a": 1}'], fail_after=0)])
+    pro = FakeModel([FakeStream(['{"model": "pro"}'])])
+    registry = registry_with({"flash": flash, "pro": pro})
+
+    assert registry.generate("prompt", stream=True, consume=parse_stream) == {"model": "pro"}
+    assert registry.stats()["active_model"] == "pro"
@@ -0,0 +1,75 @@
+from group_filter import DEFAULT_OUTPUT_TOKENS, GroupFilter, skipped_analysis
+from llm_scheduler import estimate_tokens
+
+
+class FakeMatcher:
+    """match_message by content: `tickers` maps text -> tickers, `keywords` are stock texts without one"""
+
+    def __init__(self, tickers=None, keywords=()):
+        self.tickers = tickers or {}
+        self.keywords = set(keywords)
+
+    def match_message(self, msg):
+        found = self.tickers.get(msg["content"], [])
+        return bool(found) or msg["content"] in self.keywords, list(found)
+
+
+MATCHER = FakeMatcher(tickers={"$AAPL calls": ["AAPL"], "$AAPL and $TSLA": ["AAPL", "TSLA"]},
+                      keywords={"buying the dip", "earnings play"})
+
+
+def group(*texts):
+    return [{"content": text} for text in texts]
+
+
+def test_score_counts_distinct_tickers_and_keyword_messages():
+    gf = GroupFilter(MATCHER, min_score=1)
+
+    decision = gf.score(group("$AAPL calls", "$AAPL and $TSLA", "buying the dip", "lunch?"))
+    # 2 distinct tickers * 2 + 1 keyword-only message
+    assert decision == (True, 5.0, 3, ["AAPL", "TSLA"])
+    assert gf.score(group("lunch?", "gm")) == (False, 0.0, 0, [])
+
+
+def test_score_respects_min_score():
+    gf = GroupFilter(MATCHER, min_score=2)
+
+    assert gf.score(group("buying the dip")) == (False, 1.0, 1, [])
+    assert gf.score(group("buying the dip", "earnings play")).analyze
+    assert gf.score(group("$AAPL calls")).analyze
+
+
+def test_evaluate_counts_skips_and_tokens_saved():
+    gf = GroupFilter(MATCHER, min_score=2)
+    low = group("gm", "buying the dip")
+    chatter = group("lunch?")
+
+    assert gf.evaluate(group("$AAPL calls")).analyze
+    assert not gf.evaluate(low).analyze
+    assert not gf.evaluate(chatter).analyze
+
+    stats = gf.stats()
+    assert (stats["groups"], stats["llm_calls"], stats["llm_calls_saved"]) == (3, 1, 2)
+    assert (stats["skipped_low_score"], stats["skipped_no_stock"], stats["messages_not_analyzed"]) == (1, 1, 3)
+    assert stats["est_tokens_saved"] == (estimate_tokens("gm buying the dip") + estimate_tokens("lunch?")
+                                         + 2 * DEFAULT_OUTPUT_TOKENS)
+    assert stats["saved_pct"] == 66.7
+
+    gf.reset()
+    assert gf.stats()["groups"] == 0
+    assert gf.stats()["saved_pct"] == 0.0
+
+
+def test_evaluate_estimates_only_the_last_ten_messages():
+    gf = GroupFilter(MATCHER, min_score=1)
+    gf.evaluate(group(*["x" * 400] * 5, *["gm"] * 10))
+
+    assert gf.stats()["est_tokens_saved"] == estimate_tokens(" ".join(["gm"] * 10)) + DEFAULT_OUTPUT_TOKENS
+
+
+def test_skipped_analysis_keeps_the_tickers():
+    decision = GroupFilter(MATCHER, min_score=10).score(group("$AAPL calls"))
+    analysis = skipped_analysis(decision)
+
+    assert (analysis["tickers"], analysis["has_trade_info"], analysis["analysis_skipped"]) == \
+        (["AAPL"], False, "low_relevance")
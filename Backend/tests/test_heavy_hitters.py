@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import mongomock
+import pytz
+
+from heavy_hitters import HEAVY_HITTERS_COLLECTION, HeavyHitterTracker
+
+
+def mention(ticker):
+    return {"tickers_mentioned": [ticker], "timestamp": datetime.now(pytz.utc)}
+
+
+def test_top_counts_mentions_per_window():
+    tracker = HeavyHitterTracker(capacity=10)
+    tracker.record([mention("$AAPL"), mention("$AAPL"), mention("$TSLA")])
+    assert [row["item"] for row in tracker.top("1h", 2)] == ["$AAPL", "$TSLA"]
+
+
+def test_load_is_read_only():
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    ingestor = HeavyHitterTracker(capacity=10)
+    ingestor.restore(db)
+    ingestor.record([mention("$AAPL"), mention("$AAPL")])
+    ingestor.snapshot()
+
+    api = HeavyHitterTracker(capacity=10, snapshot_seconds=0)
+    assert api.load(db) == 3
+    # Mongo keeps milliseconds
+    assert abs((api.saved_at - ingestor.saved_at).total_seconds()) < 0.001
+    assert api.top("24h", 1)[0]["item"] == "$AAPL"
+
+    # Recording or snapshotting in the reader never touches the ingestor's snapshot
+    api.record([mention("$TSLA")] * 5)
+    api.snapshot()
+    stored = db[HEAVY_HITTERS_COLLECTION].find_one({"_id": "1h"})["items"]
+    assert [row["item"] for row in stored] == ["$AAPL"]
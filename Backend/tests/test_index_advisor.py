@@ -0,0 +1,92 @@
+import mongomock
+
+import index_advisor
+from index_advisor import _index_matches, plan_summary, unused_and_redundant
+from message_writer import DISCORD_ID_FILTER
+
+
+def execution_stats(examined, returned, keys=0):
+    return {"totalDocsExamined": examined, "totalKeysExamined": keys, "nReturned": returned,
+            "executionTimeMillis": 7}
+
+
+def test_plan_summary_flags_collscan_sort_and_wide_reads():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+            "rejectedPlans": [{"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "unused_1"}}],
+        },
+        "executionStats": execution_stats(5000, 5),
+    }
+    summary = plan_summary(explain)
+
+    assert summary["stages"] == ["SORT", "COLLSCAN"]
+    assert summary["indexes"] == []
+    assert (summary["docs_examined"], summary["returned"], summary["server_ms"]) == (5000, 5, 7)
+    assert summary["flags"] == ["COLLSCAN", "in-memory SORT", "examined 5000 docs for 5"]
+
+
+def test_plan_summary_of_an_aggregate_uses_the_cursor_stage():
+    # Aggregations nest the find plan under $cursor
+    explain = {"stages": [
+        {"$cursor": {
+            "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {
+                "stage": "IXSCAN", "indexName": "hour_1_ticker_1"}}},
+            "executionStats": execution_stats(80, 80, keys=80),
+        }},
+        {"$group": {"_id": "$ticker"}},
+    ]}
+    summary = plan_summary(explain)
+
+    assert summary["stages"] == ["FETCH", "IXSCAN"]
+    assert summary["indexes"] == ["hour_1_ticker_1"]
+    assert summary["keys_examined"] == 80
+    assert summary["flags"] == []
+
+
+def test_plan_summary_ignores_small_examined_counts():
+    explain = {"queryPlanner": {"winningPlan": {"stage": "IXSCAN", "indexName": "a_1"}},
+               "executionStats": execution_stats(99, 0)}
+    assert plan_summary(explain)["flags"] == []
+    assert plan_summary({})["stages"] == []
+
+
+def test_index_matches_keys_and_partial_filter():
+    keys = [("discord_id", 1)]
+    options = {"unique": True, "partialFilterExpression": DISCORD_ID_FILTER}
+    partial = {"key": [("discord_id", 1.0)], "unique": True, "partialFilterExpression": DISCORD_ID_FILTER}
+
+    assert _index_matches(partial, keys, options)
+    # Same keys but not partial: still needs rebuilding
+    assert not _index_matches({"key": [("discord_id", 1)], "unique": True}, keys, options)
+    assert not _index_matches(partial, [("discord_id", -1)], options)
+    assert _index_matches({"key": [("timestamp", -1)]}, [("timestamp", -1)], {})
+
+
+def test_index_matches_text_index_by_weights():
+    info = {"key": [("_fts", "text"), ("_ftsx", 1)], "weights": {"content": 1}}
+    assert _index_matches(info, [("content", "text")], {"name": "content_text"})
+    assert not _index_matches(info, [("title", "text")], {})
+
+
+def test_unused_and_redundant(monkeypatch):
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    messages = db["stock_messages"]
+    messages.create_index([("channel_id", 1), ("timestamp", -1)])  # a query shape's index
+    messages.create_index([("channel_id", 1)])                     # prefix of the one above
+    messages.create_index([("author_id", 1)])                      # never used
+    messages.create_index([("author_id", 1), ("created_at", 1)])   # used
+    messages.create_index([("discord_id", 1)], unique=True)
+    usage = {"channel_id_1_timestamp_-1": 0, "channel_id_1": 3, "author_id_1": 0,
+             "author_id_1_created_at_1": 12, "discord_id_1": 0, "_id_": 0}
+    # mongomock has no $indexStats
+    monkeypatch.setattr(index_advisor, "index_usage", lambda db, collection: [
+        {"name": name, "accesses": {"ops": ops, "since": "boot"}} for name, ops in usage.items()])
+
+    unused, redundant = unused_and_redundant(db, ["stock_messages"])
+
+    assert unused == [{"collection": "stock_messages", "index": "author_id_1", "since": "boot"}]
+    assert redundant == [
+        {"collection": "stock_messages", "index": "channel_id_1", "covered_by": "channel_id_1_timestamp_-1"},
+        {"collection": "stock_messages", "index": "author_id_1", "covered_by": "author_id_1_created_at_1"},
+    ]
@@ -0,0 +1,56 @@
+import pytest
+
+from llm_json import (
+    LLMJSONError, REQUIRED, StreamingJSONParser, extract_json, parse_stream, salvage_array, validate,
+)
+
+
+def test_extract_json_skips_fences_and_prose():
+    text = 'Sure! Here it is:\n```json\n{"has_trade_info": true, "tickers": ["$AAPL"]}\n```'
+    assert extract_json(text) == {"has_trade_info": True, "tickers": ["$AAPL"]}
+
+
+def test_extract_json_raises_without_json():
+    with pytest.raises(LLMJSONError):
+        extract_json("no json here")
+
+
+def test_parse_stream_stops_at_first_complete_value():
+    chunks = iter(['{"a": ', '1}', ' trailing'])
+    assert parse_stream(chunks) == {"a": 1}
+    assert next(chunks) == ' trailing'
+
+
+def test_parse_stream_skips_bracketed_prose():
+    assert parse_stream(['[note] ', '{"a": "x}"}']) == {"a": "x}"}
+
+
+def test_parse_stream_recovers_from_unterminated_quote_in_prose():
+    assert parse_stream(['Note: {"a": "unterminated', ' {"has_trade_info": true}']) == {"has_trade_info": True}
+
+
+def test_parse_stream_salvages_truncated_array():
+    assert parse_stream(['[{"a": 1}, {"b": 2}, {"c":']) == [{"a": 1}, {"b": 2}]
+
+
+def test_parse_stream_raises_when_nothing_parses():
+    with pytest.raises(LLMJSONError):
+        parse_stream(['{"a": ', '1'])
+
+
+def test_parser_handles_escaped_quotes():
+    parser = StreamingJSONParser()
+    assert parser.feed('{"a": "say \\"hi\\" }"}') == {"a": 'say "hi" }'}
+
+
+def test_salvage_array_wraps_single_object():
+    assert salvage_array('{"a": 1}') == [{"a": 1}]
+    assert salvage_array("nothing") == []
+
+
+def test_validate_coerces_and_defaults():
+    schema = {"has_trade_info": (bool, REQUIRED), "confidence": ((int, float), 0), "tickers": (list, [])}
+    assert validate({"has_trade_info": "true", "confidence": "7"}, schema) == {
+        "has_trade_info": True, "confidence": 7.0, "tickers": []}
+    with pytest.raises(LLMJSONError):
+        validate({"confidence": 3}, schema)
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, GeminiScheduler, _Job
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class ResourceExhausted(Exception):
+    """Named like the google.api_core error is_quota_error looks for"""
+
+
+class FakeModel:
+    """generate_content fails with a quota error `quota_errors` times, then answers"""
+
+    def __init__(self, quota_errors=0, total_tokens=None):
+        self.quota_errors = quota_errors
+        self.total_tokens = total_tokens
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.calls <= self.quota_errors:
+            raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        return SimpleNamespace(text=f"answer to {prompt}",
+                               usage_metadata=SimpleNamespace(total_token_count=self.total_tokens))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_scheduler, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def job(priority, tokens=10):
+    return _Job(priority, 0, lambda: None, tokens, "test")
+
+
+def test_budget_delay_rpm(clock):
+    scheduler = GeminiScheduler(rpm=2, tpm=10_000, background_share=0.5)
+    now = clock.now
+    scheduler._window = deque([[now - 40, 10], [now - 30, 10]])
+
+    # Interactive gets the whole budget: wait for the older call to leave the window
+    assert scheduler._budget_delay(job(PRIORITY_INTERACTIVE), now) == pytest.approx(20)
+    # Background only gets half (1 rpm): wait for the newest one
+    assert scheduler._budget_delay(job(PRIORITY_BACKGROUND), now) == pytest.approx(30)
+    scheduler._window.popleft()
+    assert scheduler._budget_delay(job(PRIORITY_INTERACTIVE), now) == 0
+
+
+def test_budget_delay_tpm_and_pause(clock):
+    scheduler = GeminiScheduler(rpm=100, tpm=100)
+    now = clock.now
+    scheduler._window = deque([[now - 40, 60], [now - 30, 30]])
+
+    assert scheduler._budget_delay(job(PRIORITY_INTERACTIVE, tokens=10), now) == 0
+    # 90 used + 20 > 100 until the 60-token reservation expires
+    assert scheduler._budget_delay(job(PRIORITY_INTERACTIVE, tokens=20), now) == pytest.approx(20)
+    # Even an empty window waits out a pause
+    scheduler._window.clear()
+    scheduler._paused_until = now + 15
+    assert scheduler._budget_delay(job(PRIORITY_INTERACTIVE), now) == pytest.approx(15)
+
+
+def test_interactive_jumps_queued_background():
+    scheduler = GeminiScheduler(rpm=1000, max_concurrency=1)
+    gate = threading.Event()
+    order = []
+    blocker = scheduler.submit(gate.wait, priority=PRIORITY_BACKGROUND)
+    wait_for(lambda: scheduler.stats()["in_flight"] == 1)
+
+    futures = [scheduler.submit(lambda name=name: order.append(name), priority=priority)
+               for name, priority in (("bg-1", PRIORITY_BACKGROUND), ("bg-2", PRIORITY_BACKGROUND),
+                                      ("ui", PRIORITY_INTERACTIVE))]
+    gate.set()
+    for future in [blocker] + futures:
+        future.result(timeout=2)
+    assert order == ["ui", "bg-1", "bg-2"]
+
+
+def test_quota_error_requeues_after_backoff(clock):
+    scheduler = GeminiScheduler(rpm=1000, max_concurrency=1, retry_backoff=30)
+    model = FakeModel(quota_errors=1, total_tokens=500)
+    future = scheduler.submit(lambda: model.generate_content("hi"), tokens=10)
+
+    wait_for(lambda: scheduler.stats()["requeued_on_quota"] == 1)
+    stats = scheduler.stats()
+    assert stats["budget"]["paused_for_seconds"] == 30
+    assert stats["queue_depth"] == 1
+    assert not future.done()
+
+    clock.now += 31
+    with scheduler._cond:
+        scheduler._cond.notify_all()
+    assert future.result(timeout=2).text == "answer to hi"
+    assert model.calls == 2
+    # The finished call's reservation is swapped for the real usage
+    assert scheduler.stats()["budget"]["tokens_last_minute"] == 10 + 500
+
+
+def test_errors_fail_the_future(clock):
+    scheduler = GeminiScheduler(rpm=1000, max_concurrency=1, max_retries=0)
+
+    with pytest.raises(ResourceExhausted):
+        scheduler.call(lambda: FakeModel(quota_errors=1).generate_content("hi"), timeout=2)
+    with pytest.raises(ValueError):
+        scheduler.call(lambda: int("not a number"), timeout=2)
+    stats = scheduler.stats()
+    assert (stats["failed"], stats["requeued_on_quota"]) == (2, 0)
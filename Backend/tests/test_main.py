@@ -0,0 +1,73 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import mongomock
+import pytz
+from pymongo.errors import AutoReconnect
+from fastapi.testclient import TestClient
+
+import main
+from heavy_hitters import HeavyHitterTracker
+from trending import trending_cache
+
+
+def test_lifespan_starts_and_stops_trending_refresh(monkeypatch):
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    monkeypatch.setattr(trending_cache, "get_db", lambda: db)
+    monkeypatch.setattr(trending_cache, "refresh_seconds", 3600)
+    with TestClient(main.app) as client:
+        assert trending_cache._task is not None
+        assert client.get("/health").json()["status"] == "healthy"
+    assert trending_cache._task is None
+
+
+def test_trending_tickers_reports_snapshot_time(monkeypatch):
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    ingestor = HeavyHitterTracker()
+    ingestor.restore(db)
+    ingestor.record([{"tickers_mentioned": ["$AAPL"], "timestamp": datetime.now(pytz.utc)}])
+    ingestor.snapshot()
+
+    api = HeavyHitterTracker()
+    api.load(db)
+    monkeypatch.setattr(main, "heavy_hitters", api)
+    body = TestClient(main.app).get("/trending/tickers", params={"window": "1h"}).json()
+
+    assert body["tickers"][0]["symbol"] == "AAPL"
+    assert body["last_updated"] == api.saved_at.isoformat()
+
+
+def test_db_health_pings_through_the_thread_pool(monkeypatch):
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    monkeypatch.setattr(main, "get_db", lambda: db)
+    monkeypatch.setattr(trending_cache, "get_db", lambda: db)
+    with TestClient(main.app) as client:
+        body = client.get("/health/db").json()
+    assert body["status"] == "healthy"
+    assert set(body["pools"]) == {"read_preference", "sync"}
+
+
+class DownCandleStore:
+    """CandleStore while MongoDB is unreachable"""
+
+    def __init__(self, db):
+        pass
+
+    def covered(self, *args):
+        raise AutoReconnect("connection reset")
+
+    store = covered
+
+
+def test_stock_price_falls_back_to_polygon_when_candle_store_fails(monkeypatch):
+    bar = {"t": 1709305200000, "o": 180.0, "h": 182.5, "l": 179.25, "c": 181.0, "v": 1000}
+    polygon = SimpleNamespace(status_code=200, json=lambda: {"results": [bar]}, text="")
+    monkeypatch.setattr(main, "TIMESERIES_ENABLED", True)
+    monkeypatch.setattr(main, "CandleStore", DownCandleStore)
+    monkeypatch.setattr(main, "get_db", lambda: None)
+    monkeypatch.setattr(main.requests, "get", lambda url, params: polygon)
+
+    response = TestClient(main.app).get("/stocks/AAPL/price", params={"interval": "1M"})
+
+    assert response.status_code == 200
+    assert [(c["open"], c["close"]) for c in response.json()["data"]] == [(180.0, 181.0)]
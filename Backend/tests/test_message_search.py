@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from message_search import SEARCH_MAX_PAGE_SIZE, normalize_ticker, search_filter, search_messages
+
+SINCE = datetime(2024, 3, 1, tzinfo=timezone.utc)
+UNTIL = datetime(2024, 3, 8, tzinfo=timezone.utc)
+
+
+class FakeMessages:
+    """Answers the $facet aggregation with `total` matches (mongomock has no $text)"""
+
+    def __init__(self, total, docs=()):
+        self.total = total
+        self.docs = list(docs)
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        yield {"results": self.docs, "total": [{"count": self.total}] if self.total else []}
+
+    def stage(self, name):
+        facet = self.pipelines[-1][2]["$facet"]["results"]
+        return next(step[name] for step in facet if name in step)
+
+
+def search(total, docs=(), **kwargs):
+    messages = FakeMessages(total, docs)
+    return search_messages({"stock_messages": messages}, "calls", **kwargs), messages
+
+
+def test_normalize_ticker():
+    assert normalize_ticker("aapl") == normalize_ticker(" $AAPL ") == normalize_ticker("$aapl") == "$AAPL"
+
+
+def test_search_filter_adds_only_given_filters():
+    assert search_filter("buy calls") == {"$text": {"$search": "buy calls"}}
+    assert search_filter('"short squeeze" -puts', ticker="gme", author="trader", since=SINCE, until=UNTIL) == {
+        "$text": {"$search": '"short squeeze" -puts'},
+        "tickers_mentioned": "$GME",
+        "author_username": "trader",
+        "timestamp": {"$gte": SINCE, "$lt": UNTIL},
+    }
+    assert search_filter("calls", until=UNTIL)["timestamp"] == {"$lt": UNTIL}
+
+
+def test_pagination_skips_whole_pages_and_rounds_page_count_up():
+    found, messages = search(45, page=3, page_size=20)
+
+    assert (messages.stage("$skip"), messages.stage("$limit")) == (40, 20)
+    assert (found["total"], found["page"], found["page_size"], found["pages"]) == (45, 3, 20, 3)
+    assert search(40, page_size=20)[0]["pages"] == 2
+
+
+def test_pagination_clamps_page_and_page_size():
+    found, messages = search(5, page=0, page_size=1000)
+    assert (found["page"], found["page_size"], found["pages"]) == (1, SEARCH_MAX_PAGE_SIZE, 1)
+    assert (messages.stage("$skip"), messages.stage("$limit")) == (0, SEARCH_MAX_PAGE_SIZE)
+
+    found, _ = search(0, page_size=0)
+    assert (found["total"], found["page_size"], found["pages"], found["results"]) == (0, 1, 0, [])
+
+
+def test_sort_orders_and_results():
+    doc = {"discord_id": "42", "content": "$AAPL calls", "timestamp": SINCE, "tickers_mentioned": ["$AAPL"],
+           "author_username": "trader", "score": 1.23456}
+    found, messages = search(1, [doc], sort="recent")
+
+    assert list(messages.stage("$sort")) == ["timestamp", "score"]
+    assert [(r["id"], r["tickers"], r["score"], r["author"]) for r in found["results"]] == \
+        [("42", ["$AAPL"], 1.235, "trader")]
+    with pytest.raises(ValueError):
+        search(1, sort="oldest")
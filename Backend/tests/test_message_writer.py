@@ -0,0 +1,125 @@
+import mongomock
+import pytest
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+
+from message_writer import BufferedMessageWriter, ensure_message_indexes, fan_out, remove_duplicate_messages
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["discord_scraper_test"]
+
+
+def doc(discord_id, content="$AAPL calls"):
+    return {"discord_id": discord_id, "content": content, "tickers_mentioned": ["$AAPL"]}
+
+
+def test_upserts_are_keyed_on_discord_id(db):
+    inserted = []
+    with BufferedMessageWriter(db["stock_messages"], batch_size=10, flush_interval=0,
+                               after_flush=inserted.extend) as writer:
+        writer.add(doc("1"))
+        writer.add(doc("2"))
+    with BufferedMessageWriter(db["stock_messages"], batch_size=10, flush_interval=0,
+                               after_flush=inserted.extend) as writer:
+        writer.add(doc("1", "$AAPL puts"))
+
+    assert db["stock_messages"].count_documents({}) == 2
+    assert db["stock_messages"].find_one({"discord_id": "1"})["content"] == "$AAPL puts"
+    assert [d["discord_id"] for d in inserted] == ["1", "2"]
+
+
+def test_remove_duplicates_keeps_oldest_and_ignores_missing_ids(db):
+    messages = db["stock_messages"]
+    messages.insert_many([doc("1"), doc("1"), doc("2"), doc(None), doc(None), {"content": "no id"}])
+
+    assert remove_duplicate_messages(messages) == 1
+    assert messages.count_documents({"discord_id": "1"}) == 1
+    assert messages.count_documents({"discord_id": None}) == 3
+
+
+def test_ensure_indexes_cleans_up_duplicates(db):
+    messages = db["stock_messages"]
+    messages.insert_many([doc("1"), doc("1")])
+    ensure_message_indexes(messages)
+    assert messages.count_documents({}) == 1
+
+
+def test_unique_index_allows_documents_without_an_id(db):
+    messages = db["stock_messages"]
+    # mongomock ignores the partial filter when building the index, so the documents come after
+    ensure_message_indexes(messages)
+    messages.insert_many([doc("1"), doc(None), doc(None), {"content": "no id"}, {"content": "no id either"}])
+
+    with pytest.raises(DuplicateKeyError):
+        messages.insert_one(doc("1"))
+
+
+def test_unfiltered_unique_index_is_rebuilt(db):
+    messages = db["stock_messages"]
+    messages.create_index("discord_id", unique=True, name="discord_id_unique")
+    ensure_message_indexes(messages)
+
+    assert messages.index_information()["discord_id_unique"]["partialFilterExpression"] == \
+        {"discord_id": {"$gt": ""}}
+    messages.insert_many([{"content": "a"}, {"content": "b"}])
+
+
+def test_failed_flush_keeps_the_batch(db, monkeypatch):
+    messages = db["stock_messages"]
+    writer = BufferedMessageWriter(messages, batch_size=10, flush_interval=0)
+    writer.add(doc("1"))
+    writer.add(doc("2"))
+    bulk_write = messages.bulk_write
+
+    def unreachable(ops, ordered=True):
+        raise ServerSelectionTimeoutError("no primary")
+
+    monkeypatch.setattr(messages, "bulk_write", unreachable)
+    with pytest.raises(ServerSelectionTimeoutError):
+        writer.flush()
+    # A newer copy added after the failure wins over the kept one
+    writer.add(doc("2", "$AAPL puts"))
+    monkeypatch.setattr(messages, "bulk_write", bulk_write)
+
+    assert sorted(writer.flush()) == ["1", "2"]
+    assert messages.find_one({"discord_id": "2"})["content"] == "$AAPL puts"
+    assert writer.stats()["flush_failures"] == 1
+
+
+def test_failed_writes_are_counted(db):
+    messages = db["stock_messages"]
+    messages.create_index("content", unique=True)
+    messages.insert_one(doc("1", "taken"))
+
+    writer = BufferedMessageWriter(messages, batch_size=10, flush_interval=0)
+    writer.add(doc("2", "taken"))
+    assert writer.flush() == []
+    assert writer.errors == 1
+
+
+def test_fan_out_calls_each_callback():
+    seen = []
+    fan_out(seen.append, None, lambda docs: seen.append(len(docs)))([doc("1")])
+    assert seen == [[doc("1")], 1]
+
+
+def test_fan_out_runs_every_callback_when_one_fails():
+    seen = []
+
+    def broken(docs):
+        raise RuntimeError("rollups down")
+
+    with pytest.raises(RuntimeError):
+        fan_out(broken, seen.extend)([doc("1")])
+    assert seen == [doc("1")]
+
+
+def test_after_flush_errors_do_not_fail_the_flush(db):
+    def broken(docs):
+        raise RuntimeError("rollups down")
+
+    writer = BufferedMessageWriter(db["stock_messages"], batch_size=10, flush_interval=0, after_flush=broken)
+    writer.add(doc("1"))
+    assert writer.flush() == ["1"]
+    assert (writer.errors, writer.hook_errors) == (0, 1)
@@ -0,0 +1,95 @@
+import asyncio
+
+from aiohttp import web
+
+import reddit_harvester
+from reddit_harvester import RedditHarvester
+
+
+def comment(comment_id, body, author="trader"):
+    return {"kind": "t1", "data": {"id": comment_id, "body": body, "author": author, "replies": ""}}
+
+
+class FakeReddit:
+    """
+    One subreddit; `failing` holds post ids whose comment tree returns 500,
+    `dropped` the ones whose request has its connection dropped
+    """
+
+    def __init__(self, posts, comments, failing=(), dropped=()):
+        self.posts = posts
+        self.comments = comments
+        self.failing = set(failing)
+        self.dropped = set(dropped)
+        self.tree_requests = []
+
+    async def token(self, request):
+        return web.json_response({"access_token": "token", "expires_in": 3600})
+
+    async def search(self, request):
+        return web.json_response({"data": {"children": [{"kind": "t3", "data": post} for post in self.posts]}})
+
+    async def tree(self, request):
+        post_id = request.match_info["post_id"]
+        self.tree_requests.append(post_id)
+        if post_id in self.failing:
+            return web.json_response({"message": "error"}, status=500)
+        if post_id in self.dropped:
+            request.transport.close()
+            raise ConnectionResetError("dropped")
+        return web.json_response([{}, {"data": {"children": self.comments.get(post_id, [])}}])
+
+
+def sweeps(monkeypatch, fake_server, fake, rounds):
+    """Run `rounds` harvests against the fake (calling rounds[i] before sweep i); returns the matches per sweep"""
+    async def run():
+        async with fake_server(web.post("/api/v1/access_token", fake.token),
+                               web.get("/r/{subreddit}/search", fake.search),
+                               web.get("/r/{subreddit}/comments/{post_id}", fake.tree)) as url:
+            monkeypatch.setattr(reddit_harvester, "REDDIT_AUTH_URL", f"{url}/api/v1/access_token")
+            monkeypatch.setattr(reddit_harvester, "REDDIT_API", url)
+            harvester = RedditHarvester("wallstreetbets", client_id="id", client_secret="secret")
+            await harvester.start()
+            try:
+                results = []
+                for before in rounds:
+                    before()
+                    results.append([match async for match in harvester.harvest(["AAPL", "TSLA"])])
+                return results
+            finally:
+                await harvester.close()
+    return asyncio.run(run())
+
+
+POST = {"id": "p1", "title": "$AAPL earnings thread", "selftext": "", "num_comments": 2}
+COMMENTS = {"p1": [comment("c1", "Selling my TSLA shares to buy more calls"),
+                   comment("c2", "Anyone else loading up on $aapl here?")]}
+
+
+def test_comments_keep_their_own_tickers(monkeypatch, fake_server):
+    [matches] = sweeps(monkeypatch, fake_server, FakeReddit([POST], COMMENTS), [lambda: None])
+
+    assert [(m["comment"]["id"], m["tickers"], m["post_tickers"]) for m in matches] == \
+        [("c1", ["TSLA"], ["AAPL"]), ("c2", ["AAPL"], ["AAPL"])]
+
+
+def test_failed_tree_is_retried_next_sweep(monkeypatch, fake_server):
+    fake = FakeReddit([POST], COMMENTS, failing={"p1"})
+    first, second, third = sweeps(monkeypatch, fake_server, fake, [lambda: None, fake.failing.clear, lambda: None])
+
+    assert first == []
+    assert len(second) == 2
+    # Unchanged once fetched
+    assert third == []
+    assert fake.tree_requests == ["p1", "p1"]
+
+
+def test_dropped_connection_only_loses_that_tree(monkeypatch, fake_server):
+    other = {"id": "p2", "title": "$TSLA delivery numbers", "selftext": "", "num_comments": 1}
+    comments = {**COMMENTS, "p2": [comment("c3", "Trimmed my TSLA position after the run")]}
+    fake = FakeReddit([POST, other], comments, dropped={"p1"})
+    first, second = sweeps(monkeypatch, fake_server, fake, [lambda: None, fake.dropped.clear])
+
+    assert [m["comment"]["id"] for m in first] == ["c3"]
+    # p1 wasn't marked seen, so the next sweep fetches it
+    assert [m["comment"]["id"] for m in second] == ["c1", "c2"]
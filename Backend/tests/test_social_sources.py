@@ -0,0 +1,138 @@
+import asyncio
+
+import mongomock
+import pytest
+
+from social_sources import DiscordSource, SocialIngestor, SocialSource, social_post
+
+TEXT = "Loading up on $AAPL calls before earnings, this breakout looks real"
+
+
+class StaticSource(SocialSource):
+    """Serves one list of posts per round"""
+
+    def __init__(self, name, rounds):
+        self.name = name
+        self.rounds = list(rounds)
+
+    async def fetch(self, tickers, limit=10):
+        return self.rounds.pop(0) if self.rounds else []
+
+
+class FakePipeline:
+    def __init__(self):
+        self.db = mongomock.MongoClient()["discord_scraper_test"]
+        self.pages = []
+        self.failed_ids = []
+
+    async def submit_page(self, channel_id, posts, checkpoint=True):
+        self.pages.append((channel_id, [post["id"] for post in posts]))
+
+    def take_failed_ids(self):
+        failed, self.failed_ids = self.failed_ids, []
+        return failed
+
+
+class FakeFetcher:
+    """fetch_messages answering from `pages` (channel -> list of pages, None for a failed request)"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    async def fetch_messages(self, session, channel_id, before=None, after=None):
+        self.requests.append((channel_id, after))
+        return self.pages[channel_id].pop(0)
+
+
+def post(source, post_id, content=TEXT, upvotes=0):
+    return social_post(source, post_id, content, author_id="1", author_name="trader",
+                       timestamp="2024-03-01T15:00:00+00:00", channel_id=f"{source}/test",
+                       tickers=["AAPL"], metrics={"upvotes": upvotes})
+
+
+def submitted(pipeline):
+    return [post_id for _, ids in pipeline.pages for post_id in ids]
+
+
+def test_source_must_implement_fetch():
+    with pytest.raises(TypeError):
+        SocialSource()
+
+
+def test_dedupe_keeps_most_engaged_copy():
+    ingestor = SocialIngestor([], FakePipeline())
+    posts = [post("x", "x-1", upvotes=1), post("reddit", "r-1", upvotes=5), post("reddit", "r-1", upvotes=5),
+             post("x", "x-2", content="$SPY calls"), post("reddit", "r-2", content="$SPY calls")]
+
+    assert [p["id"] for p in ingestor.dedupe(posts)] == ["r-1", "x-2", "r-2"]
+    assert ingestor.stats["duplicates"] == 2
+
+
+def test_dedupe_losers_are_not_submitted_in_later_rounds():
+    pipeline = FakePipeline()
+    reddit = StaticSource("reddit", [[post("reddit", "r-1", upvotes=5)], []])
+    x = StaticSource("x", [[post("x", "x-1", upvotes=1)], [post("x", "x-1", upvotes=1)]])
+    ingestor = SocialIngestor([reddit, x], pipeline)
+
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 1
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 0
+    assert submitted(pipeline) == ["r-1"]
+    assert ingestor.stats["already_seen"] == 1
+
+
+def test_stored_posts_are_skipped():
+    pipeline = FakePipeline()
+    pipeline.db["stock_messages"].insert_one({"discord_id": "r-1"})
+    ingestor = SocialIngestor([StaticSource("reddit", [[post("reddit", "r-1"), post("reddit", "r-2", "other")]])],
+                              pipeline)
+
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 1
+    assert submitted(pipeline) == ["r-2"]
+
+
+def test_failed_posts_are_submitted_again():
+    pipeline = FakePipeline()
+    source = StaticSource("reddit", [[post("reddit", "r-1"), post("reddit", "r-2", "other")]] * 3)
+    ingestor = SocialIngestor([source], pipeline)
+
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 2
+    # r-1's analysis or storage raised in the pipeline
+    pipeline.failed_ids = ["r-1"]
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 1
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 0
+    assert submitted(pipeline) == ["r-1", "r-2", "r-1"]
+    assert ingestor.stats["failed"] == 1
+
+
+def discord_message(message_id, channel_id):
+    return {"id": message_id, "channel_id": channel_id, "content": f"{TEXT} #{message_id}",
+            "author": {"id": "1", "username": "trader"},
+            "timestamp": "2024-03-01T15:00:00+00:00"}
+
+
+def test_discord_failed_channel_keeps_its_cursor_and_others_still_arrive():
+    source = DiscordSource(["1", "2"])
+    source.after = {"1": "10", "2": "20"}
+    source.fetcher = FakeFetcher({
+        "1": [[discord_message("12", "1"), discord_message("11", "1")], []],
+        "2": [None, [discord_message("21", "2")]],
+    })
+    ingestor = SocialIngestor([source], FakePipeline())
+
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 2
+    assert source.after == {"1": "12", "2": "20"}
+    assert asyncio.run(ingestor.run_once(["AAPL"])) == 1
+    assert source.fetcher.requests == [("1", "10"), ("2", "20"), ("1", "12"), ("2", "20")]
+    assert source.after == {"1": "12", "2": "21"}
+
+
+def test_discord_cursor_waits_for_the_posts_to_be_submitted():
+    source = DiscordSource(["1"])
+    source.after = {"1": "10"}
+    source.fetcher = FakeFetcher({"1": [[discord_message("11", "1")]]})
+
+    assert [p["id"] for p in asyncio.run(source.fetch(["AAPL"]))] == ["11"]
+    assert source.after == {"1": "10"}
+    source.commit()
+    assert source.after == {"1": "11"}
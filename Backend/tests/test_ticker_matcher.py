@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+import types
+
+import pytest
+
+import ticker_matcher
+from ticker_matcher import TickerMatcher, cashtag_symbol, load_known_tickers, refresh_known_tickers
+
+
+def write_cache(path, tickers, age_days=0.0):
+    path.write_text(json.dumps({"updated_at": time.time() - age_days * 86400, "tickers": tickers}))
+
+
+def test_match_validates_tickers_and_keywords():
+    matcher = TickerMatcher(known_tickers=["AAPL", "BTC", "SPX"])
+    assert matcher.match("$aapl and $LOL, $BTC vs $SPX") == (True, ["$AAPL", "$BTC", "$SPX"])
+    assert matcher.match("this belongs on the holiday list") == (False, [])
+    assert matcher.match("investing in the rally") == (True, [])
+
+
+@pytest.mark.parametrize("ticker, expected", [
+    ("AAPL", "AAPL"), ("I:SPX", "SPX"), ("X:BTCUSD", "BTC"), ("X:BTCEUR", None), ("X:USD", None),
+])
+def test_cashtag_symbol(ticker, expected):
+    assert cashtag_symbol(ticker) == expected
+
+
+def fake_polygon(failing=()):
+    markets = {
+        "stocks": [{"ticker": "AAPL"}, {"ticker": "TSLA"}],
+        "indices": [{"ticker": "I:SPX"}, {"ticker": "I:NDX"}],
+        "crypto": [{"ticker": "X:BTCUSD"}, {"ticker": "X:ETHBTC"}],
+    }
+
+    def get_all_tickers(market="stocks"):
+        if market in failing:
+            raise RuntimeError("not authorized")
+        return markets[market]
+    return types.SimpleNamespace(get_all_tickers=get_all_tickers)
+
+
+def test_refresh_keeps_index_and_crypto_cashtags(tmp_path, monkeypatch):
+    monkeypatch.setattr(ticker_matcher, "_load_polygon", lambda: fake_polygon(failing={"indices"}))
+    path = tmp_path / "known.json"
+
+    assert refresh_known_tickers(str(path)) == {"AAPL", "TSLA", "BTC"}
+    assert load_known_tickers(str(path)) == ({"AAPL", "TSLA", "BTC"}, False)
+
+
+def test_missing_cache_accepts_every_cashtag(tmp_path, monkeypatch):
+    monkeypatch.delenv("POLYGON_API_KEY", raising=False)
+    matcher = TickerMatcher(path=str(tmp_path / "missing.json"))
+    assert matcher.match("$FOO to the moon") == (True, ["$FOO"])
+
+
+def test_stale_cache_refreshes_without_blocking_match(tmp_path, monkeypatch):
+    path = tmp_path / "known.json"
+    write_cache(path, ["AAPL"], age_days=30)
+    release = threading.Event()
+
+    def slow_refresh(path):
+        release.wait(5)
+        return {"AAPL", "NEWCO"}
+
+    monkeypatch.setenv("POLYGON_API_KEY", "key")
+    monkeypatch.setattr(ticker_matcher, "refresh_known_tickers", slow_refresh)
+    matcher = TickerMatcher(path=str(path))
+
+    started = time.perf_counter()
+    assert matcher.match("$AAPL $NEWCO") == (True, ["$AAPL"])
+    assert time.perf_counter() - started < 1
+
+    release.set()
+    matcher.refresh().join(5)
+    assert matcher.match("$AAPL $NEWCO") == (True, ["$AAPL", "$NEWCO"])
+
+
+def test_match_message_adds_attributed_tickers():
+    matcher = TickerMatcher(known_tickers=["AAPL", "TSLA"])
+    assert matcher.match_message({"content": "apple looks good", "tickers": ["$AAPL"]}) == (True, ["$AAPL"])
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect
+
+from ticker_rollups import ALL_TICKERS, TickerRollups
+
+START = datetime(2024, 3, 1, 15)
+
+
+def doc(discord_id, tickers, minutes=0, sentiment="bullish"):
+    return {"discord_id": discord_id, "tickers_mentioned": tickers, "timestamp": START + timedelta(minutes=minutes),
+            "sentiment": sentiment, "confidence_score": 8}
+
+
+@pytest.fixture
+def rollups():
+    return TickerRollups(mongomock.MongoClient()["discord_scraper_test"])
+
+
+def mentions(rollups):
+    return {row["ticker"]: row["mentions"] for row in rollups.window(START - timedelta(hours=1))}
+
+
+def test_record_counts_per_ticker_and_hour(rollups):
+    rollups.record([doc("1", ["$AAPL", "$TSLA"]), doc("2", ["$AAPL"], minutes=70, sentiment="bearish")])
+
+    assert mentions(rollups) == {"$AAPL": 2, "$TSLA": 1}
+    assert rollups.totals(START)["mentions"] == 2
+    assert [row["mentions"] for row in rollups.hourly("$AAPL", START)] == [1, 1]
+    assert rollups.window(START, tickers=["$AAPL"])[0]["sentiment"] == {"bullish": 1, "bearish": 1}
+
+
+def test_reapplying_a_batch_is_a_no_op(rollups):
+    batch = [doc("1", ["$AAPL"]), doc("2", ["$AAPL", "$TSLA"])]
+    rollups.record(batch)
+    rollups._apply(list(reversed(batch)))
+    rollups.record([doc("3", ["$TSLA"])])
+
+    assert mentions(rollups) == {"$AAPL": 2, "$TSLA": 2}
+
+
+def test_failed_batch_is_retried_on_next_record(rollups, monkeypatch):
+    bulk_write = rollups.collection.bulk_write
+    calls = {"n": 0}
+
+    def flaky(ops, ordered=True):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            # Half the batch lands before the connection drops
+            bulk_write(ops[:1], ordered=ordered)
+            raise AutoReconnect("connection reset")
+        return bulk_write(ops, ordered=ordered)
+
+    monkeypatch.setattr(rollups.collection, "bulk_write", flaky)
+    with pytest.raises(AutoReconnect):
+        rollups.record([doc("1", ["$AAPL", "$TSLA"])])
+    assert rollups.pending_batches() == 1
+
+    rollups.record([doc("2", ["$NVDA"])])
+    assert rollups.pending_batches() == 0
+    assert mentions(rollups) == {"$AAPL": 1, "$NVDA": 1, "$TSLA": 1}
+    assert rollups.window(START, tickers=[ALL_TICKERS])[0]["mentions"] == 2
+
+
+def test_backfill_rebuilds_from_messages(rollups):
+    rollups.db["stock_messages"].insert_many([doc("1", ["$AAPL"]), doc("2", ["$AAPL", "$TSLA"])])
+    rollups.record([doc("1", ["$AAPL"])])
+
+    assert rollups.backfill()["messages"] == 2
+    assert mentions(rollups) == {"$AAPL": 2, "$TSLA": 1}
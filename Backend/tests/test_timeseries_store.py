@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+import pytz
+
+import timeseries_store
+from timeseries_store import CandleStore, MessageMetricsStore, merge_ranges, window_store
+from ticker_rollups import TickerRollups
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["discord_scraper_test"]
+
+
+def bars(first, last, step=timedelta(days=1)):
+    """Polygon aggregate results from `first` through `last` (UTC datetimes)"""
+    results, t = [], first
+    while t <= last:
+        ms = int(pytz.utc.localize(t).timestamp() * 1000)
+        results.append({"t": ms, "o": 1.0, "h": 2.0, "l": 0.5, "c": 1.5, "v": 100})
+        t += step
+    return results
+
+
+def day(n):
+    return datetime(2024, 1, n)
+
+
+def test_candles_fill_the_gap_between_two_fetches(db):
+    store = CandleStore(db)
+    assert store.store("aapl", "1day", bars(day(1), day(5)), "2024-01-01", "2024-01-05") == 5
+    assert store.store("AAPL", "1day", bars(day(21), day(25)), "2024-01-21", "2024-01-25") == 5
+    assert not store.covered("AAPL", "1day", "2024-01-01", "2024-01-25")
+
+    assert store.store("AAPL", "1day", bars(day(1), day(25)), "2024-01-01", "2024-01-25") == 15
+    assert store.covered("AAPL", "1day", "2024-01-01", "2024-01-25")
+    assert len(store.window("AAPL", "1day", "2024-01-01", "2024-01-25")) == 25
+
+
+def test_candle_coverage_keeps_separate_ranges(db):
+    store = CandleStore(db)
+    store.store("AAPL", "1day", bars(day(1), day(5)), "2024-01-01", "2024-01-05")
+    store.store("AAPL", "1day", bars(day(21), day(25)), "2024-01-21", "2024-01-25")
+
+    assert store.covered("AAPL", "1day", "2024-01-02", "2024-01-04")
+    assert store.covered("AAPL", "1day", "2024-01-21", "2024-01-25")
+    assert not store.covered("AAPL", "1day", "2024-01-04", "2024-01-22")
+    assert not store.covered("AAPL", "5minute", "2024-01-02", "2024-01-04")
+
+
+def test_merge_ranges_joins_only_overlapping_or_adjacent():
+    assert merge_ranges([["2024-01-01", "2024-01-05"]], "2024-01-21", "2024-01-25") == \
+        [["2024-01-01", "2024-01-05"], ["2024-01-21", "2024-01-25"]]
+    assert merge_ranges([["2024-01-01", "2024-01-05"]], "2024-01-06", "2024-01-10") == \
+        [["2024-01-01", "2024-01-10"]]
+    assert merge_ranges([["2024-01-01", "2024-01-05"], ["2024-01-21", "2024-01-25"]],
+                        "2024-01-04", "2024-01-22") == [["2024-01-01", "2024-01-25"]]
+
+
+def test_open_bar_is_not_stored_or_covered(db):
+    store = CandleStore(db)
+    today = datetime.now(pytz.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    this_week = today - timedelta(days=2)
+    weeks = bars(this_week - timedelta(weeks=3), this_week, step=timedelta(weeks=1))
+    start = (this_week - timedelta(weeks=3)).strftime("%Y-%m-%d")
+    end = (this_week + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    assert store.store("AAPL", "1week", weeks, start, end) == 3
+    assert not store.covered("AAPL", "1week", start, end)
+    assert store.covered("AAPL", "1week", start, (this_week - timedelta(days=1)).strftime("%Y-%m-%d"))
+
+
+def metric_doc(discord_id, tickers, minutes, sentiment="bullish", confidence=8):
+    return {"discord_id": discord_id, "tickers_mentioned": tickers, "sentiment": sentiment,
+            "confidence_score": confidence, "timestamp": datetime(2024, 3, 1, 15) + timedelta(minutes=minutes)}
+
+
+def test_message_metrics_window_matches_rollups(db):
+    docs = [metric_doc("1", ["$AAPL", "$TSLA"], 0), metric_doc("2", ["$AAPL"], 70, "bearish", 0),
+            metric_doc("3", ["$TSLA"], 130, "neutral", 6)]
+    metrics, rollups = MessageMetricsStore(db), TickerRollups(db)
+    assert metrics.record(docs) == 4
+    rollups.record(docs)
+
+    since = datetime(2024, 3, 1, 15)
+    assert metrics.window(since) == rollups.window(since)
+    assert metrics.window(since, tickers=["$AAPL"]) == rollups.window(since, tickers=["$AAPL"])
+    assert metrics.totals(since) == rollups.totals(since)
+    assert metrics.totals(since)["mentions"] == 3
+    # Exact timestamps, where the rollups only resolve whole hours
+    assert metrics.window(since + timedelta(minutes=10)) == [
+        {"ticker": "$AAPL", "mentions": 1, "sentiment": {"bearish": 1}, "avg_confidence": None},
+        {"ticker": "$TSLA", "mentions": 1, "sentiment": {"neutral": 1}, "avg_confidence": 6.0},
+    ]
+
+
+def test_window_store_follows_timeseries_flag(db, monkeypatch):
+    assert isinstance(window_store(db), TickerRollups)
+    monkeypatch.setattr(timeseries_store, "TIMESERIES_ENABLED", True)
+    assert isinstance(window_store(db), MessageMetricsStore)
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+
+from timeutils import DISPLAY_TZ, UTC, parse_timestamp, parse_timestamps, to_display, to_utc
+
+MOMENT = datetime(2024, 3, 1, 15, 30, 12, 345000, tzinfo=UTC)
+DEFAULT = datetime(2000, 1, 1, tzinfo=UTC)
+
+
+def test_parse_timestamp_accepts_iso_unix_and_datetimes():
+    assert parse_timestamp("2024-03-01T15:30:12.345000+00:00") == MOMENT
+    assert parse_timestamp("2024-03-01T15:30:12.345Z") == MOMENT
+    assert parse_timestamp("2024-03-01T10:30:12.345-05:00") == MOMENT
+    assert parse_timestamp(MOMENT.timestamp()) == MOMENT
+    assert parse_timestamp(int(MOMENT.timestamp())) == MOMENT.replace(microsecond=0)
+    # Naive datetimes are UTC already, as pymongo returns them
+    assert parse_timestamp(MOMENT.replace(tzinfo=None)) == MOMENT
+    assert parse_timestamp(MOMENT.astimezone(timezone(timedelta(hours=9)))).tzinfo is UTC
+
+
+def test_parse_timestamp_falls_back_to_default_or_now():
+    for value in ("not a date", None, True, float("inf"), ["2024-03-01"]):
+        assert parse_timestamp(value, DEFAULT) is DEFAULT
+    before = datetime.now(UTC)
+    assert before <= parse_timestamp("garbage") <= datetime.now(UTC)
+
+
+def test_parse_timestamps_uniform_batch_is_utc_and_ordered():
+    values = [(MOMENT + timedelta(minutes=i)).isoformat() for i in range(5)]
+    parsed = parse_timestamps(iter(values))
+    assert parsed == [MOMENT + timedelta(minutes=i) for i in range(5)]
+    assert all(dt.tzinfo is UTC for dt in parsed)
+
+
+def test_parse_timestamps_converts_offsets_and_naive_values():
+    parsed = parse_timestamps(["2024-03-01T10:30:12.345-05:00", "2024-03-01T15:30:12.345"])
+    assert parsed == [MOMENT, MOMENT]
+    assert all(dt.tzinfo is UTC for dt in parsed)
+
+
+def test_parse_timestamps_mixed_batch_matches_parse_timestamp():
+    values = ["2024-03-01T15:30:12.345Z", MOMENT.timestamp(), MOMENT, "bad", None]
+    assert parse_timestamps(values, DEFAULT) == [MOMENT, MOMENT, MOMENT, DEFAULT, DEFAULT]
+    assert parse_timestamps([]) == []
+
+
+def test_display_conversion_keeps_the_instant():
+    shown = to_display(MOMENT)
+    assert shown.utcoffset() == DISPLAY_TZ.utcoffset(MOMENT.replace(tzinfo=None))
+    assert to_utc(shown) == MOMENT
+    assert to_display(None) is None
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+import pytz
+
+from ticker_rollups import TickerRollups
+from trending import TrendingCache
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()["discord_scraper_test"]
+    now = datetime.now(pytz.utc).replace(tzinfo=None)
+    docs = [{"discord_id": str(i), "content": f"${symbol} breakout, buying calls", "tickers_mentioned": [f"${symbol}"],
+             "timestamp": now - timedelta(minutes=i), "sentiment": "bullish", "author_username": "trader"}
+            for i, symbol in enumerate(["AAPL", "AAPL", "TSLA", "NVDA", "AMD"])]
+    db["stock_messages"].insert_many(docs)
+    TickerRollups(db).record(docs)
+    return db
+
+
+def test_refresh_builds_snapshot(db):
+    cache = TrendingCache(lambda: db, top_k=2)
+    cache.refresh()
+
+    stocks = cache.trending_stocks()["trending_stocks"]
+    assert [row["symbol"] for row in stocks] == ["AAPL", "AMD"]
+    assert stocks[0]["mention_count"] == 2
+    assert cache.cached_sentiment("aapl")["mention_count"] == 2
+    assert cache.trending_topics()["trending_topics"][0]["topic"] in ("breakout", "buy")
+
+
+def test_extra_symbols_are_an_lru(db):
+    cache = TrendingCache(lambda: db, top_k=1, max_extra_symbols=2)
+    cache.refresh()
+
+    cache.symbol_sentiment("TSLA")
+    cache.symbol_sentiment("NVDA")
+    assert cache.cached_sentiment("TSLA") is not None  # TSLA is now the most recent
+    cache.symbol_sentiment("AMD")
+
+    assert cache.cached_sentiment("NVDA") is None
+    assert cache.cached_sentiment("TSLA")["mention_count"] == 1
+    assert cache.stats()["extra_symbols_cached"] == 2
+
+    cache.refresh()
+    assert cache.stats()["extra_symbols_cached"] == 0
+
+
+def test_social_sentiment_is_split_by_source(db):
+    now = datetime.now(pytz.utc).replace(tzinfo=None)
+    docs = [{"discord_id": f"reddit-{i}", "content": "$AAPL puts", "tickers_mentioned": ["$AAPL"], "source": "reddit",
+             "timestamp": now - timedelta(minutes=i), "sentiment": "bearish"} for i in range(3)]
+    db["stock_messages"].insert_many(docs)
+    TickerRollups(db).record(docs)
+    cache = TrendingCache(lambda: db, top_k=1)
+    cache.refresh()
+
+    sentiment = cache.cached_sentiment("AAPL")
+    assert sentiment["social_sentiment"]["discord"]["label"] == "positive"
+    assert sentiment["social_sentiment"]["reddit"] == {"score": -1.0, "magnitude": 1.0, "label": "negative"}
+    assert sentiment["overall_sentiment"]["score"] == -0.2
+    assert cache.symbol_sentiment("TSLA")["social_sentiment"] == {
+        "discord": {"score": 1.0, "magnitude": 1.0, "label": "positive"}}
@@ -0,0 +1,90 @@
+import asyncio
+
+from aiohttp import web
+
+import x_search
+from x_search import XSearch, batch_queries
+
+
+class FakeTwitter:
+    """
+    Recent search over a fixed list of tweet texts, `page_size` per page;
+    `statuses` maps request number -> error status.
+    """
+
+    def __init__(self, texts, page_size=100, statuses=None):
+        self.texts = texts
+        self.page_size = page_size
+        self.statuses = statuses or {}
+        self.queries = []
+
+    async def search(self, request):
+        self.queries.append(request.query["query"])
+        status = self.statuses.get(len(self.queries))
+        if status:
+            return web.json_response({"title": "error"}, status=status)
+        start = int(request.query.get("next_token", 0))
+        page = self.texts[start:start + self.page_size]
+        meta = {"result_count": len(page)}
+        if start + self.page_size < len(self.texts):
+            meta["next_token"] = str(start + self.page_size)
+        return web.json_response({
+            "data": [{"id": str(start + i), "text": text, "author_id": "1"} for i, text in enumerate(page)],
+            "includes": {"users": [{"id": "1", "username": "trader", "name": "Trader"}]},
+            "meta": meta,
+        })
+
+
+def searches(monkeypatch, fake_server, fake, calls, max_pages=3):
+    """Run XSearch.search once per (tickers, per_ticker) in `calls` against the fake; returns the results"""
+    async def run():
+        async with fake_server(web.get("/tweets/search/recent", fake.search)) as url:
+            monkeypatch.setattr(x_search, "TWITTER_API", url)
+            search = XSearch(bearer_token="token", max_pages=max_pages, serpapi_key=None)
+            await search.start()
+            try:
+                return [await search.search(tickers, per_ticker) for tickers, per_ticker in calls]
+            finally:
+                await search.close()
+    return asyncio.run(run())
+
+
+def counts(results):
+    return {s: len(tweets) for s, tweets in results.items()}
+
+
+def test_batch_queries_fit_the_length_limit():
+    batches = batch_queries(["aapl", "$TSLA", "AAPL", "NVDA"], max_length=40)
+    assert [group for group, _ in batches] == [["AAPL", "TSLA"], ["NVDA"]]
+    assert batches[0][1] == "($AAPL OR $TSLA) lang:en -is:retweet"
+    assert all(len(query) <= 40 for _, query in batches)
+
+
+def test_failed_search_is_not_cached(monkeypatch, fake_server):
+    fake = FakeTwitter(["$AAPL to the moon"] * 3, statuses={1: 429})
+    first, second, third = searches(monkeypatch, fake_server, fake, [(["AAPL"], 5)] * 3)
+
+    assert counts(first) == {"AAPL": 0}
+    assert counts(second) == {"AAPL": 3}
+    # Exhausted with 3 < 5, so the third is served from cache
+    assert counts(third) == {"AAPL": 3}
+    assert len(fake.queries) == 2
+
+
+def test_ticker_crowded_out_by_max_pages_is_searched_again(monkeypatch, fake_server):
+    # $TSLA only shows up on the third page, past max_pages=2
+    fake = FakeTwitter(["$AAPL calls"] * 4 + ["$TSLA puts"], page_size=2)
+    first, second = searches(monkeypatch, fake_server, fake, [(["AAPL", "TSLA"], 2)] * 2, max_pages=2)
+
+    assert counts(first) == {"AAPL": 2, "TSLA": 0}
+    assert counts(second) == {"AAPL": 2, "TSLA": 0}
+    assert fake.queries == ["($AAPL OR $TSLA) lang:en -is:retweet", "($AAPL OR $TSLA) lang:en -is:retweet",
+                            "$TSLA lang:en -is:retweet", "$TSLA lang:en -is:retweet"]
+
+
+def test_exhausted_search_answers_bigger_requests_from_cache(monkeypatch, fake_server):
+    fake = FakeTwitter(["$AAPL and $TSLA both ripping"] + ["$AAPL calls"] * 2)
+    first, second = searches(monkeypatch, fake_server, fake, [(["AAPL", "TSLA"], 5), (["TSLA", "AAPL"], 10)])
+
+    assert counts(first) == counts(second) == {"AAPL": 3, "TSLA": 1}
+    assert len(fake.queries) == 1
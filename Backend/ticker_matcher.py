@@ -0,0 +1,273 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+logger = logging.getLogger(__name__)
+
+# Cached Polygon reference tickers, refreshed when older than KNOWN_TICKERS_MAX_AGE_DAYS
+KNOWN_TICKERS_PATH = os.getenv(
+    "KNOWN_TICKERS_PATH", os.path.join(os.path.dirname(__file__), "data", "known_tickers.json"))
+KNOWN_TICKERS_MAX_AGE_DAYS = float(os.getenv("KNOWN_TICKERS_MAX_AGE_DAYS", "7"))
+# Polygon markets whose symbols count as real cashtags ($SPX and $BTC as well as stocks)
+KNOWN_TICKER_MARKETS = [m.strip() for m in os.getenv("KNOWN_TICKER_MARKETS", "stocks,indices,crypto").split(",")
+                        if m.strip()]
+
+STOCK_KEYWORDS = (
+    'stock', 'shares', 'buy', 'sell', 'long', 'short', 'position',
+    'entry', 'exit', 'target', 'stop loss', 'portfolio', 'market',
+    'earnings', 'dividend', 'bullish', 'bearish', 'rally', 'crash',
+    'trading', 'invest', 'hold', 'dump', 'pump', 'moon', 'rocket',
+    'support', 'resistance', 'breakout', 'breakdown', 'volume',
+    'catalyst', 'news', 'fda', 'approval', 'merger', 'acquisition',
+)
+
+# Inflections that should still count as the keyword ("investing", "sells", "mooning")
+_KEYWORD_SUFFIXES = r'(?:s|es|ed|ing|er|ers|ment|ments)?'
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Regex alternation factored by shared prefixes ("b(?:u(?:llish|y)|...)").
+
+    Python's re tries every branch of a flat alternation at each position;
+    a trie-shaped pattern dispatches on the first character instead, which
+    gives Aho-Corasick-like scanning without a C extension.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(ch).replace(r'\ ', r'\s+') + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+# Matched against lowercased content, which is cheaper than re.IGNORECASE
+KEYWORD_RE = re.compile(r'\b(?:' + _trie_pattern(STOCK_KEYWORDS) + r')' + _KEYWORD_SUFFIXES + r'\b')
+
+# $AAPL, $brk (case-insensitive, 1-5 letters, not part of a longer word)
+TICKER_RE = re.compile(r'\$([A-Za-z]{1,5})\b')
+
+
+def _load_polygon():
+    sys.path.append(os.path.join(os.path.dirname(__file__), 'API Calls'))
+    import Polygon
+    return Polygon
+
+
+def cashtag_symbol(ticker: str) -> Optional[str]:
+    """Polygon ticker -> the symbol written after the $: 'AAPL', 'I:SPX' -> 'SPX', 'X:BTCUSD' -> 'BTC'"""
+    market, _, symbol = ticker.upper().rpartition(":")
+    if market == "X":
+        # Crypto pairs; people write the coin, and USD pairs cover every coin worth naming
+        return symbol[:-3] if symbol.endswith("USD") and len(symbol) > 3 else None
+    return symbol or None
+
+
+def refresh_known_tickers(path: str = KNOWN_TICKERS_PATH, markets: Iterable[str] = KNOWN_TICKER_MARKETS) -> Set[str]:
+    """
+    Download active tickers from Polygon and cache them as JSON.
+
+    Pages through every market (sleeping on 429s), so call it from a worker
+    thread or the --refresh CLI, never from the matching path.
+    """
+    polygon = _load_polygon()
+    symbols = set()
+    for market in markets:
+        try:
+            tickers = polygon.get_all_tickers(market=market)
+        except Exception as e:
+            if market == "stocks":
+                raise
+            # Some plans don't include indices; stocks alone are still worth caching
+            logger.warning(f"Could not load {market} tickers from Polygon: {e}")
+            continue
+        symbols.update(filter(None, (cashtag_symbol(t["ticker"]) for t in tickers if t.get("ticker"))))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"updated_at": time.time(), "tickers": sorted(symbols)}, f)
+    logger.info(f"Cached {len(symbols)} known tickers at {path}")
+    return symbols
+
+
+def load_known_tickers(path: str = KNOWN_TICKERS_PATH) -> Tuple[Optional[Set[str]], bool]:
+    """
+    (symbols, stale) from the local cache; never touches the network.
+
+    Symbols are None when there's no cache yet; callers then accept every
+    $TICKER, as before.
+    """
+    if not os.path.exists(path):
+        return None, True
+    with open(path) as f:
+        cached = json.load(f)
+    age_days = (time.time() - cached.get("updated_at", 0)) / 86400
+    return set(cached["tickers"]), age_days > KNOWN_TICKERS_MAX_AGE_DAYS
+
+
+class TickerMatcher:
+    """
+    Precompiled stock-message matcher.
+
+    One regex pass finds $TICKER mentions and one prefix-factored keyword
+    pattern with word boundaries checks the keywords, so "belong" no longer counts as
+    "long". Tickers are validated against the Polygon reference symbols to
+    drop things like "$LOL" or "$HELP". match() runs on the ingest event
+    loop, so the symbols come from the local cache only; a missing or stale
+    cache is rebuilt from Polygon in a background thread and swapped in
+    when it's ready.
+    """
+
+    def __init__(self, known_tickers: Optional[Iterable[str]] = None, validate: bool = True,
+                 path: str = KNOWN_TICKERS_PATH, refresh_stale: bool = True):
+        self.validate = validate
+        self.path = path
+        self.refresh_stale = refresh_stale
+        self._known: Optional[Set[str]] = set(known_tickers) if known_tickers is not None else None
+        self._loaded = known_tickers is not None
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    @property
+    def known_tickers(self) -> Optional[Set[str]]:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._known, stale = load_known_tickers(self.path)
+                    self._loaded = True
+                    if stale and self.refresh_stale and os.getenv("POLYGON_API_KEY"):
+                        self.refresh()
+                    elif self._known is None:
+                        logger.warning("No known ticker list available, accepting every $TICKER")
+        return self._known
+
+    def refresh(self) -> threading.Thread:
+        """Rebuild the symbol cache from Polygon in a worker thread; returns the running thread"""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return self._refresh_thread
+
+        def run():
+            try:
+                known = refresh_known_tickers(self.path)
+            except Exception as e:
+                logger.warning(f"Could not refresh known tickers from Polygon: {e}")
+                return
+            self._known = known
+            self._loaded = True
+
+        self._refresh_thread = threading.Thread(target=run, name="known-tickers-refresh", daemon=True)
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def find_tickers(self, content: str) -> List[str]:
+        """Unique $TICKER mentions in order of appearance, uppercased"""
+        if '$' not in content:
+            return []
+        known = self.known_tickers if self.validate else None
+        tickers = []
+        for symbol in TICKER_RE.findall(content):
+            symbol = symbol.upper()
+            if known is not None and symbol not in known:
+                continue
+            ticker = f"${symbol}"
+            if ticker not in tickers:
+                tickers.append(ticker)
+        return tickers
+
+    def has_keywords(self, content: str) -> bool:
+        return KEYWORD_RE.search(content.lower()) is not None
+
+    def match(self, content: str) -> Tuple[bool, List[str]]:
+        """(is_stock_related, tickers) for a message"""
+        if not content or not content.strip():
+            return False, []
+        tickers = self.find_tickers(content)
+        return bool(tickers) or self.has_keywords(content), tickers
+
+    def match_message(self, msg: Dict[str, Any]) -> Tuple[bool, List[str]]:
+        """
+        match() for a message dict, plus the tickers its source already
+        attributed it to (social posts found by searching for a ticker often
+        name it without the $).
+        """
+        is_stock, tickers = self.match(msg.get('content') or '')
+        attributed = [t for t in msg.get('tickers') or [] if t not in tickers]
+        return is_stock or bool(attributed), tickers + attributed
+
+
+# Global matcher instance
+ticker_matcher = TickerMatcher()
+
+
+def _legacy_match(content):
+    """The previous per-call regex + substring scan, kept for the benchmark"""
+    if not content or content.strip() == "":
+        return False, []
+    tickers = re.findall(r'\$[A-Z]{1,5}', content.upper())
+    has_keywords = any(keyword in content.lower() for keyword in STOCK_KEYWORDS)
+    return len(tickers) > 0 or has_keywords, tickers
+
+
+def _benchmark(count: int):
+    words = ("the", "i", "think", "today", "lol", "gonna", "see", "what", "happens", "guys",
+             "calls", "puts", "belong", "holiday", "newsletter", "green", "red", "weekend")
+    symbols = ("$AAPL", "$TSLA", "$NVDA", "$SPY", "$AMD", "$lol", "$HELP")
+    corpus = []
+    for _ in range(count):
+        tokens = random.choices(words, k=random.randint(4, 30))
+        if random.random() < 0.3:
+            tokens.insert(random.randrange(len(tokens)), random.choice(symbols))
+        if random.random() < 0.3:
+            tokens.insert(random.randrange(len(tokens)), random.choice(STOCK_KEYWORDS))
+        corpus.append(" ".join(tokens))
+
+    matcher = TickerMatcher(known_tickers=["AAPL", "TSLA", "NVDA", "SPY", "AMD"])
+
+    start = time.perf_counter()
+    legacy = [_legacy_match(text) for text in corpus]
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [matcher.match(text) for text in corpus]
+    compiled_seconds = time.perf_counter() - start
+
+    legacy_hits = sum(1 for is_stock, _ in legacy if is_stock)
+    compiled_hits = sum(1 for is_stock, _ in compiled if is_stock)
+    print(f"📊 {count:,} messages")
+    print(f"  🐢 Per-call regex + substring scan: {legacy_seconds:.2f}s ({legacy_hits:,} stock-related)")
+    print(f"  ⚡ Compiled matcher:               {compiled_seconds:.2f}s ({compiled_hits:,} stock-related), "
+          f"{legacy_seconds / compiled_seconds:.1f}x faster")
+    print(f"  🧹 {legacy_hits - compiled_hits:,} false positives removed (substring hits, unknown tickers)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ticker matcher benchmark / symbol cache refresh")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--refresh", action="store_true", help="Refresh the known ticker cache from Polygon")
+    args = parser.parse_args()
+    if args.refresh:
+        ticker_matcher.refresh().join()
+        print(f"✅ Cached {len(ticker_matcher.known_tickers or ())} tickers at {KNOWN_TICKERS_PATH}")
+    else:
+        _benchmark(args.messages)
@@ -0,0 +1,278 @@
+import os
+import time
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import pytz
+from dotenv import load_dotenv
+from pymongo import UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from mongo import get_db
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+ROLLUPS_COLLECTION = "ticker_rollups"
+
+# Pseudo-ticker counting every stored message once, for totals and the
+# overall sentiment breakdown (a message mentioning 3 tickers is 3 ticker
+# mentions but 1 message)
+ALL_TICKERS = "*"
+
+# Batches each bucket remembers having counted, so a retried batch isn't added twice
+ROLLUP_BATCH_HISTORY = int(os.getenv("ROLLUP_BATCH_HISTORY", "50"))
+# Failed batches kept in memory for retry; beyond this the oldest are dropped (run backfill)
+ROLLUP_MAX_PENDING = int(os.getenv("ROLLUP_MAX_PENDING", "1000"))
+
+
+def hour_bucket(ts: Optional[datetime]) -> datetime:
+    """Start of the UTC hour containing `ts` (naive datetimes are taken as UTC, as pymongo returns them)"""
+    if ts is None:
+        ts = datetime.now(pytz.utc)
+    elif ts.tzinfo is None:
+        ts = pytz.utc.localize(ts)
+    return ts.astimezone(pytz.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_id(ticker: str, hour: datetime) -> str:
+    return f"{ticker}|{hour:%Y-%m-%dT%H}"
+
+
+def _sentiment_key(sentiment: Any) -> str:
+    # Free-form LLM output ends up as a field name: no dots or leading $
+    key = str(sentiment or "neutral").strip().lower().replace(".", "_").lstrip("$")
+    return key or "neutral"
+
+
+def _new_bucket() -> Dict[str, Any]:
+    return {"mentions": 0, "sentiment": defaultdict(int), "confidence_sum": 0.0, "confidence_count": 0}
+
+
+def _accumulate(buckets: Dict[tuple, Dict[str, Any]], doc: Dict[str, Any]):
+    """Add one stock_messages document to the (ticker, hour) buckets it counts towards"""
+    hour = hour_bucket(doc.get("timestamp"))
+    sentiment = _sentiment_key(doc.get("sentiment"))
+    confidence = doc.get("confidence_score") or 0
+    for ticker in [ALL_TICKERS] + list(dict.fromkeys(doc.get("tickers_mentioned") or [])):
+        bucket = buckets.setdefault((ticker, hour), _new_bucket())
+        bucket["mentions"] += 1
+        bucket["sentiment"][sentiment] += 1
+        if confidence > 0:
+            bucket["confidence_sum"] += confidence
+            bucket["confidence_count"] += 1
+
+
+def batch_id(docs: List[Dict[str, Any]]) -> str:
+    """Stable id for a set of messages, whatever order they come in"""
+    ids = sorted(str(doc.get("discord_id")) for doc in docs)
+    return hashlib.sha1("|".join(ids).encode("utf-8")).hexdigest()[:16]
+
+
+def _summarize(row: Dict[str, Any]) -> Dict[str, Any]:
+    count = row.get("confidence_count", 0)
+    return {
+        "ticker": row["_id"],
+        "mentions": row["mentions"],
+        "sentiment": row.get("sentiment", {}),
+        "avg_confidence": round(row.get("confidence_sum", 0) / count, 2) if count else None,
+    }
+
+
+class TickerRollups:
+    """
+    Per-ticker, per-hour counters maintained as messages are ingested.
+
+    Each bucket document holds the mention count, a count per sentiment
+    label and the confidence sum/count for one ticker and one UTC hour of
+    message time. Ingest adds to them with $inc upserts (record(), hooked
+    to the message writer's after_flush so only newly inserted messages
+    count), and any window is answered by summing at most one document per
+    ticker per hour instead of unwinding every message in it. Windows are
+    hour-aligned: `start` is rounded down to its hour.
+
+    Messages that are re-analyzed later keep the sentiment they were first
+    counted with; backfill() recomputes everything from stock_messages.
+    Each bucket keeps the ids of the last few batches added to it and only
+    matches batches it hasn't seen, so a batch whose write failed is kept
+    and re-applied on the next record() without counting any bucket twice.
+    A `tracker` (heavy_hitters.HeavyHitterTracker) is fed the same
+    documents, for top-K over fixed windows without touching MongoDB.
+    """
+
+    def __init__(self, db, tracker=None):
+        self.db = db
+        self.collection = db[ROLLUPS_COLLECTION]
+        self.tracker = tracker
+        self._pending: List[List[Dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        self.collection.create_index([("ticker", 1), ("hour", 1)])
+        self.collection.create_index([("hour", 1), ("ticker", 1)])
+
+    def _bucket_doc(self, ticker: str, hour: datetime, bucket: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "_id": bucket_id(ticker, hour),
+            "ticker": ticker,
+            "hour": hour,
+            "mentions": bucket["mentions"],
+            "sentiment": dict(bucket["sentiment"]),
+            "confidence_sum": bucket["confidence_sum"],
+            "confidence_count": bucket["confidence_count"],
+        }
+
+    def record(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """
+        Count newly stored stock_messages documents; one $inc upsert per touched bucket.
+
+        Batches that failed earlier are retried first. If this one fails
+        too it is kept for the next call and the error is raised.
+        """
+        docs = list(docs)
+        if self.tracker is not None:
+            self.tracker.record(docs)
+        with self._lock:
+            pending, self._pending = self._pending + [docs], []
+            written = 0
+            for i, batch in enumerate(pending):
+                try:
+                    written += self._apply(batch)
+                except PyMongoError:
+                    self._pending = pending[i:][-ROLLUP_MAX_PENDING:]
+                    if len(pending) - i > ROLLUP_MAX_PENDING:
+                        print(f"⚠️  Dropped {len(pending) - i - ROLLUP_MAX_PENDING} rollup batches, "
+                              f"run ticker_rollups.py to rebuild the counts")
+                    raise
+            return written
+
+    def pending_batches(self) -> int:
+        """Batches waiting to be retried"""
+        return len(self._pending)
+
+    def _apply(self, docs: List[Dict[str, Any]]) -> int:
+        buckets: Dict[tuple, Dict[str, Any]] = {}
+        for doc in docs:
+            _accumulate(buckets, doc)
+        if not buckets:
+            return 0
+        batch = batch_id(docs)
+        ops = []
+        for (ticker, hour), bucket in buckets.items():
+            inc = {"mentions": bucket["mentions"],
+                   "confidence_sum": bucket["confidence_sum"],
+                   "confidence_count": bucket["confidence_count"]}
+            inc.update({f"sentiment.{label}": n for label, n in bucket["sentiment"].items()})
+            ops.append(UpdateOne(
+                {"_id": bucket_id(ticker, hour), "batches": {"$ne": batch}},
+                {"$inc": inc, "$setOnInsert": {"ticker": ticker, "hour": hour},
+                 "$push": {"batches": {"$each": [batch], "$slice": -ROLLUP_BATCH_HISTORY}}},
+                upsert=True,
+            ))
+        try:
+            self.collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # A duplicate key means the bucket exists and already counted this batch
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        return len(ops)
+
+    def backfill(self, batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Rebuild every bucket from stock_messages.
+
+        Buckets are computed in one streaming pass over the few fields they
+        need and written with ReplaceOne, so re-running it gives the same
+        counts instead of adding to them; buckets that no longer have any
+        message are removed afterwards. Stop ingestion while it runs, or
+        messages inserted mid-pass may be counted twice.
+        """
+        buckets: Dict[tuple, Dict[str, Any]] = {}
+        messages = 0
+        cursor = self.db["stock_messages"].find(
+            {}, {"_id": 0, "tickers_mentioned": 1, "timestamp": 1, "sentiment": 1, "confidence_score": 1},
+        ).batch_size(batch_size)
+        for doc in cursor:
+            _accumulate(buckets, doc)
+            messages += 1
+
+        ops = [ReplaceOne({"_id": bucket_id(ticker, hour)}, self._bucket_doc(ticker, hour, bucket), upsert=True)
+               for (ticker, hour), bucket in buckets.items()]
+        for i in range(0, len(ops), batch_size):
+            self.collection.bulk_write(ops[i:i + batch_size], ordered=False)
+
+        current = {bucket_id(ticker, hour) for ticker, hour in buckets}
+        stale = [doc["_id"] for doc in self.collection.find({}, {"_id": 1}) if doc["_id"] not in current]
+        for i in range(0, len(stale), batch_size):
+            self.collection.delete_many({"_id": {"$in": stale[i:i + batch_size]}})
+        return {"messages": messages, "buckets": len(ops), "removed": len(stale)}
+
+    def window(self, start: datetime, end: Optional[datetime] = None,
+               tickers: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Per-ticker totals over [start, end), most mentioned first; ALL_TICKERS is excluded unless asked for"""
+        match: Dict[str, Any] = {"hour": {"$gte": hour_bucket(start)}}
+        if end is not None:
+            match["hour"]["$lt"] = end
+        match["ticker"] = {"$in": tickers} if tickers else {"$ne": ALL_TICKERS}
+
+        rows = list(self.collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$ticker", "mentions": {"$sum": "$mentions"},
+                        "confidence_sum": {"$sum": "$confidence_sum"},
+                        "confidence_count": {"$sum": "$confidence_count"}}},
+            {"$sort": {"mentions": -1, "_id": 1}},
+        ] + ([{"$limit": limit}] if limit else [])))
+        if not rows:
+            return []
+
+        # Sentiment labels are open-ended, so they are summed in a second pass
+        # restricted to the tickers being returned
+        match["ticker"] = {"$in": [row["_id"] for row in rows]}
+        sentiment: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for row in self.collection.aggregate([
+            {"$match": match},
+            {"$project": {"ticker": 1, "labels": {"$objectToArray": "$sentiment"}}},
+            {"$unwind": "$labels"},
+            {"$group": {"_id": {"ticker": "$ticker", "label": "$labels.k"}, "count": {"$sum": "$labels.v"}}},
+        ]):
+            sentiment[row["_id"]["ticker"]][row["_id"]["label"]] = row["count"]
+        return [_summarize({**row, "sentiment": sentiment.get(row["_id"], {})}) for row in rows]
+
+    def top_tickers(self, days_back: float = 7, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.window(datetime.now(pytz.utc) - timedelta(days=days_back), limit=limit)
+
+    def totals(self, start: datetime, end: Optional[datetime] = None) -> Dict[str, Any]:
+        """Message count and sentiment breakdown over all stored messages in the window"""
+        rows = self.window(start, end, tickers=[ALL_TICKERS])
+        if not rows:
+            return {"ticker": ALL_TICKERS, "mentions": 0, "sentiment": {}, "avg_confidence": None}
+        return rows[0]
+
+    def hourly(self, ticker: str, start: datetime, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """One row per non-empty hour for a ticker, oldest first"""
+        query: Dict[str, Any] = {"ticker": ticker, "hour": {"$gte": hour_bucket(start)}}
+        if end is not None:
+            query["hour"]["$lt"] = end
+        return [{"hour": row["hour"], **{k: v for k, v in _summarize({**row, "_id": ticker}).items() if k != "ticker"}}
+                for row in self.collection.find(query).sort("hour", 1)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild hourly ticker rollups from stock_messages")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    MONGO_URI = os.getenv("MONGO_URI")
+    if not MONGO_URI:
+        print("❌ MONGO_URI not found in .env")
+        exit(1)
+    rollups = TickerRollups(get_db())
+    rollups.ensure_indexes()
+    started = time.perf_counter()
+    totals = rollups.backfill(batch_size=args.batch_size)
+    print(f"✅ Rolled up {totals['messages']} messages into {totals['buckets']} hourly buckets "
+          f"in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,392 @@
+import os
+import re
+import time
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import pytz
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+
+from mongo import MONGO_DB_NAME, client_options, get_db
+from ticker_rollups import ALL_TICKERS, TickerRollups, _summarize
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Time-series storage needs MongoDB 5.0+, so it is opt-in
+TIMESERIES_ENABLED = os.getenv("TIMESERIES_ENABLED", "false").lower() in ("1", "true", "yes")
+
+MESSAGE_METRICS_COLLECTION = "message_metrics"
+CANDLES_COLLECTION = "candles"
+CANDLE_SYNC_COLLECTION = "candle_sync"
+
+# Buckets older than this are dropped by the server
+MESSAGE_METRICS_TTL_DAYS = float(os.getenv("MESSAGE_METRICS_TTL_DAYS", "180"))
+CANDLES_TTL_DAYS = float(os.getenv("CANDLES_TTL_DAYS", str(5 * 365 + 7)))  # the 5Y chart
+
+# name -> (timeseries options, TTL days, secondary index)
+TIMESERIES_COLLECTIONS = {
+    MESSAGE_METRICS_COLLECTION: ({"timeField": "timestamp", "metaField": "ticker", "granularity": "minutes"},
+                                 MESSAGE_METRICS_TTL_DAYS, [("ticker", 1), ("timestamp", -1)]),
+    # A series is one ticker at one bar size ("5minute", "1day"...)
+    CANDLES_COLLECTION: ({"timeField": "timestamp", "metaField": "meta", "granularity": "hours"},
+                         CANDLES_TTL_DAYS, [("meta.ticker", 1), ("meta.bar", 1), ("timestamp", -1)]),
+}
+
+
+def _collection_type(db, name: str) -> Optional[str]:
+    for info in db.list_collections(filter={"name": name}):
+        return info.get("type", "collection")
+    return None
+
+
+def ensure_timeseries_collections(db) -> Dict[str, str]:
+    """
+    Create the time-series collections (or update their TTL); returns name -> status.
+
+    The server groups points of the same meta value into compressed
+    buckets by time, so a window query for one ticker reads a few buckets
+    instead of one document per message. A regular collection left under
+    one of these names is reported and not touched.
+    """
+    statuses = {}
+    for name, (options, ttl_days, index) in TIMESERIES_COLLECTIONS.items():
+        ttl = int(ttl_days * 86400)
+        kind = _collection_type(db, name)
+        try:
+            if kind is None:
+                db.create_collection(name, timeseries=options, expireAfterSeconds=ttl)
+                statuses[name] = "created"
+            elif kind == "timeseries":
+                db.command("collMod", name, expireAfterSeconds=ttl)
+                statuses[name] = "exists"
+            else:
+                statuses[name] = "regular collection (drop or rename it to migrate)"
+                continue
+        except (CollectionInvalid, OperationFailure) as e:
+            # Servers before 5.0 don't know the timeseries option
+            statuses[name] = f"unsupported: {e}"
+            continue
+        db[name].create_index(index)
+    return statuses
+
+
+def metric_points(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One message_metrics point per ticker a stock_messages document mentions"""
+    timestamp = doc.get("timestamp") or datetime.now(pytz.utc)
+    return [{
+        "timestamp": timestamp,
+        "ticker": ticker,
+        "sentiment": doc.get("sentiment", "neutral"),
+        "confidence": doc.get("confidence_score", 0),
+        "channel_id": doc.get("channel_id"),
+        "author": doc.get("author_username"),
+        "discord_id": doc.get("discord_id"),
+    } for ticker in dict.fromkeys(doc.get("tickers_mentioned") or [])]
+
+
+def _insert_points(collection, points: List[Dict[str, Any]]) -> int:
+    if not points:
+        return 0
+    try:
+        return len(collection.insert_many(points, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        return e.details.get("nInserted", 0)
+
+
+class MessageMetricsStore:
+    """
+    Per-ticker message points in the message_metrics time-series collection.
+
+    Time-series collections have no unique indexes or upserts, so points
+    must be written exactly once: record() is meant for the message
+    writer's after_flush, which only passes newly inserted messages.
+    window() and totals() answer in the same shape as TickerRollups, but
+    over exact timestamps instead of whole hours.
+    """
+
+    def __init__(self, db):
+        self.collection = db[MESSAGE_METRICS_COLLECTION]
+
+    def record(self, docs: Iterable[Dict[str, Any]]) -> int:
+        return _insert_points(self.collection, [p for doc in docs for p in metric_points(doc)])
+
+    @staticmethod
+    def _match(start: datetime, end: Optional[datetime]) -> Dict[str, Any]:
+        match: Dict[str, Any] = {"timestamp": {"$gte": start}}
+        if end is not None:
+            match["timestamp"]["$lt"] = end
+        return match
+
+    def window(self, start: datetime, end: Optional[datetime] = None,
+               tickers: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Per-ticker mentions, sentiment counts and average confidence over [start, end), most mentioned first"""
+        match = self._match(start, end)
+        if tickers:
+            match["ticker"] = {"$in": tickers}
+        rows = list(self.collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$ticker", "mentions": {"$sum": 1},
+                        "confidence_sum": {"$sum": {"$cond": [{"$gt": ["$confidence", 0]}, "$confidence", 0]}},
+                        "confidence_count": {"$sum": {"$cond": [{"$gt": ["$confidence", 0]}, 1, 0]}}}},
+            {"$sort": {"mentions": -1, "_id": 1}},
+        ] + ([{"$limit": limit}] if limit else [])))
+        if not rows:
+            return []
+
+        match["ticker"] = {"$in": [row["_id"] for row in rows]}
+        sentiment: Dict[str, Dict[str, int]] = {}
+        for row in self.collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": {"ticker": "$ticker", "label": "$sentiment"}, "count": {"$sum": 1}}},
+        ]):
+            sentiment.setdefault(row["_id"]["ticker"], {})[row["_id"]["label"]] = row["count"]
+        return [_summarize({**row, "sentiment": sentiment.get(row["_id"], {})}) for row in rows]
+
+    def top_tickers(self, days_back: float = 7, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.window(datetime.now(pytz.utc) - timedelta(days=days_back), limit=limit)
+
+    def totals(self, start: datetime, end: Optional[datetime] = None) -> Dict[str, Any]:
+        """Message count and sentiment breakdown over [start, end), counting each message once"""
+        sentiment: Dict[str, int] = {}
+        messages = confidence_sum = confidence_count = 0
+        for row in self.collection.aggregate([
+            {"$match": self._match(start, end)},
+            # A message has one point per ticker it mentions
+            {"$group": {"_id": "$discord_id", "sentiment": {"$first": "$sentiment"},
+                        "confidence": {"$first": "$confidence"}}},
+            {"$group": {"_id": "$sentiment", "count": {"$sum": 1},
+                        "confidence_sum": {"$sum": {"$cond": [{"$gt": ["$confidence", 0]}, "$confidence", 0]}},
+                        "confidence_count": {"$sum": {"$cond": [{"$gt": ["$confidence", 0]}, 1, 0]}}}},
+        ]):
+            sentiment[row["_id"]] = row["count"]
+            messages += row["count"]
+            confidence_sum += row["confidence_sum"]
+            confidence_count += row["confidence_count"]
+        return _summarize({"_id": ALL_TICKERS, "mentions": messages, "sentiment": sentiment,
+                           "confidence_sum": confidence_sum, "confidence_count": confidence_count})
+
+
+def message_metrics_hook(db) -> Optional[Callable[[List[Dict[str, Any]]], Any]]:
+    """after_flush callback writing message_metrics, or None when time-series storage is off"""
+    return MessageMetricsStore(db).record if TIMESERIES_ENABLED else None
+
+
+def window_store(db):
+    """Where per-ticker windows are read from: message_metrics when time-series storage is on, else the rollups"""
+    return MessageMetricsStore(db) if TIMESERIES_ENABLED else TickerRollups(db)
+
+
+BAR_RE = re.compile(r"(\d+)(second|minute|hour|day|week|month|quarter|year)$")
+# Longest span of each Polygon timespan, to tell whether a bar had closed when it was fetched
+TIMESPAN_MAX = {"second": timedelta(seconds=1), "minute": timedelta(minutes=1), "hour": timedelta(hours=1),
+                "day": timedelta(days=1), "week": timedelta(weeks=1), "month": timedelta(days=31),
+                "quarter": timedelta(days=92), "year": timedelta(days=366)}
+
+
+def bar_length(bar: str) -> timedelta:
+    """Longest time one bar ("5minute", "1week"...) can cover"""
+    match = BAR_RE.match(bar)
+    if not match:
+        raise ValueError(f"Unknown bar size: {bar}")
+    return int(match.group(1)) * TIMESPAN_MAX[match.group(2)]
+
+
+def _day(date: str) -> datetime:
+    return datetime.strptime(date, "%Y-%m-%d")
+
+
+def merge_ranges(ranges: List[List[str]], start: str, end: str) -> List[List[str]]:
+    """Add [start, end] to sorted date ranges, merging only ranges that overlap or touch"""
+    merged: List[List[str]] = []
+    for first, last in sorted([list(r) for r in ranges] + [[start, end]]):
+        if merged and _day(first) <= _day(merged[-1][1]) + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+
+class CandleStore:
+    """
+    Polygon OHLCV bars kept in the candles time-series collection.
+
+    candle_sync keeps, per series, the list of date ranges that were
+    fetched; covered() tells the API whether one of them holds the whole
+    request, so a gap between two fetches is never served from MongoDB.
+    store() skips bars whose exact timestamp is already stored, so
+    fetching an overlapping range again doesn't duplicate points. A bar
+    still open when it was fetched (the current week of a
+    1week series) is neither stored nor counted as covered, so it is
+    fetched again until it has closed.
+    """
+
+    def __init__(self, db):
+        self.collection = db[CANDLES_COLLECTION]
+        self.sync = db[CANDLE_SYNC_COLLECTION]
+
+    @staticmethod
+    def _series(ticker: str, bar: str) -> str:
+        return f"{ticker.upper()}|{bar}"
+
+    def covered(self, ticker: str, bar: str, start: str, end: str) -> bool:
+        """True if [start, end] (YYYY-MM-DD) lies within one fetched range and hasn't expired"""
+        state = self.sync.find_one({"_id": self._series(ticker, bar)})
+        if not state:
+            return False
+        oldest_kept = (datetime.now(pytz.utc) - timedelta(days=CANDLES_TTL_DAYS)).strftime("%Y-%m-%d")
+        return start >= oldest_kept and any(first <= start and last >= end
+                                            for first, last in state.get("ranges", []))
+
+    def store(self, ticker: str, bar: str, results: List[Dict[str, Any]], start: str, end: str) -> int:
+        """Insert Polygon aggregate results (t/o/h/l/c/v) not stored yet and record the fetched range"""
+        meta = {"ticker": ticker.upper(), "bar": bar}
+        fetched_at = datetime.now(pytz.utc)
+        length = bar_length(bar)
+
+        closed, open_from = [], None
+        for item in results:
+            timestamp = datetime.fromtimestamp(item["t"] / 1000, pytz.utc)
+            if timestamp + length > fetched_at:
+                open_from = timestamp if open_from is None else min(open_from, timestamp)
+            else:
+                # Naive UTC, as stored and as distinct() returns them
+                closed.append((timestamp.replace(tzinfo=None), item))
+
+        existing = set()
+        if closed:
+            existing = set(self.collection.distinct("timestamp", {
+                "meta.ticker": meta["ticker"], "meta.bar": bar,
+                "timestamp": {"$gte": min(t for t, _ in closed), "$lte": max(t for t, _ in closed)},
+            }))
+        points = [{"timestamp": timestamp, "meta": meta, "open": item["o"], "high": item["h"],
+                   "low": item["l"], "close": item["c"], "volume": item.get("v", 0)}
+                  for timestamp, item in closed if timestamp not in existing]
+        inserted = _insert_points(self.collection, points)
+
+        # Coverage stops the day before the first bar that was still open
+        if open_from is not None:
+            end = min(end, (open_from - timedelta(days=1)).strftime("%Y-%m-%d"))
+        if end >= start:
+            state = self.sync.find_one({"_id": self._series(ticker, bar)}) or {}
+            self.sync.update_one(
+                {"_id": self._series(ticker, bar)},
+                {"$set": {"ranges": merge_ranges(state.get("ranges", []), start, end),
+                          "updated_at": datetime.now(pytz.utc)},
+                 "$unset": {"synced_from": "", "synced_through": ""}},
+                upsert=True,
+            )
+        return inserted
+
+    def window(self, ticker: str, bar: str, start: str, end: str) -> List[Dict[str, Any]]:
+        """Stored bars between two dates, oldest first, in Polygon's result shape"""
+        since = datetime.strptime(start, "%Y-%m-%d")
+        until = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)
+        cursor = self.collection.find(
+            {"meta.ticker": ticker.upper(), "meta.bar": bar, "timestamp": {"$gte": since, "$lt": until}},
+            {"_id": 0, "timestamp": 1, "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1},
+        ).sort("timestamp", 1)
+        return [{"t": int(pytz.utc.localize(doc["timestamp"]).timestamp() * 1000), "o": doc["open"],
+                 "h": doc["high"], "l": doc["low"], "c": doc["close"], "v": doc.get("volume", 0)}
+                for doc in cursor]
+
+
+def migrate_messages(db, batch_size: int = 1000, drop: bool = False) -> Dict[str, Any]:
+    """
+    Fill message_metrics from existing stock_messages.
+
+    Points can't be upserted, so this refuses to run into a non-empty
+    collection unless `drop` recreates it first. Start the ingestor with
+    TIMESERIES_ENABLED after the migration so new messages aren't missed
+    or counted twice.
+    """
+    if drop:
+        db.drop_collection(MESSAGE_METRICS_COLLECTION)
+    statuses = ensure_timeseries_collections(db)
+    if statuses[MESSAGE_METRICS_COLLECTION] not in ("created", "exists"):
+        return {"status": statuses[MESSAGE_METRICS_COLLECTION], "messages": 0, "points": 0}
+    metrics = db[MESSAGE_METRICS_COLLECTION]
+    if metrics.find_one({}, {"_id": 1}) is not None:
+        return {"status": "not empty (use --drop to rebuild)", "messages": 0, "points": 0}
+
+    cursor = db["stock_messages"].find(
+        {"tickers_mentioned.0": {"$exists": True}},
+        {"_id": 0, "timestamp": 1, "tickers_mentioned": 1, "sentiment": 1, "confidence_score": 1,
+         "channel_id": 1, "author_username": 1, "discord_id": 1},
+    ).sort("timestamp", 1).batch_size(batch_size)
+    totals = {"status": "migrated", "messages": 0, "points": 0}
+    points: List[Dict[str, Any]] = []
+    for doc in cursor:
+        points.extend(metric_points(doc))
+        totals["messages"] += 1
+        if len(points) >= batch_size:
+            totals["points"] += _insert_points(metrics, points)
+            points = []
+    totals["points"] += _insert_points(metrics, points)
+    return totals
+
+
+def _storage_mb(db, name: str) -> float:
+    try:
+        stats = db.command("collStats", name)
+        return stats.get("storageSize", 0) / 1e6
+    except OperationFailure:
+        return 0.0
+
+
+def _benchmark(db, tickers: int, repeats: int = 5):
+    """Per-ticker window queries on stock_messages (the current layout) vs message_metrics, on the same data"""
+    if db[MESSAGE_METRICS_COLLECTION].find_one({}, {"_id": 1}) is None:
+        print("⚠️  message_metrics is empty, run `migrate` first")
+        return
+    now = datetime.now(pytz.utc)
+    names = [row["ticker"] for row in MessageMetricsStore(db).window(now - timedelta(days=30), limit=tickers)]
+    for name in ("stock_messages", MESSAGE_METRICS_COLLECTION):
+        print(f"  {name}: {db[name].estimated_document_count():,} documents, {_storage_mb(db, name):.1f}MB on disk")
+
+    # The same question on both layouts: mentions per sentiment label for one ticker
+    layouts = {
+        "stock_messages": ("tickers_mentioned", "sentiment"),
+        MESSAGE_METRICS_COLLECTION: ("ticker", "sentiment"),
+    }
+    for label, days in (("24h", 1), ("7d", 7), ("30d", 30)):
+        since = now - timedelta(days=days)
+        timings = {}
+        for name, (ticker_field, sentiment_field) in layouts.items():
+            started = time.perf_counter()
+            for _ in range(repeats):
+                for ticker in names:
+                    list(db[name].aggregate([
+                        {"$match": {ticker_field: ticker, "timestamp": {"$gte": since}}},
+                        {"$group": {"_id": f"${sentiment_field}", "mentions": {"$sum": 1}}},
+                    ]))
+            timings[name] = (time.perf_counter() - started) / (repeats * max(len(names), 1)) * 1000
+        print(f"  {label} window per ticker: stock_messages {timings['stock_messages']:.2f}ms, "
+              f"time-series {timings[MESSAGE_METRICS_COLLECTION]:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-series storage for message metrics and candles")
+    parser.add_argument("command", choices=["setup", "migrate", "benchmark"])
+    parser.add_argument("--drop", action="store_true", help="migrate: rebuild message_metrics from scratch")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--uri", help="benchmark: server to use instead of MONGO_URI")
+    parser.add_argument("--tickers", type=int, default=20, help="benchmark: most mentioned tickers to query")
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        db = MongoClient(args.uri, **client_options(uri=args.uri))[MONGO_DB_NAME] if args.uri else get_db()
+        print(f"📊 Window queries for the {args.tickers} most mentioned tickers")
+        _benchmark(db, args.tickers)
+    elif args.command == "setup":
+        for name, status in ensure_timeseries_collections(get_db()).items():
+            print(f"  {name}: {status}")
+    else:
+        started = time.perf_counter()
+        totals = migrate_messages(get_db(), batch_size=args.batch_size, drop=args.drop)
+        print(f"{'✅' if totals['status'] == 'migrated' else '⚠️ '} message_metrics {totals['status']}: "
+              f"{totals['messages']} messages -> {totals['points']} points "
+              f"in {time.perf_counter() - started:.1f}s")
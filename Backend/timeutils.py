@@ -0,0 +1,123 @@
+import os
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, List, Optional
+
+import pytz
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Timestamps are kept in UTC everywhere; this zone is only used for display
+DISPLAY_TIMEZONE = os.getenv("DISPLAY_TIMEZONE", "America/New_York")
+
+UTC = timezone.utc
+# Looked up once; pytz.timezone() re-resolves the zone on every call
+DISPLAY_TZ = pytz.timezone(DISPLAY_TIMEZONE)
+
+_fromisoformat = datetime.fromisoformat
+
+
+def now_utc() -> datetime:
+    return datetime.now(UTC)
+
+
+def to_utc(dt: datetime) -> datetime:
+    """Aware UTC datetime; naive values are taken to be UTC already (as pymongo returns them)"""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=UTC)
+    if dt.tzinfo is UTC:
+        return dt
+    return dt.astimezone(UTC)
+
+
+def to_display(dt: Optional[datetime]) -> Optional[datetime]:
+    """Convert a stored (UTC) timestamp to the display timezone; the only place zones are applied"""
+    if dt is None:
+        return None
+    return to_utc(dt).astimezone(DISPLAY_TZ)
+
+
+def parse_timestamp(value: Any, default: Optional[datetime] = None) -> datetime:
+    """
+    One timestamp as an aware UTC datetime.
+
+    Accepts ISO strings (with 'Z' or an offset), Unix seconds and
+    datetimes. Anything unparseable becomes `default`, or now.
+    """
+    try:
+        if isinstance(value, str):
+            if value.endswith('Z'):
+                # fromisoformat only accepts 'Z' from Python 3.11
+                value = value[:-1] + '+00:00'
+            return to_utc(_fromisoformat(value))
+        if isinstance(value, datetime):
+            return to_utc(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(float(value), UTC)
+    except (ValueError, TypeError, OverflowError, OSError):
+        pass
+    return default if default is not None else now_utc()
+
+
+def parse_timestamps(values: Iterable[Any], default: Optional[datetime] = None) -> List[datetime]:
+    """
+    A whole batch of timestamps as aware UTC datetimes, in order.
+
+    Batches from Discord are uniform ISO strings with a +00:00 offset, so
+    they are parsed with one map() over fromisoformat and come back already
+    in UTC. Only if that fails (mixed types, 'Z' on older Pythons, bad
+    values) is the batch parsed value by value.
+    """
+    values = values if isinstance(values, list) else list(values)
+    try:
+        parsed = list(map(_fromisoformat, values))
+    except (TypeError, ValueError):
+        return [parse_timestamp(value, default) for value in values]
+    if all(dt.tzinfo is UTC for dt in parsed):
+        return parsed
+    return [to_utc(dt) for dt in parsed]
+
+
+def _legacy_parse(timestamp_str: str) -> datetime:
+    """The previous per-message parse, zone lookup and conversion, kept for the benchmark"""
+    try:
+        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+    except ValueError:
+        dt = datetime.utcnow()
+    return dt.astimezone(pytz.timezone('America/New_York'))
+
+
+def _benchmark(count: int):
+    start_time = datetime(2024, 1, 1, tzinfo=UTC)
+    values = [(start_time + timedelta(seconds=random.randint(0, 365 * 86400),
+                                      microseconds=random.randint(0, 999999))).isoformat()
+              for _ in range(count)]
+
+    start = time.perf_counter()
+    legacy = [_legacy_parse(value) for value in values]
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = parse_timestamps(values)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [parse_timestamp(value) for value in values]
+    single_seconds = time.perf_counter() - start
+
+    assert parsed == legacy == single
+    print(f"🕒 {count:,} ISO timestamps")
+    print(f"  🐢 Per message + zone lookup: {legacy_seconds:.2f}s")
+    print(f"  🔁 parse_timestamp loop:      {single_seconds:.2f}s ({legacy_seconds / single_seconds:.1f}x faster)")
+    print(f"  ⚡ parse_timestamps batch:    {batch_seconds:.2f}s ({legacy_seconds / batch_seconds:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark timestamp parsing")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+    _benchmark(args.count)
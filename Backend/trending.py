@@ -0,0 +1,342 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import pytz
+from dotenv import load_dotenv
+
+from mongo import get_db
+from ticker_matcher import KEYWORD_RE, STOCK_KEYWORDS
+from ticker_rollups import hour_bucket
+from heavy_hitters import heavy_hitters
+from timeseries_store import window_store
+from timeutils import to_display
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+logger = logging.getLogger(__name__)
+
+TRENDING_REFRESH_SECONDS = float(os.getenv("TRENDING_REFRESH_SECONDS", "300"))
+TRENDING_WINDOW_HOURS = float(os.getenv("TRENDING_WINDOW_HOURS", "24"))
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "25"))
+# Per-symbol sentiment covers a longer window than the trending lists
+SENTIMENT_WINDOW_DAYS = float(os.getenv("SENTIMENT_WINDOW_DAYS", "7"))
+# Topics come from scanning the newest messages of the window, capped here
+TRENDING_TOPIC_SCAN_LIMIT = int(os.getenv("TRENDING_TOPIC_SCAN_LIMIT", "5000"))
+RECENT_POSTS_PER_SYMBOL = 5
+# Symbols outside the top-K kept between refreshes, least recently requested dropped first
+TRENDING_EXTRA_SYMBOLS = int(os.getenv("TRENDING_EXTRA_SYMBOLS", "500"))
+
+# Sentiment labels produced by the analysis prompt (and the older classifier)
+POSITIVE_LABELS = {"bullish", "positive"}
+NEGATIVE_LABELS = {"bearish", "negative"}
+
+# Longest keyword first so "stop loss" wins over a shorter prefix match
+_KEYWORDS_BY_LENGTH = sorted(STOCK_KEYWORDS, key=len, reverse=True)
+
+
+def label_score(label: Optional[str]) -> float:
+    label = (label or "").lower()
+    if label in POSITIVE_LABELS:
+        return 1.0
+    if label in NEGATIVE_LABELS:
+        return -1.0
+    return 0.0
+
+
+def sentiment_score(counts: Dict[str, int]) -> Dict[str, Any]:
+    """
+    SentimentScore from per-label counts.
+
+    score is (positive - negative) / total in [-1, 1], magnitude the share
+    of messages that took a side at all.
+    """
+    total = sum(counts.values())
+    positive = sum(n for label, n in counts.items() if label in POSITIVE_LABELS)
+    negative = sum(n for label, n in counts.items() if label in NEGATIVE_LABELS)
+    score = (positive - negative) / total if total else 0.0
+    return {
+        "score": round(score, 3),
+        "magnitude": round((positive + negative) / total, 3) if total else 0.0,
+        "label": "positive" if score > 0.2 else "negative" if score < -0.2 else "neutral",
+    }
+
+
+def keyword_topic(matched: str) -> str:
+    """Map an inflected keyword match ("buying", "stop  losses") back to its keyword"""
+    text = " ".join(matched.split())
+    for keyword in _KEYWORDS_BY_LENGTH:
+        if text.startswith(keyword):
+            return keyword
+    return text
+
+
+def _symbol(ticker: str) -> str:
+    return ticker.lstrip("$")
+
+
+def _post(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """SocialMediaPost for a stock_messages document"""
+    guild_id = doc.get("guild_id")
+    score = label_score(doc.get("sentiment"))
+    return {
+        "id": str(doc.get("discord_id")),
+        "platform": doc.get("source", "discord"),
+        "content": doc.get("content", ""),
+        "created_at": to_display(doc.get("timestamp") or doc.get("created_at")),
+        "sentiment": {
+            "score": score,
+            "magnitude": round((doc.get("confidence_score") or 0) / 10, 2),
+            "label": "positive" if score > 0 else "negative" if score < 0 else "neutral",
+        },
+        "url": doc.get("url") or (f"https://discord.com/channels/{guild_id}/{doc.get('channel_id')}/{doc.get('discord_id')}"
+                                  if guild_id else None),
+        "author": doc.get("author_username"),
+    }
+
+
+class TrendingCache:
+    """
+    Trending stocks/topics and per-symbol sentiment, precomputed in memory.
+
+    refresh() reads the hourly ticker rollups, or message_metrics when
+    TIMESERIES_ENABLED (top-K tickers for the trending window and their
+    sentiment for the longer sentiment window), counts the top-K's
+    sentiment per source in one aggregation and scans the newest messages
+    once for topics, then swaps the whole snapshot in with a single
+    assignment. Request handlers only read the current snapshot, so they
+    never touch MongoDB and cost the same however large the collections
+    get. Symbols outside the top-K are computed on
+    first request and kept until the next refresh, in an LRU of at most
+    `max_extra_symbols` entries.
+    """
+
+    def __init__(self, get_db: Callable[[], Any], refresh_seconds: float = TRENDING_REFRESH_SECONDS,
+                 window_hours: float = TRENDING_WINDOW_HOURS, top_k: int = TRENDING_TOP_K,
+                 max_extra_symbols: int = TRENDING_EXTRA_SYMBOLS):
+        self.get_db = get_db
+        self.refresh_seconds = refresh_seconds
+        self.window_hours = window_hours
+        self.top_k = top_k
+        self.max_extra_symbols = max_extra_symbols
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._extra_symbols: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Extra symbols are computed in worker threads
+        self._extra_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh_seconds = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def trending_stocks(self) -> Dict[str, Any]:
+        snapshot = self._snapshot or {}
+        return {"trending_stocks": snapshot.get("stocks", []), "last_updated": snapshot.get("updated_at")}
+
+    def trending_topics(self) -> Dict[str, Any]:
+        snapshot = self._snapshot or {}
+        return {"trending_topics": snapshot.get("topics", []), "last_updated": snapshot.get("updated_at")}
+
+    def cached_sentiment(self, symbol: str) -> Optional[Dict[str, Any]]:
+        symbol = symbol.upper()
+        snapshot = self._snapshot or {}
+        cached = snapshot.get("sentiment", {}).get(symbol)
+        if cached is not None:
+            return cached
+        with self._extra_lock:
+            cached = self._extra_symbols.get(symbol)
+            if cached is not None:
+                self._extra_symbols.move_to_end(symbol)
+        return cached
+
+    def symbol_sentiment(self, symbol: str) -> Dict[str, Any]:
+        """Cached sentiment for a symbol, computing (blocking) and caching it if it isn't precomputed"""
+        cached = self.cached_sentiment(symbol)
+        if cached is not None:
+            return cached
+        db = self.get_db()
+        since = datetime.now(pytz.utc) - timedelta(days=SENTIMENT_WINDOW_DAYS)
+        ticker = f"${symbol.upper()}"
+        rows = window_store(db).window(since, tickers=[ticker])
+        topics = self._ticker_topics(db, ticker, since)
+        by_source = self._source_sentiment(db, [ticker], since)
+        payload = self._sentiment_payload(db, ticker, rows[0] if rows else None, topics,
+                                          by_source.get(ticker, {}), datetime.now(pytz.utc))
+        with self._extra_lock:
+            self._extra_symbols[symbol.upper()] = payload
+            while len(self._extra_symbols) > self.max_extra_symbols:
+                self._extra_symbols.popitem(last=False)
+        return payload
+
+    def refresh(self) -> Dict[str, Any]:
+        """Recompute every list and swap the new snapshot in (blocking; run it in a thread)"""
+        started = time.perf_counter()
+        db = self.get_db()
+        rollups = window_store(db)
+        now = datetime.now(pytz.utc)
+        since = now - timedelta(hours=self.window_hours)
+
+        # Mentions over the window and the one before it (both hour-aligned), for the change
+        current = rollups.window(since, limit=self.top_k)
+        previous = {row["ticker"]: row["mentions"]
+                    for row in rollups.window(since - timedelta(hours=self.window_hours), end=hour_bucket(since),
+                                              tickers=[row["ticker"] for row in current])} if current else {}
+        stocks = []
+        for row in current:
+            before = previous.get(row["ticker"], 0)
+            sentiment = sentiment_score(row["sentiment"])
+            stocks.append({
+                "symbol": _symbol(row["ticker"]),
+                "name": _symbol(row["ticker"]),
+                "sentiment_score": sentiment["score"],
+                "sentiment_label": sentiment["label"],
+                "mention_count": row["mentions"],
+                "mention_change_pct": round(100.0 * (row["mentions"] - before) / before, 1) if before else None,
+                "avg_confidence": row["avg_confidence"],
+            })
+
+        topics, ticker_topics = self._scan_topics(db, since)
+
+        # Per-symbol sentiment over the longer window for the top-K tickers
+        tickers = [row["ticker"] for row in current]
+        sentiment_since = now - timedelta(days=SENTIMENT_WINDOW_DAYS)
+        sentiment_rows = {row["ticker"]: row for row in rollups.window(sentiment_since, tickers=tickers)} \
+            if tickers else {}
+        by_source = self._source_sentiment(db, tickers, sentiment_since) if tickers else {}
+        sentiment = {
+            _symbol(ticker): self._sentiment_payload(db, ticker, sentiment_rows.get(ticker),
+                                                     [t for t, _ in ticker_topics[ticker].most_common(5)],
+                                                     by_source.get(ticker, {}), now)
+            for ticker in tickers
+        }
+
+        # The ingestor owns the heavy-hitters counters; read its latest snapshot without taking over
+        heavy_hitters.load(db)
+
+        snapshot = {"stocks": stocks, "topics": topics, "sentiment": sentiment, "updated_at": now.isoformat()}
+        self._snapshot = snapshot
+        with self._extra_lock:
+            self._extra_symbols = OrderedDict()
+        self.refreshes += 1
+        self.last_refresh_seconds = round(time.perf_counter() - started, 3)
+        return snapshot
+
+    def _scan_topics(self, db, since: datetime):
+        """Keyword topics over the newest messages of the window, plus the topics seen with each ticker"""
+        counts: Counter = Counter()
+        scores: Dict[str, float] = defaultdict(float)
+        related: Dict[str, Counter] = defaultdict(Counter)
+        ticker_topics: Dict[str, Counter] = defaultdict(Counter)
+        cursor = db['stock_messages'].find(
+            {"timestamp": {"$gte": since}},
+            {"_id": 0, "content": 1, "tickers_mentioned": 1, "sentiment": 1},
+        ).sort("timestamp", -1).limit(TRENDING_TOPIC_SCAN_LIMIT)
+        for doc in cursor:
+            found = {keyword_topic(m) for m in KEYWORD_RE.findall((doc.get("content") or "").lower())}
+            score = label_score(doc.get("sentiment"))
+            tickers = doc.get("tickers_mentioned") or []
+            for topic in found:
+                counts[topic] += 1
+                scores[topic] += score
+                related[topic].update(tickers)
+                for ticker in tickers:
+                    ticker_topics[ticker][topic] += 1
+
+        topics = [{
+            "topic": topic,
+            "sentiment_score": round(scores[topic] / count, 3),
+            "mention_count": count,
+            "related_stocks": [_symbol(t) for t, _ in related[topic].most_common(3)],
+        } for topic, count in counts.most_common(self.top_k)]
+        return topics, ticker_topics
+
+    def _ticker_topics(self, db, ticker: str, since: datetime) -> List[str]:
+        counts: Counter = Counter()
+        cursor = db['stock_messages'].find(
+            {"tickers_mentioned": ticker, "timestamp": {"$gte": since}}, {"_id": 0, "content": 1},
+        ).sort("timestamp", -1).limit(500)
+        for doc in cursor:
+            counts.update({keyword_topic(m) for m in KEYWORD_RE.findall((doc.get("content") or "").lower())})
+        return [topic for topic, _ in counts.most_common(5)]
+
+    def _source_sentiment(self, db, tickers: List[str], since: datetime) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """ticker -> source -> SentimentScore over the window; the rollups aren't split by source"""
+        counts: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(lambda: defaultdict(dict))
+        for row in db['stock_messages'].aggregate([
+            {"$match": {"tickers_mentioned": {"$in": tickers}, "timestamp": {"$gte": since}}},
+            {"$unwind": "$tickers_mentioned"},
+            {"$match": {"tickers_mentioned": {"$in": tickers}}},
+            {"$group": {"_id": {"ticker": "$tickers_mentioned", "source": {"$ifNull": ["$source", "discord"]},
+                                "label": "$sentiment"}, "count": {"$sum": 1}}},
+        ]):
+            key = row["_id"]
+            counts[key["ticker"]][key["source"]][key.get("label")] = row["count"]
+        return {ticker: {source: sentiment_score(labels) for source, labels in sources.items()}
+                for ticker, sources in counts.items()}
+
+    def _sentiment_payload(self, db, ticker: str, row: Optional[Dict[str, Any]], topics: List[str],
+                           by_source: Dict[str, Dict[str, Any]], now: datetime) -> Dict[str, Any]:
+        overall = sentiment_score(row["sentiment"] if row else {})
+        posts = db['stock_messages'].find(
+            {"tickers_mentioned": ticker},
+            {"discord_id": 1, "content": 1, "timestamp": 1, "created_at": 1, "sentiment": 1,
+             "confidence_score": 1, "author_username": 1, "guild_id": 1, "channel_id": 1, "source": 1, "url": 1},
+        ).sort("timestamp", -1).limit(RECENT_POSTS_PER_SYMBOL)
+        posts = [_post(doc) for doc in posts]
+        return {
+            "symbol": _symbol(ticker),
+            "overall_sentiment": overall,
+            "social_sentiment": by_source,
+            "trending_topics": topics,
+            "recent_posts": posts,
+            "mention_count": row["mentions"] if row else 0,
+            "last_updated": now,
+        }
+
+    async def run(self):
+        """Refresh now and then every refresh_seconds until cancelled"""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+                logger.info(f"Trending cache refreshed in {self.last_refresh_seconds}s")
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.error(f"Trending cache refresh failed: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "last_updated": (self._snapshot or {}).get("updated_at"),
+            "extra_symbols_cached": len(self._extra_symbols),
+        }
+
+
+# Global cache, started with the API (main.py startup event)
+trending_cache = TrendingCache(get_db)
@@ -0,0 +1,285 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+TWITTER_BEARER_TOKEN = os.getenv("TWITTER_BEARER_TOKEN")
+SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+TWITTER_API = "https://api.twitter.com/2"
+
+# Recent search accepts 512 characters per query (4096 on Pro access)
+X_MAX_QUERY_LENGTH = int(os.getenv("X_MAX_QUERY_LENGTH", "512"))
+# How long a ticker's tweets are served from memory before searching again
+X_CACHE_TTL_SECONDS = float(os.getenv("X_CACHE_TTL_SECONDS", "60"))
+# Pages of 100 followed per combined query while some ticker still needs tweets
+X_MAX_PAGES = int(os.getenv("X_MAX_PAGES", "3"))
+
+QUERY_FILTERS = "lang:en -is:retweet"
+CASHTAG_RE = re.compile(r"\$([A-Za-z]{1,6})\b")
+
+
+def symbol(ticker: str) -> str:
+    return ticker.strip().lstrip("$").upper()
+
+
+def batch_queries(tickers: List[str], max_length: int = X_MAX_QUERY_LENGTH,
+                  filters: str = QUERY_FILTERS) -> List[Tuple[List[str], str]]:
+    """
+    (tickers, query) pairs covering every ticker with as few queries as fit
+    `max_length`, e.g. "($AAPL OR $TSLA) lang:en -is:retweet".
+    """
+    def query(group: List[str]) -> str:
+        terms = " OR ".join(f"${s}" for s in group)
+        return f"({terms}) {filters}" if len(group) > 1 else f"{terms} {filters}"
+
+    batches: List[Tuple[List[str], str]] = []
+    group: List[str] = []
+    for s in dict.fromkeys(symbol(t) for t in tickers if t.strip()):
+        if group and len(query(group + [s])) > max_length:
+            batches.append((group, query(group)))
+            group = []
+        group.append(s)
+    if group:
+        batches.append((group, query(group)))
+    return batches
+
+
+def demultiplex(tweets: List[Dict[str, Any]], tickers: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Split a combined result by the requested cashtags each tweet contains (a tweet can go to several)"""
+    wanted = {symbol(t) for t in tickers}
+    by_ticker: Dict[str, List[Dict[str, Any]]] = {s: [] for s in wanted}
+    for tweet in tweets:
+        for s in dict.fromkeys(m.upper() for m in CASHTAG_RE.findall(tweet.get("text", ""))):
+            if s in wanted:
+                by_ticker[s].append(tweet)
+    return by_ticker
+
+
+class TTLCache:
+    """Per-key values that expire `ttl` seconds after they were stored"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items: Dict[str, Tuple[float, Any]] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            del self._items[key]
+            return None
+        return item[1]
+
+    def set(self, key: str, value: Any):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        if len(self._items) > 10000:
+            now = time.monotonic()
+            self._items = {k: v for k, v in self._items.items() if v[0] > now}
+
+
+class XSearch:
+    """
+    Recent tweets for many tickers at once.
+
+    Tickers are OR'd into as few recent-search queries as fit the query
+    length limit, the combined results are split back per ticker by
+    cashtag, and each ticker's tweets are cached for `ttl` seconds (unless
+    its search failed), so a sweep covers a few dozen tickers per request
+    and repeats within the TTL cost none. Authors come from a dict built once per response page.
+    Tickers still empty afterwards are looked up with one combined SerpAPI
+    search, when a key is configured.
+    """
+
+    def __init__(self, bearer_token: Optional[str] = TWITTER_BEARER_TOKEN, ttl: float = X_CACHE_TTL_SECONDS,
+                 max_query_length: int = X_MAX_QUERY_LENGTH, max_pages: int = X_MAX_PAGES,
+                 serpapi_key: Optional[str] = SERPAPI_KEY):
+        self.bearer_token = bearer_token
+        self.max_query_length = max_query_length
+        self.max_pages = max_pages
+        self.serpapi_key = serpapi_key
+        self.cache = TTLCache(ttl)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.stats = {"requests": 0, "cache_hits": 0, "cache_misses": 0, "tweets": 0, "serpapi": 0,
+                      "rate_limited": 0}
+
+    async def start(self):
+        if not self.bearer_token:
+            raise RuntimeError("TWITTER_BEARER_TOKEN not found in .env")
+        self.session = aiohttp.ClientSession(headers={"Authorization": f"Bearer {self.bearer_token}"})
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def _page(self, query: str, next_token: Optional[str]) -> Optional[Dict[str, Any]]:
+        params = {
+            "query": query,
+            "max_results": 100,
+            "tweet.fields": "created_at,public_metrics,author_id",
+            "expansions": "author_id",
+            "user.fields": "username,name,verified",
+        }
+        if next_token:
+            params["next_token"] = next_token
+        self.stats["requests"] += 1
+        async with self.session.get(f"{TWITTER_API}/tweets/search/recent", params=params) as resp:
+            if resp.status == 429:
+                self.stats["rate_limited"] += 1
+                reset = resp.headers.get("x-rate-limit-reset")
+                wait = max(0, int(reset) - int(time.time())) if reset else 0
+                print(f"⏳ X search rate limited, window resets in {wait}s")
+                return None
+            if resp.status != 200:
+                print(f"Failed to search tweets: {resp.status} {await resp.text()}")
+                return None
+            return await resp.json()
+
+    async def _search_batch(self, group: List[str], query: str,
+                            per_ticker: int) -> Tuple[Dict[str, List[Dict[str, Any]]], bool, bool]:
+        """
+        Tweets per ticker of the group, whether the search ran out of pages
+        (so every recent tweet was seen) and whether a page request failed.
+        """
+        by_ticker: Dict[str, List[Dict[str, Any]]] = {s: [] for s in group}
+        next_token = None
+        exhausted = failed = False
+        for _ in range(self.max_pages):
+            body = await self._page(query, next_token)
+            if body is None:
+                failed = True
+                break
+            users = {user["id"]: user for user in body.get("includes", {}).get("users", [])}
+            tweets = []
+            for tweet in body.get("data", []):
+                user = users.get(tweet.get("author_id"), {})
+                username = user.get("username", "unknown")
+                metrics = tweet.get("public_metrics", {})
+                tweets.append({
+                    "id": tweet["id"],
+                    "text": tweet["text"],
+                    "created_at": tweet.get("created_at"),
+                    "author_id": tweet.get("author_id"),
+                    "username": username,
+                    "name": user.get("name", "Unknown User"),
+                    "verified": user.get("verified", False),
+                    "url": f"https://twitter.com/{username}/status/{tweet['id']}",
+                    "metrics": {"likes": metrics.get("like_count", 0), "reposts": metrics.get("retweet_count", 0),
+                                "replies": metrics.get("reply_count", 0)},
+                    "source": "twitter",
+                })
+            self.stats["tweets"] += len(tweets)
+            for s, matched in demultiplex(tweets, group).items():
+                by_ticker[s].extend(matched)
+            next_token = body.get("meta", {}).get("next_token")
+            if not next_token:
+                exhausted = True
+                break
+            # Rarely mentioned tickers in a batch may need more pages than busy ones
+            if all(len(found) >= per_ticker for found in by_ticker.values()):
+                break
+        return {s: found[:per_ticker] for s, found in by_ticker.items()}, exhausted, failed
+
+    def _serpapi(self, group: List[str], per_ticker: int) -> Dict[str, List[Dict[str, Any]]]:
+        try:
+            from serpapi import GoogleSearch
+        except ImportError:
+            return {}
+        self.stats["serpapi"] += 1
+        query = " OR ".join(f'"${s}"' for s in group)
+        try:
+            results = GoogleSearch({"q": f"({query}) site:twitter.com", "engine": "google",
+                                    "api_key": self.serpapi_key, "num": min(100, per_ticker * len(group))}).get_dict()
+        except Exception as e:
+            print(f"Error with SerpAPI: {e}")
+            return {}
+        tweets = [{
+            "id": f"serpapi-{hashlib.sha1(result.get('link', '').encode('utf-8')).hexdigest()[:16]}",
+            "text": result.get("snippet", ""),
+            "created_at": None,
+            "author_id": None,
+            "username": result.get("source", "Unknown").replace("› ", ""),
+            "name": result.get("source", "Unknown").replace("› ", ""),
+            "verified": False,
+            "url": result.get("link", ""),
+            "metrics": {},
+            "source": "twitter_via_serpapi",
+        } for result in results.get("organic_results", [])]
+        return {s: found[:per_ticker] for s, found in demultiplex(tweets, group).items()}
+
+    async def search(self, tickers: List[str], per_ticker: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """Up to `per_ticker` recent tweets per ticker symbol, served from cache where fresh"""
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        missing = []
+        for s in dict.fromkeys(symbol(t) for t in tickers if t.strip()):
+            cached = self.cache.get(s)
+            # A short cached list still answers a bigger request if it held every recent tweet
+            if cached is not None and (len(cached[0]) >= per_ticker or cached[1]):
+                self.stats["cache_hits"] += 1
+                results[s] = cached[0][:per_ticker]
+            else:
+                self.stats["cache_misses"] += 1
+                missing.append(s)
+
+        batches = batch_queries(missing, self.max_query_length)
+        fetched: Dict[str, List[Dict[str, Any]]] = {}
+        # Tickers whose answer can be cached -> whether the search saw every recent tweet
+        exhausted: Dict[str, bool] = {}
+        for found, ran_out, failed in await asyncio.gather(*(self._search_batch(group, query, per_ticker)
+                                                             for group, query in batches)):
+            fetched.update(found)
+            for s, tweets in found.items():
+                # A failed page leaves short lists unknown; full ones are still good
+                if not failed or len(tweets) >= per_ticker:
+                    exhausted[s] = ran_out
+        empty = [s for s in missing if not fetched.get(s)]
+        if empty and self.serpapi_key:
+            fetched.update(await asyncio.to_thread(self._serpapi, empty, per_ticker))
+
+        for s in missing:
+            found = fetched.get(s, [])
+            results[s] = found
+            if s in exhausted:
+                # Fewer than asked for is all there is only if the search ran out of pages,
+                # not when busier tickers in the batch used up max_pages
+                self.cache.set(s, (found, exhausted[s] and len(found) < per_ticker))
+        return results
+
+
+async def _main(tickers: List[str], per_ticker: int):
+    search = XSearch()
+    await search.start()
+    try:
+        started = time.perf_counter()
+        results = await search.search(tickers, per_ticker)
+        first = time.perf_counter() - started
+        started = time.perf_counter()
+        await search.search(tickers, per_ticker)
+        cached = time.perf_counter() - started
+    finally:
+        await search.close()
+    for s, tweets in results.items():
+        print(f"🐦 ${s}: {len(tweets)} tweets")
+        for tweet in tweets[:3]:
+            print(f"   @{tweet['username']}: {tweet['text'][:90]!r}")
+    stats = search.stats
+    print(f"\n📊 {len(results)} tickers in {stats['requests']} requests ({first:.2f}s), "
+          f"repeat served from cache in {cached * 1000:.1f}ms; SerpAPI fallbacks: {stats['serpapi']}, "
+          f"429s: {stats['rate_limited']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recent tweets for several tickers with batched queries")
+    parser.add_argument("--tickers", nargs="+", default=["AAPL", "TSLA", "NVDA"])
+    parser.add_argument("--per-ticker", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(_main(args.tickers, args.per_ticker))